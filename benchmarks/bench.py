@@ -0,0 +1,366 @@
+"""End-to-end throughput and latency benchmarks on a pty loopback.
+
+Every scenario builds a mapping whose device is a pty
+(:class:`~serialtcp.replay.VirtualDevice`) and drives both ends from this
+process: the pty master plays the device, plain sockets play the TCP clients.
+Each scenario runs against two targets:
+
+    cli      ``serial-tcp-server`` (``tcp_server.start_service``) in a subprocess
+    service  :class:`~serialtcp.service.PortService` in this process
+
+and measures
+
+    rx_<n>_clients_mbps  device -> n TCP clients, MB/s leaving the device
+    tx_mbps              one TCP client -> device
+    latency_p50_ms       serial read -> TCP client, small probes one at a time
+    latency_p99_ms
+
+The RX data is 80-column text lines, like a busy console. Every scenario runs
+``--rounds`` times and the median is reported. Results are written as JSON;
+with ``--baseline`` they are compared against a stored run and the exit status
+is 1 if a metric regressed by more than its threshold::
+
+    python benchmarks/bench.py --output result.json --baseline benchmarks/baseline.json
+    python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+
+Baselines are only comparable on the same machine; record one per CI runner.
+Needs ``os.openpty`` (Linux, macOS).
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import selectors
+import statistics
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from serialtcp import __version__
+from serialtcp.replay import VirtualDevice
+from serialtcp.service import PortConfig, PortService
+
+TARGETS = ('cli', 'service')
+CLIENT_COUNTS = (1, 10, 100)
+DEFAULT_SIZE = 2 * 1024 * 1024
+DEFAULT_PROBES = 500
+DEFAULT_ROUNDS = 3
+DEFAULT_THRESHOLD = 0.25
+SCENARIO_TIMEOUT = 120.0
+
+_LINE = b''.join(b'%c' % (33 + i % 94) for i in range(79)) + b'\n'
+
+
+def _free_tcp_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _payload(size):
+    return (_LINE * (size // len(_LINE) + 1))[:size]
+
+
+# ------------------------------------------------------------------ targets
+class _CliTarget:
+    """serial-tcp-server in a subprocess."""
+
+    def __init__(self, device, engine):
+        self.port = _free_tcp_port()
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'serialtcp', '-d', device, '-p', str(self.port),
+             '--engine', engine],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir),
+            stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or self.proc.poll() is not None:
+                    self.close()
+                    raise RuntimeError('serial-tcp-server did not start')
+                time.sleep(0.05)
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class _ServiceTarget:
+    """PortService in this process."""
+
+    def __init__(self, device, engine):
+        self.port = _free_tcp_port()
+        self.service = PortService(PortConfig(device=device, tcp_port=self.port, engine=engine))
+        self.service.start()
+
+    def close(self):
+        self.service.stop()
+
+
+_TARGET_CLASSES = {'cli': _CliTarget, 'service': _ServiceTarget}
+
+
+# ------------------------------------------------------------------ helpers
+class _Clients:
+    """n TCP clients read through one selector; counts bytes per client."""
+
+    def __init__(self, port, count):
+        self.socks = [socket.create_connection(('127.0.0.1', port), timeout=5) for _ in range(count)]
+        self.received = [0] * count
+        self._sel = selectors.DefaultSelector()
+        for i, sock in enumerate(self.socks):
+            sock.setblocking(False)
+            self._sel.register(sock, selectors.EVENT_READ, i)
+        self._buf = bytearray(256 * 1024)
+
+    def read(self, timeout):
+        """Read whatever is ready within ``timeout``."""
+        for key, _ in self._sel.select(timeout):
+            try:
+                self.received[key.data] += key.fileobj.recv_into(self._buf)
+            except BlockingIOError:
+                pass
+
+    def read_until(self, target, timeout):
+        deadline = time.perf_counter() + timeout
+        while min(self.received) < target:
+            if time.perf_counter() > deadline:
+                return False
+            self.read(0.5)
+        return True
+
+    def reset(self):
+        self.received = [0] * len(self.received)
+
+    def close(self):
+        self._sel.close()
+        for sock in self.socks:
+            sock.close()
+
+
+def _sync(device, clients, timeout=10.0):
+    """Wait until the mapping has the device open and reaches every client.
+
+    Opening a serial port flushes its input, so probes are repeated until one
+    gets through; the leftovers are drained before the measurement.
+    """
+    deadline = time.perf_counter() + timeout
+    while min(clients.received) == 0:
+        if time.perf_counter() > deadline:
+            raise RuntimeError('no data reached the clients')
+        device.write(b'\n')
+        clients.read(0.05)
+    end = time.perf_counter() + 0.3
+    while time.perf_counter() < end:
+        clients.read(0.05)
+    clients.reset()
+
+
+def _mbps(size, elapsed):
+    return round(size / elapsed / 1e6, 3)
+
+
+# ---------------------------------------------------------------- scenarios
+def bench_rx(device, port, clients_count, size):
+    clients = _Clients(port, clients_count)
+    try:
+        _sync(device, clients)
+        data = _payload(size)
+        writer = threading.Thread(
+            target=lambda: [device.write(data[i:i + 4096]) for i in range(0, size, 4096)],
+            daemon=True)
+        start = time.perf_counter()
+        writer.start()
+        if not clients.read_until(size, SCENARIO_TIMEOUT):
+            raise RuntimeError('clients received {} of {} bytes'.format(min(clients.received), size))
+        return _mbps(size, time.perf_counter() - start)
+    finally:
+        clients.close()
+
+
+def bench_tx(device, port, size):
+    clients = _Clients(port, 1)
+    try:
+        _sync(device, clients)
+        sock = clients.socks[0]
+        sock.setblocking(True)
+        data = _payload(size)
+        base = device.tx_bytes
+        start = time.perf_counter()
+        sock.sendall(data)
+        deadline = start + SCENARIO_TIMEOUT
+        while device.tx_bytes - base < size:
+            if time.perf_counter() > deadline:
+                raise RuntimeError('device received {} of {} bytes'.format(device.tx_bytes - base, size))
+            time.sleep(0.001)
+        return _mbps(size, time.perf_counter() - start)
+    finally:
+        clients.close()
+
+
+def bench_latency(device, port, probes):
+    clients = _Clients(port, 1)
+    try:
+        _sync(device, clients)
+        sock = clients.socks[0]
+        sock.setblocking(True)
+        sock.settimeout(5)
+        samples = []
+        for i in range(probes):
+            probe = b'%07d\n' % i
+            got = 0
+            start = time.perf_counter()
+            device.write(probe)
+            while got < len(probe):
+                got += len(sock.recv(64))
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.001)
+        samples.sort()
+        return (round(samples[len(samples) // 2] * 1000, 4),
+                round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4))
+    finally:
+        clients.close()
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def run(targets=TARGETS, client_counts=CLIENT_COUNTS, size=DEFAULT_SIZE,
+        probes=DEFAULT_PROBES, engine='threads', rounds=DEFAULT_ROUNDS):
+    """Run every scenario; returns ``{metric: value}`` (None if it failed)."""
+    results = {}
+    for name in targets:
+        with VirtualDevice() as device:
+            target = _TARGET_CLASSES[name](device.device, engine)
+            try:
+                scenarios = [('rx_{}_clients_mbps'.format(n), lambda n=n: bench_rx(device, target.port, n, size))
+                             for n in client_counts]
+                scenarios.append(('tx_mbps', lambda: bench_tx(device, target.port, size)))
+                scenarios.append(('latency', lambda: bench_latency(device, target.port, probes)))
+                for metric, scenario in scenarios:
+                    values = []
+                    for _ in range(rounds):
+                        try:
+                            values.append(scenario())
+                        except Exception as e:
+                            print('{}.{}: failed: {}'.format(name, metric, e), file=sys.stderr)
+                        time.sleep(0.2)
+                    if metric == 'latency':
+                        results[name + '.latency_p50_ms'] = _median([v[0] for v in values])
+                        results[name + '.latency_p99_ms'] = _median([v[1] for v in values])
+                    else:
+                        results['{}.{}'.format(name, metric)] = _median(values)
+            finally:
+                target.close()
+    return results
+
+
+# ---------------------------------------------------------------- baseline
+def higher_is_better(metric):
+    return metric.endswith('_mbps')
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return a message for every metric worse than the baseline by more
+    than its threshold (``baseline['thresholds'][metric]`` or ``threshold``).
+    """
+    thresholds = baseline.get('thresholds', {})
+    regressions = []
+    for metric, base in sorted(baseline.get('results', {}).items()):
+        value = results.get(metric)
+        if base is None or metric not in results:
+            continue
+        limit = thresholds.get(metric, threshold)
+        if value is None:
+            regressions.append('{}: failed (baseline {})'.format(metric, base))
+        elif higher_is_better(metric) and value < base * (1 - limit):
+            regressions.append('{}: {} < {} - {:.0%}'.format(metric, value, base, limit))
+        elif not higher_is_better(metric) and value > base * (1 + limit):
+            regressions.append('{}: {} > {} + {:.0%}'.format(metric, value, base, limit))
+    return regressions
+
+
+def main(argv=None):
+    aparse = argparse.ArgumentParser(description='serial-tcp pty loopback benchmarks')
+    aparse.add_argument('--target', choices=TARGETS, action='append',
+                        help='benchmark only this target (repeatable), default: all')
+    aparse.add_argument('--clients', type=int, action='append',
+                        help='RX fan-out client count (repeatable), default: 1, 10, 100')
+    aparse.add_argument('--size', type=int, default=DEFAULT_SIZE,
+                        help='bytes per throughput run, default: {}'.format(DEFAULT_SIZE))
+    aparse.add_argument('--probes', type=int, default=DEFAULT_PROBES,
+                        help='latency probes, default: {}'.format(DEFAULT_PROBES))
+    aparse.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='runs per scenario, the median counts, default: {}'.format(DEFAULT_ROUNDS))
+    aparse.add_argument('--engine', choices=['threads', 'selector'], default='threads',
+                        help='data-plane engine of both targets, default: threads')
+    aparse.add_argument('--output', help='write the results as JSON to this file')
+    aparse.add_argument('--baseline', help='compare against this baseline JSON')
+    aparse.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed regression when the baseline sets none, '
+                             'default: {:.0%}'.format(DEFAULT_THRESHOLD))
+    aparse.add_argument('--save-baseline', help='store the results as a new baseline here')
+    args = aparse.parse_args(argv)
+
+    if not hasattr(os, 'openpty'):
+        print('the benchmarks need a pty (os.openpty)')
+        return 2
+
+    results = run(targets=args.target or TARGETS,
+                  client_counts=args.clients or CLIENT_COUNTS,
+                  size=args.size, probes=args.probes, engine=args.engine,
+                  rounds=args.rounds)
+    report = {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'engine': args.engine,
+            'size': args.size,
+            'probes': args.probes,
+            'rounds': args.rounds,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    for metric, value in sorted(results.items()):
+        print('{:<32} {}'.format(metric, value))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+    if args.save_baseline:
+        thresholds = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as fh:
+                thresholds = json.load(fh).get('thresholds', {})
+        report['thresholds'] = thresholds
+        with open(args.save_baseline, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.threshold)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            return 1
+        print('no regressions against {}'.format(args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Cost of one console log event: CPU to create it, memory to retain it.
+
+Feeds 80-column lines through :class:`~serialtcp.service.PortService`'s line
+splitter, as the serial thread does, with nobody rendering them, and reports
+
+    emit_us          CPU time per line, splitting + event + history append
+    retained_bytes   memory per event held in the service's log history
+
+::
+
+    python benchmarks/events.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from serialtcp.service import PortConfig, PortService, _LOG_HISTORY
+
+DEFAULT_LINES = 200000
+
+_LINE = b''.join(b'%c' % (33 + i % 94) for i in range(79)) + b'\n'
+
+
+def bench_emit(lines):
+    service = PortService(PortConfig(device='X', tcp_port=1))
+    chunk = _LINE * 16
+    start = time.process_time()
+    for _ in range(lines // 16):
+        service._buffer_lines('rx', chunk)
+    return (time.process_time() - start) / lines * 1e6
+
+
+def bench_retained():
+    service = PortService(PortConfig(device='X', tcp_port=1))
+    chunk = _LINE * 10
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(_LOG_HISTORY // 10):
+        service._buffer_lines('rx', chunk)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained / len(service.history)
+
+
+def main(argv=None):
+    aparse = argparse.ArgumentParser(description='serial-tcp log event cost')
+    aparse.add_argument('--lines', type=int, default=DEFAULT_LINES,
+                        help='lines for the CPU measurement, default: {}'.format(DEFAULT_LINES))
+    args = aparse.parse_args(argv)
+    print('{:<16} {:.2f}'.format('emit_us', bench_emit(args.lines)))
+    print('{:<16} {:.0f}'.format('retained_bytes', bench_retained()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,11 @@
-"""ANSI/VT escape handling for the console: SGR colours + control cleanup.
+"""ANSI colours for the console: SGR foreground codes -> theme colours.
 
-Kept tkinter-free so it can be unit tested on its own.
+Kept tkinter-free so it can be unit tested on its own. The escape parsing
+itself lives in :mod:`serialtcp.ansi` and runs on the backend; log events carry
+its result as :attr:`~serialtcp.history.LogEvent.segments`.
 """
 
-import re
-
-# Any ANSI/VT escape: CSI (... letter), OSC (... BEL/ST) or a bare 2-char escape.
-_ANSI_RE = re.compile(r'\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b.')
+from serialtcp.ansi import clean, segment
 
 # SGR foreground code -> console hex colour (tuned for the dark #11151c bg).
 ANSI_COLORS = {
@@ -16,14 +15,10 @@ ANSI_COLORS = {
     94: '#9bc7ff', 95: '#d7a3ec', 96: '#7fd0db', 97: '#ffffff',
 }
 
-# Drop C0 control chars (and DEL) except tab; ESC is consumed by _ANSI_RE first.
-_CTRL = {i: None for i in range(0x20) if i != 0x09}
-_CTRL[0x7f] = None
-
 
-def clean(text):
-    """Remove non-printable control characters (keep tab)."""
-    return text.translate(_CTRL)
+def colored(segments, default):
+    """``(chunk, colour)`` for ``(chunk, sgr)`` runs; ``default`` outside SGR colours."""
+    return [(chunk, default if sgr is None else ANSI_COLORS[sgr]) for chunk, sgr in segments]
 
 
 def parse_ansi(text, default):
@@ -32,25 +27,4 @@ def parse_ansi(text, default):
     Non-colour escapes (cursor moves, clears, OSC, ...) are dropped. ``default``
     is the colour used for text outside any active SGR colour.
     """
-    segments = []
-    pos = 0
-    current = None
-    for m in _ANSI_RE.finditer(text):
-        if m.start() > pos:
-            segments.append((text[pos:m.start()], current or default))
-        seq = m.group(0)
-        if seq.startswith('\x1b[') and seq.endswith('m'):
-            body = seq[2:-1]
-            for part in (body.split(';') if body else ['0']):
-                try:
-                    code = int(part) if part else 0
-                except ValueError:
-                    continue
-                if code in (0, 39):
-                    current = None
-                elif code in ANSI_COLORS:
-                    current = ANSI_COLORS[code]
-        pos = m.end()
-    if pos < len(text):
-        segments.append((text[pos:], current or default))
-    return segments
+    return colored(segment(text), default)
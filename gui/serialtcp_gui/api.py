@@ -8,12 +8,14 @@ reconfigure mappings, and start/stop their TCP servers.
 Endpoints (interactive docs at ``<base-url>/docs``, schema at ``/openapi.json``)::
 
     GET    /health                  liveness plus a summary of every mapping
+    GET    /metrics                 Prometheus metrics of every mapping
     GET    /config                  full configuration snapshot (logging/api/ports)
     GET    /ports                   live state of every mapping
     POST   /ports                   add a mapping
     POST   /ports/start-all         start every mapping
     POST   /ports/stop-all          stop every mapping
     GET    /ports/{tcp_port}        live state of one mapping
+    GET    /ports/{tcp_port}/log    console lines after a sequence number
     PATCH  /ports/{tcp_port}        change one mapping (restarted if running)
     DELETE /ports/{tcp_port}        remove a mapping
     POST   /ports/{tcp_port}/start  start one mapping's TCP server
@@ -23,7 +25,8 @@ Threading
 ---------
 uvicorn runs in its own daemon thread, so request handlers execute *off* the Tk
 main loop. Read-only requests only touch plain :class:`~serialtcp.service.PortService`
-attributes and are answered directly. Every request that mutates the app
+attributes and are answered directly; ``/metrics`` is served from a snapshot
+rendered once a second by its own thread. Every request that mutates the app
 (add/change/remove/start/stop) is marshalled onto the Tk main loop through
 ``App.call_on_main`` so that all widget mutation stays single-threaded, the same
 rule the backend event queue follows. A mutation that cannot be run within
@@ -49,9 +52,16 @@ import threading
 from typing import List, Optional
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Path
+from fastapi import FastAPI, HTTPException, Path, Query
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 
+from serialtcp.server import ENGINES
+from serialtcp.serial_port import READERS
+from serialtcp.client import DEFAULT_SEND_QUEUE, SLOW_CLIENT_POLICIES, DEFAULT_RECV_BUFFER
+from serialtcp.charmap import compile_maps
+from serialtcp.logwriter import DEFAULT_FLUSH_INTERVAL
+from serialtcp.metrics import MetricsCache, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from serialtcp.service import (
     PortConfig, LINE_ENDINGS, STATUS_RECONNECTING, STATUS_RUNNING, STATUS_STOPPED,
 )
@@ -77,6 +87,7 @@ are saved back to the app's YAML config file.
 
 _TAGS = [
     {'name': 'health', 'description': 'Liveness and a summary of the running app.'},
+    {'name': 'metrics', 'description': 'Prometheus metrics for monitoring.'},
     {'name': 'config', 'description': 'The configuration the app is running with.'},
     {'name': 'ports', 'description': 'Inspect, configure, start and stop the serial -> TCP mappings.'},
 ]
@@ -94,11 +105,26 @@ class PortConfigModel(BaseModel):
     xonxoff: bool = Field(False, description='Software flow control.')
     char_mode: bool = Field(False, description='Send characters one at a time.')
     char_delay: float = Field(0.0, ge=0, description='Seconds between characters in char mode.')
+    char_burst: bool = Field(False, description='Send sub-ms char_delay as paced multi-character bursts.')
+    maps: str = Field('', description='Character maps, comma-separated, e.g. ICRNL,ODELBS.')
+    log_flush_interval: float = Field(DEFAULT_FLUSH_INTERVAL, gt=0,
+                                      description='Longest time a log line waits before it is written.')
+    log_fsync_interval: float = Field(0.0, ge=0, description='fsync the log at most this often (0 = never).')
     wait_echo: float = Field(0.0, ge=0, description='Seconds to wait for the echo of each character.')
+    echo_window: int = Field(1, ge=1, description='Characters sent ahead of their echo (wait_echo).')
     line_ending: str = Field('CRLF', description='Console send newline: CRLF, LF, CR or none.')
     log_file: str = Field('', description="Path to log all serial activity ('' = off).")
+    capture_file: str = Field('', description="Path of a binary capture of the serial I/O ('' = off).")
     allow_remote: bool = Field(False, description='False binds 127.0.0.1, true binds 0.0.0.0.')
     autostart: bool = Field(False, description='Start this mapping when the GUI launches.')
+    engine: str = Field('threads', description='Data-plane engine: threads or selector.')
+    send_queue: int = Field(DEFAULT_SEND_QUEUE, ge=0,
+                            description='Per-client outbound queue bound in bytes (0 = unbounded).')
+    slow_client: str = Field('drop_oldest', description='Full client queue: drop_oldest, disconnect or block.')
+    recv_buffer: int = Field(DEFAULT_RECV_BUFFER, ge=1, description='Bytes read from a TCP client per call.')
+    zero_copy_rx: bool = Field(False, description='Read clients with recv_into on a reusable buffer.')
+    serial_reader: str = Field('pyserial', description='Serial receive backend: pyserial or poll (Linux).')
+    latency_stats: bool = Field(False, description='Record per-stage RX latency histograms.')
 
 
 class PortPatchModel(BaseModel):
@@ -111,11 +137,97 @@ class PortPatchModel(BaseModel):
     xonxoff: Optional[bool] = None
     char_mode: Optional[bool] = None
     char_delay: Optional[float] = Field(None, ge=0)
+    char_burst: Optional[bool] = None
+    maps: Optional[str] = None
+    log_flush_interval: Optional[float] = Field(None, gt=0)
+    log_fsync_interval: Optional[float] = Field(None, ge=0)
     wait_echo: Optional[float] = Field(None, ge=0)
+    echo_window: Optional[int] = Field(None, ge=1)
     line_ending: Optional[str] = None
     log_file: Optional[str] = None
+    capture_file: Optional[str] = None
     allow_remote: Optional[bool] = None
     autostart: Optional[bool] = None
+    engine: Optional[str] = None
+    send_queue: Optional[int] = Field(None, ge=0)
+    slow_client: Optional[str] = None
+    recv_buffer: Optional[int] = Field(None, ge=1)
+    zero_copy_rx: Optional[bool] = None
+    serial_reader: Optional[str] = None
+    latency_stats: Optional[bool] = None
+
+
+class ClientQueueModel(BaseModel):
+    """Outbound queue of one connected TCP client."""
+    address: str = Field(..., description='host:port of the client.')
+    queued_bytes: int = Field(..., description='Bytes waiting to be sent to the client.')
+    dropped_bytes: int = Field(..., description='Bytes dropped because the client was too slow.')
+
+
+class PacingModel(BaseModel):
+    """Requested vs achieved inter-character time of char_delay transmission."""
+    requested_s: float = Field(..., description='Configured char_delay.')
+    achieved_mean_s: Optional[float] = Field(None, description='Mean measured gap per character.')
+    achieved_min_s: Optional[float] = Field(None, description='Shortest measured gap per character.')
+    achieved_max_s: Optional[float] = Field(None, description='Longest measured gap per character.')
+    samples: int = Field(..., description='Gaps measured so far.')
+    burst: int = Field(..., description='Characters written per paced write.')
+
+
+class LogWriterModel(BaseModel):
+    """Background log file writer: backlog and how long lines wait for the disk."""
+    queue_depth: int = Field(..., description='Log lines waiting to be written.')
+    queued_bytes: int = Field(..., description='Size of the waiting lines.')
+    written_bytes: int = Field(..., description='Written since logging started.')
+    flushes: int = Field(..., description='Group commits (one write + flush each).')
+    fsyncs: int = Field(..., description='fsync calls (log_fsync_interval).')
+    dropped: int = Field(..., description='Lines dropped because the disk fell too far behind.')
+    last_flush_latency_s: Optional[float] = Field(None, description='Wait of the oldest line of the last commit.')
+    max_flush_latency_s: Optional[float] = Field(None, description='Longest such wait so far.')
+
+
+class LatencyHistogramModel(BaseModel):
+    """Durations of one RX stage, in power-of-two buckets."""
+    count: int = Field(..., description='Chunks measured.')
+    sum_us: float = Field(0.0, description='Sum of all durations.')
+    mean_us: Optional[float] = Field(None, description='Mean duration.')
+    p50_us: Optional[float] = Field(None, description='Median, as the upper bound of its bucket.')
+    p99_us: Optional[float] = Field(None, description='99th percentile, as the upper bound of its bucket.')
+    max_us: Optional[float] = Field(None, description='Longest duration.')
+    buckets: List[List[float]] = Field([], description='Non-empty [upper bound µs, count] buckets.')
+
+
+class RxLatencyModel(BaseModel):
+    """Where RX chunks spend their time between the serial read and the sockets."""
+    dispatch: LatencyHistogramModel = Field(..., description='Serial read -> service (echo matching).')
+    log: LatencyHistogramModel = Field(..., description='Capture, log file and console line splitting.')
+    fanout: LatencyHistogramModel = Field(..., description='Char maps and queueing for every client.')
+    total: LatencyHistogramModel = Field(..., description='Serial read -> queued for every client.')
+    send: LatencyHistogramModel = Field(..., description='Oldest queued byte -> written to the socket.')
+
+
+class HistoryModel(BaseModel):
+    """Console history retained for the mapping, under the app's memory budget."""
+    events: int = Field(..., description='Log lines retained.')
+    bytes: int = Field(..., description='Estimated memory they hold.')
+    quota_bytes: int = Field(..., description="Fair share of the app's history budget.")
+    active: bool = Field(..., description='Shown in the console; evicted last.')
+    next_seq: int = Field(0, description='Sequence number of the next line (GET /ports/{tcp_port}/log).')
+
+
+class LogLineModel(BaseModel):
+    """One console line of a mapping."""
+    seq: int = Field(..., description='Sequence number; consecutive per mapping.')
+    kind: str = Field(..., description='rx | tx | conn | status | retry.')
+    time: float = Field(..., description='Wall-clock time, seconds since the epoch.')
+    text: str = Field(..., description='The line without its terminator.')
+
+
+class LogPageModel(BaseModel):
+    """Console lines from a sequence number on."""
+    first_seq: int = Field(..., description='Oldest line still retained; older ones were dropped.')
+    next_seq: int = Field(..., description='Pass as ?since= to get only the lines after these.')
+    lines: List[LogLineModel] = Field([], description='Oldest first.')
 
 
 class PortStateModel(BaseModel):
@@ -132,8 +244,17 @@ class PortStateModel(BaseModel):
     tx_bytes: int = Field(..., description='Bytes written to the serial device since start.')
     rx_bytes: int = Field(..., description='Bytes read from the serial device since start.')
     reconnect_attempt: int = Field(..., description='Reconnect attempts since the device was lost.')
+    dropped_bytes: int = Field(..., description='Serial bytes dropped for slow clients since start.')
+    echo_mismatches: int = Field(0, description='wait_echo: received bytes that did not match the echo.')
+    echo_timeouts: int = Field(0, description='wait_echo: characters whose echo did not arrive in time.')
+    pacing: Optional[PacingModel] = Field(None, description='char_delay timing (null when char_delay is 0).')
+    client_queues: List[ClientQueueModel] = Field([], description='Outbound queue of every TCP client.')
     listening_on: str = Field(..., description='host:port the TCP server binds.')
     logging_to_file: bool = Field(..., description='True while serial activity is written to log_file.')
+    log_writer: Optional[LogWriterModel] = Field(None, description='Log writer stats (null when not logging).')
+    capture_writer: Optional[LogWriterModel] = Field(None, description='Capture file writer stats (null when off).')
+    rx_latency: Optional[RxLatencyModel] = Field(None, description='RX stage latencies (null unless latency_stats).')
+    history: HistoryModel
     config: PortConfigModel
 
 
@@ -145,6 +266,15 @@ class PortSummaryModel(BaseModel):
     stopped: int
 
 
+class ConsoleModel(BaseModel):
+    """How far the GUI console trails the devices."""
+    lag_s: float = Field(..., description='Age of the newest console line when it was drawn; '
+                                          '0 once the console has caught up.')
+    max_lag_s: float = Field(..., description='Largest lag since the GUI started.')
+    rendered_lines: int = Field(..., description='Lines drawn in the console.')
+    skipped_lines: int = Field(..., description='Lines skipped to catch up after a burst.')
+
+
 class HealthModel(BaseModel):
     """Answer of ``GET /health``."""
     status: str = Field(..., description="'ok', or 'degraded' when a started mapping "
@@ -154,6 +284,7 @@ class HealthModel(BaseModel):
     uptime_s: float = Field(..., description='Seconds since the GUI started.')
     clients: int = Field(..., description='TCP clients connected across all mappings.')
     ports: PortSummaryModel
+    console: ConsoleModel
 
 
 class LogSettingsModel(BaseModel):
@@ -200,6 +331,11 @@ class GuiController:
 
     def __init__(self, app):
         self._app = app
+        self._metrics = MetricsCache(lambda: list(app.services), console=app.console_stats)
+
+    def close(self):
+        """Stop the metrics refresh thread."""
+        self._metrics.close()
 
     # ------------------------------------------------------------- read-only
     def health(self):
@@ -217,8 +353,13 @@ class GuiController:
             uptime_s=round(self._app.uptime, 3),
             clients=sum(s.client_count for s in services),
             ports=summary,
+            console=ConsoleModel(**self._app.console_stats()),
         )
 
+    def metrics(self):
+        """Prometheus text of the latest snapshot (at most a second old)."""
+        return self._metrics.text()
+
     def config(self):
         return ConfigModel(
             config_path=str(self._app.config_path),
@@ -233,6 +374,18 @@ class GuiController:
     def port_state(self, tcp_port):
         return _state(self._find(tcp_port))
 
+    def port_log(self, tcp_port, since, limit):
+        history = self._find(tcp_port).history
+        first = history.first_seq
+        events, next_seq = history.read_since(since, limit)
+        seq = next_seq - len(events)
+        return LogPageModel(
+            first_seq=first,
+            next_seq=next_seq,
+            lines=[LogLineModel(seq=seq + i, kind=ev.kind, time=ev.time, text=ev.text)
+                   for i, ev in enumerate(events)],
+        )
+
     # ------------------------------------------------------------- mutations
     def create_port(self, model):
         """Add a mapping. 409 if its TCP port is already mapped."""
@@ -344,8 +497,17 @@ def _state(service):
         tx_bytes=service.tx_total,
         rx_bytes=service.rx_total,
         reconnect_attempt=service.reconnect_attempt,
+        dropped_bytes=service.dropped_total,
+        echo_mismatches=service.echo_mismatches,
+        echo_timeouts=service.echo_timeouts,
+        pacing=service.pacing_stats(),
+        client_queues=[ClientQueueModel(**c) for c in service.client_stats()],
         listening_on='{}:{}'.format(config.bind_host, config.tcp_port),
         logging_to_file=service.logging_to_file,
+        log_writer=service.log_stats(),
+        capture_writer=service.capture_stats(),
+        rx_latency=service.latency_stats(),
+        history=service.history_stats(),
         config=PortConfigModel(**config.to_dict()),
     )
 
@@ -366,6 +528,16 @@ def _to_config(model):
         raise HTTPException(422, 'parity must be one of {}'.format(', '.join(_PARITIES)))
     if data['line_ending'] not in LINE_ENDINGS:
         raise HTTPException(422, 'line_ending must be one of {}'.format(', '.join(LINE_ENDINGS)))
+    if data['engine'] not in ENGINES:
+        raise HTTPException(422, 'engine must be one of {}'.format(', '.join(ENGINES)))
+    if data['serial_reader'] not in READERS:
+        raise HTTPException(422, 'serial_reader must be one of {}'.format(', '.join(READERS)))
+    if data['slow_client'] not in SLOW_CLIENT_POLICIES:
+        raise HTTPException(422, 'slow_client must be one of {}'.format(', '.join(SLOW_CLIENT_POLICIES)))
+    try:
+        compile_maps(data['maps'])
+    except ValueError as exc:
+        raise HTTPException(422, str(exc))
     data['device'] = data['device'].strip()
     return PortConfig(**data)
 
@@ -390,10 +562,20 @@ def create_api(controller):
         mappings are running, reconnecting or stopped.
 
         ``status`` is ``ok``, or ``degraded`` while a started mapping has lost
-        its serial device and is retrying.
+        its serial device and is retrying. ``console`` tells how far the
+        console trails the device.
         """
         return controller.health()
 
+    @api.get('/metrics', response_class=PlainTextResponse, tags=['metrics'],
+             summary='Prometheus metrics')
+    def get_metrics():
+        """Per-mapping counters and gauges (bytes, clients, status,
+        reconnects, dropped bytes, queue depths) and, for mappings with
+        ``latency_stats``, RX latency histograms, in the Prometheus text
+        format. Rendered about once a second, not per scrape."""
+        return PlainTextResponse(controller.metrics(), media_type=METRICS_CONTENT_TYPE)
+
     @api.get('/config', response_model=ConfigModel, tags=['config'],
              summary='Current configuration')
     def get_config():
@@ -440,6 +622,18 @@ def create_api(controller):
         """Return the live state and configuration of one mapping."""
         return controller.port_state(tcp_port)
 
+    @api.get('/ports/{tcp_port}/log', response_model=LogPageModel, tags=['ports'],
+             responses={404: {'model': MessageModel, 'description': 'No such mapping'}},
+             summary='Console lines of a mapping')
+    def get_port_log(tcp_port: int = port_path(),
+                     since: int = Query(0, ge=0, description='First sequence number wanted.'),
+                     limit: int = Query(500, ge=1, le=10000, description='Most lines returned.')):
+        """Return the retained console lines of one mapping from sequence
+        number ``since`` on. Poll with the returned ``next_seq`` to follow the
+        log; a ``first_seq`` above ``since`` means lines were dropped in
+        between."""
+        return controller.port_log(tcp_port, since, limit)
+
     @api.patch('/ports/{tcp_port}', response_model=PortStateModel, tags=['ports'],
                responses={404: {'model': MessageModel, 'description': 'No such mapping'},
                           409: {'model': MessageModel, 'description': 'TCP port already mapped'}},
@@ -485,6 +679,7 @@ class ApiServer:
 
     def __init__(self, controller, settings: ApiSettings):
         self.settings = settings
+        self._controller = controller
         self._api = create_api(controller)
         self._server = None
         self._thread = None
@@ -536,6 +731,7 @@ class ApiServer:
             self._thread.join(timeout)
         self._server = None
         self._thread = None
+        self._controller.close()
 
 
 def _bind(settings):
@@ -1,8 +1,11 @@
 """Port Manager application: app bar, master list, detail panel, event loop.
 
 One window owns many :class:`~serialtcp.service.PortService` instances. Backend
-I/O threads report activity through a queue that is drained on the Tk main loop
-(``after``), so all widget mutation stays single-threaded.
+I/O threads append their log events to each service's
+:class:`~serialtcp.history.LogHistory`; on every tick of the Tk main loop
+(``after``) the detail panel reads what is new since its cursor in one batch,
+so all widget mutation stays single-threaded and a chatty device costs one
+read per tick instead of one hand-over per line.
 """
 
 import os
@@ -23,8 +26,9 @@ from .detail import DetailPanel
 from .dialog import open_dialog
 from .about import open_about
 from serialtcp.service import PortService
+from serialtcp.workers import WorkerPool
 
-# Loop cadence: drain the event queue often; refresh stats once per second.
+# Loop cadence: read new console lines often; refresh stats once per second.
 _TICK_MS = 200
 _REFRESH_EVERY = 5   # ticks between stat refreshes (5 * 200ms = 1s)
 _COLLAPSED_WIDTH = 358   # window width when the detail panel is hidden
@@ -103,7 +107,7 @@ def _apply_window_icon(root):
 
 
 class App:
-    def __init__(self, config_path, log_settings=None, api_settings=None):
+    def __init__(self, config_path, log_settings=None, api_settings=None, workers=0):
         self.config_path = config_path
         self.log_settings = log_settings or config_mod.LogSettings()
         self.api_settings = api_settings or config_mod.ApiSettings()
@@ -116,9 +120,10 @@ class App:
         self.root.minsize(330, 400)
 
         self.theme = Theme()
-        self.events = queue.Queue()
         self.calls = queue.Queue()      # work handed to the main loop from other threads
         self.api_server = None
+        # Optional worker processes hosting the services (None = in-process).
+        self.pool = WorkerPool(workers) if workers else None
         self.services = []
         self.cards = []
         self.selected = None
@@ -144,6 +149,10 @@ class App:
         """Seconds since the window was created."""
         return time.time() - self.started_at
 
+    def console_stats(self):
+        """UI lag and lines drawn / skipped by the console."""
+        return self.detail.stats.stats()
+
     # ------------------------------------------------------------ layout
     def _build_appbar(self):
         c = self.theme.colors
@@ -278,7 +287,10 @@ class App:
                                    'Some ports could not start:\n\n' + '\n'.join(errors))
 
     def _add_service(self, cfg, select=True):
-        service = PortService(cfg, on_event=self._on_event)
+        if self.pool:
+            service = self.pool.create_service(cfg)
+        else:
+            service = PortService(cfg)
         self.services.append(service)
         card = PortCard(self._list_inner, self.theme, service, self._select, self._chevron)
         card.pack(fill='x', pady=(0, 10), before=self._add_footer)
@@ -296,6 +308,9 @@ class App:
 
     def _select(self, service):
         self.selected = service
+        # The shown console's history is evicted last under the memory budget.
+        for other in self.services:
+            other.history.active = other is service
         if not self._detail_visible:
             self._show_detail()
         self._update_cards_state()
@@ -458,7 +473,9 @@ class App:
 
     def remove_port_config(self, service):
         """Stop and drop a mapping, then save the config."""
-        if service.running:
+        if self.pool:
+            self.pool.remove_service(service)
+        elif service.running:
             service.stop()
         card = self._card_for(service)
         if card:
@@ -508,6 +525,9 @@ class App:
         if not messagebox.askyesno('Reload', 'Stop all ports and reload config from disk?'):
             return
         self._stop_all()
+        if self.pool:
+            for service in self.services:
+                self.pool.remove_service(service)
         for card in self.cards:
             card.destroy()
         self.cards = []
@@ -516,10 +536,6 @@ class App:
         self._load()
 
     # -------------------------------------------------------------- events
-    def _on_event(self, service, event):
-        # Called from backend threads: just hand off to the main loop.
-        self.events.put((service, event))
-
     def _tick(self):
         # Work handed over by other threads (REST API) runs first, so a request
         # that changes a mapping is reflected by the refresh below.
@@ -529,12 +545,7 @@ class App:
         except queue.Empty:
             pass
 
-        try:
-            while True:
-                service, event = self.events.get_nowait()
-                self.detail.append_log(service, event)
-        except queue.Empty:
-            pass
+        self.detail.read_new_lines()
 
         self._tick_count += 1
         if self._tick_count % _REFRESH_EVERY == 0:
@@ -600,6 +611,8 @@ class App:
         self._stop_api()
         for service in self.services:
             service.stop()
+        if self.pool:
+            self.pool.close()
         self._save()
         self.root.destroy()
 
@@ -611,11 +624,15 @@ def main(argv=None):
         description='Tkinter Port Manager for serial -> TCP mappings.')
     parser.add_argument('config', nargs='?', default=config_mod.default_config_path(),
                         help='YAML config file (default: ./%s)' % config_mod.DEFAULT_CONFIG_NAME)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run the mappings in this many worker processes '
+                             '(default: 0, all in the GUI process)')
     args = parser.parse_args(argv)
     log_settings = config_mod.load_log_settings(args.config)
     config_mod.configure_logging(log_settings)
     config_mod.install_thread_excepthook()
-    App(args.config, log_settings, config_mod.load_api_settings(args.config)).run()
+    App(args.config, log_settings, config_mod.load_api_settings(args.config),
+        workers=args.workers).run()
 
 
 if __name__ == '__main__':
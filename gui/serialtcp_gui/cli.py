@@ -7,6 +7,7 @@ driven from a shell or a script without hand-writing curl calls::
     serial-tcp-ctl health                  # alive? how many mappings, how many clients
     serial-tcp-ctl ports                    # one table row per mapping
     serial-tcp-ctl show 5000                # everything about one mapping
+    serial-tcp-ctl log 5000 -f              # console lines, then follow new ones
     serial-tcp-ctl config                   # config file, logging, api, mappings
     serial-tcp-ctl add COM103 5000 --baudrate 921600 --name Target --start
     serial-tcp-ctl set 5000 --baudrate 115200
@@ -31,6 +32,7 @@ extra installed - that extra is only needed by the GUI process serving the API.
 import os
 import sys
 import json
+import time
 import argparse
 import http.client
 import urllib.error
@@ -45,16 +47,31 @@ _OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
 
 DEFAULT_URL = 'http://127.0.0.1:{}'.format(DEFAULT_API_PORT)
 
+# `log`: lines fetched per request, and how often --follow asks for new ones.
+_LOG_PAGE = 1000
+_FOLLOW_INTERVAL = 0.5
+
 # Config fields settable by `add` / `set`; ('flag', type) keyed by API field name.
-_BOOL_FIELDS = ('xonxoff', 'char_mode', 'allow_remote', 'autostart')
+_BOOL_FIELDS = ('xonxoff', 'char_mode', 'char_burst', 'allow_remote', 'autostart', 'zero_copy_rx',
+                'latency_stats')
 _VALUE_FIELDS = (
     ('name', str, 'label shown on the card (defaults to the device)'),
     ('baudrate', int, 'serial baudrate'),
     ('parity', str, 'serial parity: N, E, O, S or M'),
     ('char-delay', float, 'seconds between characters in char mode'),
     ('wait-echo', float, 'seconds to wait for the echo of each character'),
+    ('echo-window', int, 'characters sent ahead of their echo (wait-echo)'),
     ('line-ending', str, 'console send newline: CRLF, LF, CR or none'),
     ('log-file', str, 'file to log all serial activity to'),
+    ('log-flush-interval', float, 'longest time a log line waits before it is written'),
+    ('log-fsync-interval', float, 'fsync the log at most this often (0 = never)'),
+    ('capture-file', str, 'binary capture file of the serial I/O (with a .idx index)'),
+    ('engine', str, 'data-plane engine: threads or selector'),
+    ('send-queue', int, 'per-client outbound queue bound in bytes'),
+    ('slow-client', str, 'full client queue: drop_oldest, disconnect or block'),
+    ('recv-buffer', int, 'bytes read from a TCP client per call'),
+    ('serial-reader', str, 'serial receive backend: pyserial or poll (Linux)'),
+    ('maps', str, 'char maps, comma-separated, e.g. ICRNL,ODELBS'),
 )
 
 
@@ -173,6 +190,7 @@ def _print_health(body):
         ('Mappings', '{} total - {} running, {} reconnecting, {} stopped'.format(
             ports['total'], ports['running'], ports['reconnecting'], ports['stopped'])),
         ('Clients', body['clients']),
+        ('Console', _console(body.get('console'))),
     ]))
 
 
@@ -222,9 +240,12 @@ def _print_state(state):
         ('Uptime', format_duration(state['uptime_s'])),
         ('Traffic', 'in {} / out {}'.format(_bytes(state['rx_bytes']), _bytes(state['tx_bytes']))),
         ('Reconnects', state['reconnect_attempt']),
+        ('Dropped', _bytes(state.get('dropped_bytes', 0))),
+        ('History', _history(state.get('history'))),
         ('Serial log', config['log_file'] + (' (active)' if state['logging_to_file'] else '')
          if config['log_file'] else 'off'),
         ('Newline', config['line_ending']),
+        ('Engine', config.get('engine', 'threads')),
         ('Autostart', _yesno(config['autostart'])),
         ('Flow', 'xonxoff={} char_mode={} char_delay={} wait_echo={}'.format(
             _yesno(config['xonxoff']), _yesno(config['char_mode']),
@@ -238,6 +259,20 @@ def _pairs(items):
                      for label, value in items)
 
 
+def _history(history):
+    if not history:
+        return '-'
+    return '{} lines, {} (quota {})'.format(
+        history['events'], _bytes(history['bytes']), _bytes(history['quota_bytes']))
+
+
+def _console(console):
+    if not console:
+        return '-'
+    return 'lag {:.0f} ms (max {:.0f} ms), {} lines skipped'.format(
+        console['lag_s'] * 1000, console['max_lag_s'] * 1000, console['skipped_lines'])
+
+
 def _yesno(value):
     return 'yes' if value else 'no'
 
@@ -275,6 +310,38 @@ def cmd_show(client, args):
     return 0
 
 
+def cmd_log(client, args):
+    path = '/ports/{}/log?since={}&limit={}'
+    since = 0
+    if args.lines is not None:
+        state = client.get('/ports/{}'.format(args.tcp_port))
+        since = max(0, state['history']['next_seq'] - args.lines)
+    try:
+        while True:
+            body = client.get(path.format(args.tcp_port, since, _LOG_PAGE))
+            if args.json:
+                print(json.dumps(body, indent=2))
+            else:
+                if body['first_seq'] > since:
+                    print('... {} lines dropped'.format(body['first_seq'] - since))
+                for line in body['lines']:
+                    print('[{}] {}'.format(_clock(line['time']), line['text']))
+            sys.stdout.flush()
+            since = body['next_seq']
+            if len(body['lines']) == _LOG_PAGE:
+                continue
+            if not args.follow:
+                return 0
+            time.sleep(_FOLLOW_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+
+
+def _clock(seconds):
+    return time.strftime('%H:%M:%S', time.localtime(seconds)) + '.{:03d}'.format(
+        int(seconds * 1000) % 1000)
+
+
 def cmd_add(client, args):
     payload = _config_fields(args)
     payload['device'] = args.device
@@ -405,6 +472,14 @@ def build_parser():
     show.add_argument('tcp_port', type=int, help='TCP listen port of the mapping')
     show.set_defaults(func=cmd_show)
 
+    log = subs.add_parser('log', help="console lines of one mapping")
+    log.add_argument('tcp_port', type=int, help='TCP listen port of the mapping')
+    log.add_argument('-n', '--lines', type=int, default=None,
+                     help='only the last N lines (default: all retained)')
+    log.add_argument('-f', '--follow', action='store_true',
+                     help='keep printing new lines until interrupted')
+    log.set_defaults(func=cmd_log)
+
     add = subs.add_parser('add', help='add a mapping')
     add.add_argument('device', help='serial device, e.g. COM3 or /dev/ttyUSB0')
     add.add_argument('tcp_port', type=int, help='TCP port clients will connect to')
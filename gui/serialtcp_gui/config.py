@@ -27,7 +27,7 @@ from dataclasses import dataclass, asdict
 
 import yaml
 
-from serialtcp.service import PortConfig
+from serialtcp.service import configs_from_data
 
 DEFAULT_CONFIG_NAME = 'serialtcp_ports.yaml'
 
@@ -97,20 +97,7 @@ def _read_yaml(path):
 
 def load_configs(path):
     """Return a list of PortConfig from ``path`` (empty list if missing)."""
-    data = _read_yaml(path)
-    if not data:
-        return []
-    if isinstance(data, dict):
-        ports = data.get('ports', [])
-    elif isinstance(data, list):
-        ports = data
-    else:
-        ports = []
-    configs = []
-    for entry in ports:
-        if isinstance(entry, dict) and entry.get('device') and entry.get('tcp_port'):
-            configs.append(PortConfig.from_dict(entry))
-    return configs
+    return configs_from_data(_read_yaml(path))
 
 
 def load_log_settings(path):
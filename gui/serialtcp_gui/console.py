@@ -0,0 +1,108 @@
+"""Console rendering: log events -> coalesced text runs, plus render stats.
+
+Kept tkinter-free so it can be unit tested on its own. The detail panel turns
+a batch of :class:`~serialtcp.history.LogEvent` lines into :class:`Runs`,
+one ``(text, style)`` pair per stretch of equal style, and hands them to the
+Text widget in a single ``insert`` call; :class:`ConsoleStats` records how far
+behind the device the console is.
+"""
+
+import time
+
+from .ansi import ANSI_COLORS
+
+# Style of the timestamp prefix (and the skipped-lines marker); every other
+# style is a foreground colour.
+TS = 'ts'
+
+
+class Runs:
+    """Text built up run by run; adjacent text of the same style is merged."""
+
+    def __init__(self):
+        self.runs = []                  # [text, style, text, style, ...]
+        self.lines = 0
+        self._parts = []
+        self._style = None
+
+    def add(self, text, style):
+        if style != self._style:
+            self._close()
+            self._style = style
+        self._parts.append(text)
+
+    def newline(self):
+        # The newline takes whatever style is current: it draws nothing.
+        self._parts.append('\n')
+        self.lines += 1
+
+    def flat(self):
+        """``text, style, text, style, ...`` for ``Text.insert('end', *flat)``."""
+        self._close()
+        return self.runs
+
+    def _close(self):
+        if self._parts:
+            self.runs += (''.join(self._parts), self._style)
+            self._parts = []
+
+
+def add_event(runs, event, view_mode, color):
+    """Append one event, ``[ts] text`` in ``color`` or as hex rows."""
+    prefix = '[{}] '.format(event.ts)
+    runs.add(prefix, TS)
+    if view_mode != 'ascii' and event.kind in ('rx', 'tx'):
+        _add_hex(runs, event, 16 if view_mode == 'hex16' else 32, color, len(prefix))
+    else:
+        # Replays the runs the backend worked out; plain lines have one.
+        for chunk, sgr in event.segments:
+            runs.add(chunk, color if sgr is None else ANSI_COLORS[sgr])
+    runs.newline()
+
+
+def _add_hex(runs, event, width, color, indent):
+    """The actual bytes (terminator included, e.g. ``0d 0a``), ``width`` per
+    row; continuation rows are indented to align under the first byte."""
+    raw = event.raw if event.raw is not None else event.text.encode('utf-8', 'replace')
+    for i in range(0, len(raw), width):
+        if i:
+            runs.newline()
+            runs.add(' ' * indent, TS)
+        runs.add(' '.join('{:02x}'.format(b) for b in raw[i:i + width]), color)
+
+
+def add_skipped(runs, count):
+    """Mark ``count`` lines that were never rendered."""
+    runs.add('··· {} line{} skipped ···'.format(count, '' if count == 1 else 's'), TS)
+    runs.newline()
+
+
+class ConsoleStats:
+    """How far the console trails the device.
+
+    ``lag_s`` is the age of the newest line when it was drawn (0 once the
+    console has caught up), ``max_lag_s`` the worst seen; ``rendered`` and
+    ``skipped`` count lines drawn and lines passed over to catch up.
+    """
+
+    def __init__(self):
+        self.lag_s = 0.0
+        self.max_lag_s = 0.0
+        self.rendered = 0
+        self.skipped = 0
+
+    def record(self, events, skipped=0):
+        """Account a drawn batch whose newest line is ``events[-1]``."""
+        lag = max(0, time.monotonic_ns() - events[-1].mono_ns) / 1e9 if events else 0.0
+        self.lag_s = lag
+        self.max_lag_s = max(self.max_lag_s, lag)
+        self.rendered += len(events)
+        self.skipped += skipped
+
+    def stats(self):
+        return {
+            'lag_s': round(self.lag_s, 6),
+            'max_lag_s': round(self.max_lag_s, 6),
+            'rendered_lines': self.rendered,
+            'skipped_lines': self.skipped,
+        }
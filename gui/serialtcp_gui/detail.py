@@ -5,11 +5,12 @@ reconnecting, and stopped. The structure is rebuilt only when the selected
 service or its status changes; live values are updated in place each tick.
 """
 
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 from . import widgets
-from .ansi import parse_ansi, clean
+from .console import Runs, ConsoleStats, TS, add_event, add_skipped
 from .util import format_bytes, format_duration
 from serialtcp.service import (
     STATUS_RUNNING, STATUS_RECONNECTING, STATUS_STOPPED,
@@ -18,6 +19,11 @@ from serialtcp.service import (
 
 _MAX_CONSOLE_LINES = 500
 
+# Console drawing per main-loop tick: lines are read and inserted in chunks
+# until the budget (seconds) is spent; the rest waits for the next tick.
+_RENDER_BUDGET = 0.05
+_RENDER_CHUNK = 250
+
 
 class DetailPanel(tk.Frame):
     def __init__(self, parent, theme, actions):
@@ -29,6 +35,8 @@ class DetailPanel(tk.Frame):
         self._dyn = {}                  # dynamic label refs
         self._console = None            # tk.Text or None
         self._view_mode = 'ascii'       # 'ascii' | 'hex16' | 'hex32'
+        self._seq = 0                   # history cursor: next line to show
+        self.stats = ConsoleStats()     # UI lag, lines drawn / skipped
         self._build_empty()
 
     # ------------------------------------------------------------- public API
@@ -50,10 +58,31 @@ class DetailPanel(tk.Frame):
                 self._render_buffer(svc)
         self._update_dynamic(svc, status)
 
-    def append_log(self, service, event):
-        if service is not self.service or self._console is None:
+    def read_new_lines(self):
+        """Append the shown service's lines logged since the last read.
+
+        Draws at most ``_RENDER_BUDGET`` worth of chunks per call, so a burst
+        cannot freeze the window. Lines the console could not hold anyway are
+        skipped, and a marker says how many.
+        """
+        if self.service is None or self._console is None:
             return
-        self._append_line(event)
+        history = self.service.history
+        deadline = time.perf_counter() + _RENDER_BUDGET
+        drawn = False
+        while True:
+            # More than the console holds would be trimmed right away.
+            seq = max(self._seq, history.next_seq - _MAX_CONSOLE_LINES)
+            events, next_seq = history.read_since(seq, _RENDER_CHUNK)
+            if not events:
+                break
+            self._append_lines(events, next_seq - len(events) - self._seq)
+            self._seq = next_seq
+            drawn = True
+            if time.perf_counter() >= deadline:
+                break
+        if not drawn:
+            self.stats.record(())       # caught up
 
     # --------------------------------------------------------------- rebuild
     def _clear(self):
@@ -360,6 +389,7 @@ class DetailPanel(tk.Frame):
         """Clear the console: drop the retained log and empty the widget."""
         if self.service is not None:
             self.service.clear_log()
+            self._seq = self.service.history.next_seq
         if self._console is not None:
             self._console.configure(state='normal')
             self._console.delete('1.0', 'end')
@@ -398,63 +428,42 @@ class DetailPanel(tk.Frame):
         text = self._console
         text.configure(state='normal')
         text.delete('1.0', 'end')
-        for event in service.snapshot_log():
-            self._insert_event(text, event)
         text.configure(state='disabled')
-        text.see('end')
-
-    def _append_line(self, event):
+        history = service.history
+        self._seq = max(history.first_seq, history.next_seq - _MAX_CONSOLE_LINES)
+        self.read_new_lines()
+
+    def _append_lines(self, events, skipped=0):
+        """Draw ``events`` with one insert, after a marker for ``skipped``."""
+        runs = Runs()
+        if skipped > 0:
+            add_skipped(runs, skipped)
+        default = self.theme.colors.con_rx
+        for event in events:
+            add_event(runs, event, self._view_mode, self._kind_color.get(event.kind, default))
+        flat = runs.flat()
         text = self._console
+        for i in range(1, len(flat), 2):
+            flat[i] = self._color_tag(text, flat[i])
         text.configure(state='normal')
-        self._insert_event(text, event)
+        text.insert('end', *flat)
         # Trim history so the widget can't grow without bound.
         line_count = int(text.index('end-1c').split('.')[0])
         if line_count > _MAX_CONSOLE_LINES:
             text.delete('1.0', '{}.0'.format(line_count - _MAX_CONSOLE_LINES + 1))
         text.configure(state='disabled')
         text.see('end')
+        self.stats.record(events, skipped)
 
     def _color_tag(self, text, color):
+        if color == TS:
+            return TS
         tag = 'fg' + color
         if tag not in self._color_tags:
             text.tag_configure(tag, foreground=color)
             self._color_tags.add(tag)
         return tag
 
-    def _insert_event(self, text, event):
-        if self._view_mode != 'ascii' and event.kind in ('rx', 'tx'):
-            self._insert_hex_event(text, event)
-            return
-        text.insert('end', '[{}] '.format(event.ts), 'ts')
-        default = self._kind_color.get(event.kind, self.theme.colors.con_rx)
-        for chunk, color in parse_ansi(event.text, default):
-            chunk = clean(chunk)
-            if chunk:
-                text.insert('end', chunk, self._color_tag(text, color))
-        text.insert('end', '\n')
-
-    def _insert_hex_event(self, text, event):
-        """Render one rx/tx line as hex bytes, wrapped at 16 or 32 per row.
-
-        The actual received bytes (including the line terminator, e.g. ``0d 0a``)
-        are shown; continuation rows are indented to align under the first byte.
-        """
-        prefix = '[{}] '.format(event.ts)
-        text.insert('end', prefix, 'ts')
-        raw = event.raw if event.raw is not None else event.text.encode('utf-8', 'replace')
-        color = self._kind_color.get(event.kind, self.theme.colors.con_rx)
-        tag = self._color_tag(text, color)
-        width = 16 if self._view_mode == 'hex16' else 32
-        if not raw:
-            text.insert('end', '\n')
-            return
-        for i in range(0, len(raw), width):
-            if i:
-                text.insert('end', '\n' + ' ' * len(prefix), 'ts')
-            row = raw[i:i + width]
-            text.insert('end', ' '.join('{:02x}'.format(b) for b in row), tag)
-        text.insert('end', '\n')
-
     # -------------------------------------------------------------- dynamic
     def _update_dynamic(self, service, status):
         if service is None:
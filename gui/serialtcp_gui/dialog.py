@@ -1,5 +1,6 @@
 """Add/edit dialog for a serial -> TCP port mapping."""
 
+import dataclasses
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
@@ -184,7 +185,7 @@ class _PortDialog(tk.Toplevel):
         except ValueError:
             return messagebox.showerror('Invalid', 'Delays must be non-negative numbers.', parent=self)
 
-        self.result = PortConfig(
+        fields = dict(
             device=device,
             tcp_port=tcp_port,
             name=self._name_var.get().strip(),
@@ -199,4 +200,7 @@ class _PortDialog(tk.Toplevel):
             allow_remote=self._allow_remote.get(),
             autostart=self._autostart.get(),
         )
+        # Keep settings the dialog does not show (engine, ...) when editing.
+        self.result = (dataclasses.replace(self.editing, **fields) if self.editing
+                       else PortConfig(**fields))
         self.destroy()
@@ -1,3 +1,8 @@
-from serialtcp.tcp_server import parse_args
+import sys
 
-parse_args()
+if sys.argv[1:2] == ['replay']:
+    from serialtcp.replay import main
+    main(sys.argv[2:])
+else:
+    from serialtcp.tcp_server import parse_args
+    parse_args()
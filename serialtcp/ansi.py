@@ -0,0 +1,64 @@
+"""ANSI/VT escape handling for console lines: SGR colour runs + control cleanup.
+
+:func:`segment` splits a line into ``(chunk, sgr)`` runs once, on the thread
+that logged it; the GUI only maps the SGR codes to its colours. Lines without
+ESC, almost all of them, skip the regex, and those with no control characters
+the cleanup too.
+"""
+
+import re
+
+# Any ANSI/VT escape: CSI (... letter), OSC (... BEL/ST) or a bare 2-char escape.
+_ANSI_RE = re.compile(r'\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b.')
+
+# SGR foreground codes that pick a colour; 0 and 39 go back to the default.
+FG_CODES = frozenset(range(30, 38)) | frozenset(range(90, 98))
+
+# Drop C0 control chars (and DEL) except tab; ESC is consumed by _ANSI_RE first.
+_CTRL = {i: None for i in range(0x20) if i != 0x09}
+_CTRL[0x7f] = None
+
+
+def clean(text):
+    """Remove non-printable control characters (keep tab)."""
+    return text.translate(_CTRL)
+
+
+def segment(text):
+    """Split ``text`` into ``(chunk, sgr)`` runs, honouring SGR colours.
+
+    ``sgr`` is the foreground code in effect (one of :data:`FG_CODES`), or
+    None for the default colour. Non-colour escapes (cursor moves, clears,
+    OSC, ...) and control characters are dropped, and so are the chunks that
+    leaves empty.
+    """
+    if '\x1b' not in text:
+        if not text.isprintable():
+            text = clean(text)
+        return ((text, None),) if text else ()
+    segments = []
+    pos = 0
+    current = None
+    for m in _ANSI_RE.finditer(text):
+        if m.start() > pos:
+            chunk = clean(text[pos:m.start()])
+            if chunk:
+                segments.append((chunk, current))
+        seq = m.group(0)
+        if seq.startswith('\x1b[') and seq.endswith('m'):
+            body = seq[2:-1]
+            for part in (body.split(';') if body else ['0']):
+                try:
+                    code = int(part) if part else 0
+                except ValueError:
+                    continue
+                if code in (0, 39):
+                    current = None
+                elif code in FG_CODES:
+                    current = code
+        pos = m.end()
+    if pos < len(text):
+        chunk = clean(text[pos:])
+        if chunk:
+            segments.append((chunk, current))
+    return tuple(segments)
@@ -0,0 +1,229 @@
+"""Compact binary capture of the serial traffic, with a time -> offset index.
+
+The text ``--log`` format is about four times the size of the data and slow
+to parse back. A capture stores every chunk as it was seen::
+
+    file   := header record*
+    header := b'SERCAP\\x00\\x01'  u64 wall_ns  u64 mono_ns
+    record := u64 ts_ns  u8 direction  u8 0  u16 client  u32 length  payload
+
+All integers are little-endian. ``ts_ns`` is ``time.monotonic_ns()``; the
+header pairs the monotonic and wall clocks at the start of the capture so a
+reader can convert. ``direction`` is :data:`DIR_RX` (from the device) or
+:data:`DIR_TX` (to the device); ``client`` numbers the TCP client a TX chunk
+came from (0 = none, e.g. the GUI console). TX chunks are recorded as the
+client sent them, after Telnet decoding and before char maps.
+
+Next to ``<name>`` a sparse index ``<name>.idx`` holds ``u64 ts_ns, u64
+offset`` pairs after a b'SERIDX\\x00\\x01' magic: one for the first record,
+then one whenever :data:`INDEX_INTERVAL_NS` or :data:`INDEX_BYTES` have passed.
+:meth:`CaptureReader.records` bisects it to start reading near a point in time
+instead of scanning a multi-GB file from the top.
+
+Records are encoded and written by a background
+:class:`~serialtcp.logwriter.LogWriter`, like the text log.
+"""
+
+import os
+import mmap
+import time
+import struct
+import itertools
+from collections import namedtuple
+
+from serialtcp.logwriter import LogWriter, DEFAULT_FLUSH_INTERVAL
+
+MAGIC = b'SERCAP\x00\x01'
+INDEX_MAGIC = b'SERIDX\x00\x01'
+INDEX_SUFFIX = '.idx'
+
+DIR_RX = 0
+DIR_TX = 1
+
+# Index entry spacing: whichever comes first.
+INDEX_INTERVAL_NS = 1000000000
+INDEX_BYTES = 1024 * 1024
+
+_HEADER = struct.Struct('<8sQQ')
+_RECORD = struct.Struct('<QBxHI')
+_INDEX = struct.Struct('<QQ')
+
+Record = namedtuple('Record', 'ts_ns direction client data')
+
+
+def client_ids():
+    """Endless 1..65535 sequence of numbers for the record's client field."""
+    return itertools.cycle(range(1, 0x10000))
+
+
+class _Encoder:
+    """LogWriter formatter: packs records and appends index entries.
+
+    Runs on the writer thread only. The batch's index entries and the new
+    end offset are kept back until :meth:`commit`, which the writer calls
+    once the batch is in the file; a batch that failed (and was cut off
+    again) leaves the offset and the index as they were.
+    """
+
+    def __init__(self, index_fh, offset):
+        self.index_fh = index_fh
+        self.offset = offset
+        self._last_ts = None
+        self._last_offset = 0
+        self._pending = None      # (index entries, offset, last_ts, last_offset)
+
+    def __call__(self, records):
+        parts = []
+        index = []
+        offset = self.offset
+        last_ts, last_offset = self._last_ts, self._last_offset
+        for ts, direction, client, data in records:
+            if (last_ts is None or ts - last_ts >= INDEX_INTERVAL_NS
+                    or offset - last_offset >= INDEX_BYTES):
+                index.append(_INDEX.pack(ts, offset))
+                last_ts, last_offset = ts, offset
+            parts.append(_RECORD.pack(ts, direction, client, len(data)))
+            parts.append(data)
+            offset += _RECORD.size + len(data)
+        self._pending = (index, offset, last_ts, last_offset)
+        return b''.join(parts)
+
+    def commit(self):
+        """The last batch is in the file: move on and index it."""
+        index, self.offset, self._last_ts, self._last_offset = self._pending
+        self._pending = None
+        if index:
+            self.index_fh.write(b''.join(index))
+            self.index_fh.flush()
+
+
+class CaptureWriter:
+    """Record serial traffic to ``path`` (overwritten) and ``path + '.idx'``.
+
+    ``record`` may be called from any thread and never waits for the disk.
+    """
+
+    def __init__(self, path,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 fsync_interval=0.0):
+        self.path = path
+        with open(path, 'wb') as fh:
+            fh.write(_HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns()))
+        self._index_fh = open(path + INDEX_SUFFIX, 'wb')
+        self._index_fh.write(INDEX_MAGIC)
+        encoder = _Encoder(self._index_fh, _HEADER.size)
+        # The index is written and closed by the writer thread only, so a
+        # close() that times out does not pull it away from a late batch.
+        self._writer = LogWriter(path,
+                                 flush_interval=flush_interval,
+                                 fsync_interval=fsync_interval,
+                                 formatter=encoder,
+                                 binary=True,
+                                 on_commit=encoder.commit,
+                                 on_close=self._index_fh.close)
+
+    def record(self, direction, data, client=0):
+        """Queue one chunk; returns False if it was dropped."""
+        return self._writer.write((time.monotonic_ns(), direction, client, bytes(data)),
+                                  _RECORD.size + len(data))
+
+    def stats(self):
+        return self._writer.stats()
+
+    def flush(self, timeout=5.0):
+        return self._writer.flush(timeout)
+
+    def close(self, timeout=5.0):
+        """Write what is queued and close both files; False if still busy
+        after ``timeout`` (the writer thread then closes them when done)."""
+        return self._writer.close(timeout)
+
+
+class CaptureReader:
+    """Memory-mapped reader for a capture file and its index.
+
+    Use as a context manager or call :meth:`close`. Record payloads are
+    memoryviews into the mapping, valid until the reader is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'rb')
+        size = os.fstat(self._fh.fileno()).st_size
+        if size < _HEADER.size:
+            self._fh.close()
+            raise ValueError('{} is not a capture file'.format(path))
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, self.wall_ns, self.mono_ns = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('{} is not a capture file'.format(path))
+        self._index = self._load_index(path + INDEX_SUFFIX)
+
+    @staticmethod
+    def _load_index(path):
+        """(ts_ns list, offset list) from the index file; empty if missing."""
+        try:
+            with open(path, 'rb') as fh:
+                raw = fh.read()
+        except OSError:
+            return [], []
+        if raw[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return [], []
+        body = raw[len(INDEX_MAGIC):]
+        body = body[:len(body) - len(body) % _INDEX.size]   # drop a torn entry
+        entries = list(_INDEX.iter_unpack(body))
+        return [ts for ts, _ in entries], [off for _, off in entries]
+
+    def wall_time(self, ts_ns):
+        """Convert a record's monotonic timestamp to seconds since the epoch."""
+        return (self.wall_ns + ts_ns - self.mono_ns) / 1e9
+
+    def offset_for(self, ts_ns):
+        """File offset of an indexed record at or before ``ts_ns``."""
+        times, offsets = self._index
+        lo, hi = 0, len(times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] <= ts_ns:
+                lo = mid + 1
+            else:
+                hi = mid
+        return offsets[lo - 1] if lo else _HEADER.size
+
+    def records(self, start_ns=None, end_ns=None):
+        """Yield the records with ``start_ns <= ts_ns < end_ns`` in file order.
+
+        A partly written last record (capture still running) is skipped.
+        """
+        offset = self.offset_for(start_ns) if start_ns is not None else _HEADER.size
+        size = len(self._map)
+        while offset + _RECORD.size <= size:
+            ts, direction, client, length = _RECORD.unpack_from(self._map, offset)
+            start = offset + _RECORD.size
+            if start + length > size:
+                return
+            offset = start + length
+            if start_ns is not None and ts < start_ns:
+                continue
+            if end_ns is not None and ts >= end_ns:
+                return
+            yield Record(ts, direction, client, self._view[start:start + length])
+
+    def __iter__(self):
+        return self.records()
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass    # record payloads still referenced: unmapped once they go
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
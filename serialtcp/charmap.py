@@ -0,0 +1,278 @@
+"""Character mappings applied to the serial byte streams (``--map``).
+
+The selected :data:`CHAR_MAPS` of one direction are compiled once into a
+:class:`CharMap`. Maps that only swap or drop single bytes become one
+``bytes.translate`` call; as soon as a multi-byte rule is involved, all rules
+of that direction are matched by one combined regex scan instead of one
+``bytes.replace`` pass per map.
+
+Every byte of the input is matched at most once (leftmost, longest rule
+first), so maps no longer feed into each other: with ``ICRNL,INLCRNL`` a
+``\\r`` becomes ``\\n``, not ``\\r\\n``. When two maps translate the same
+sequence, the one listed first wins.
+
+A chunk that ends with the beginning of a multi-byte rule (``\\r`` for
+OCRNLNL) keeps those bytes back until the next chunk shows whether the rule
+matches. :class:`MapStream` releases such a tail after :data:`HOLD_TIMEOUT`
+when no more data arrives, so an interactive Enter is never stuck; one
+thread releases the tails of all streams. That thread never waits: sinks are
+called outside the stream's lock, a tail that is due while the stream is busy
+is left for the busy writer to send, and its ``SendQueue`` puts grow the queue
+rather than block (:func:`serialtcp.client.never_wait`), so one stalled port
+cannot hold up the tails of the others.
+
+The held-back bytes belong to one byte stream: every TCP client writing to
+the device gets its own :meth:`CharMap.clone` and :class:`MapStream`, so a
+``\r`` from one client is never joined to the next client's ``\n``.
+"""
+
+import re
+import copy
+import time
+import threading
+from collections import deque
+
+from serialtcp.client import never_wait
+
+# Character mappings: name -> (direction, from_bytes, to_bytes)
+# I = input from device (serial RX), O = output to device (serial TX)
+CHAR_MAPS = {
+    'INLCRNL': ('input',  b'\n',   b'\r\n'),
+    'ICRNL':   ('input',  b'\r',   b'\n'),
+    'IGNCR':   ('input',  b'\r',   b''),
+    'IGNLF':   ('input',  b'\n',   b''),
+    'OCRNULNL':('output', b'\r\x00', b'\n'),
+    'OCRNLNL': ('output', b'\r\n', b'\n'),
+    'ONLCRNL': ('output', b'\n',   b'\r\n'),
+    'ONLCR':   ('output', b'\n',   b'\r'),
+    'OCRNL':   ('output', b'\r',   b'\n'),
+    'ODELBS':  ('output', b'\x7f', b'\x08'),
+    'OBSDEL':  ('output', b'\x08', b'\x7f'),
+}
+
+# How long MapStream holds a possible partial match before sending it as is.
+HOLD_TIMEOUT = 0.05
+
+
+class CharMap:
+    """A compiled set of ``(from_bytes, to_bytes)`` rules for one stream.
+
+    :meth:`feed` carries a partial multi-byte match over to the next call, so
+    use one instance per byte stream.
+    """
+
+    def __init__(self, rules):
+        self.rules = {}
+        for src, dst in rules:
+            self.rules.setdefault(bytes(src), bytes(dst))
+        # Proper prefixes of multi-byte rules: what a chunk may end with
+        # that the next chunk could complete.
+        self._prefixes = {src[:i] for src in self.rules for i in range(1, len(src))}
+        self._hold = max(map(len, self._prefixes), default=0)
+        self._pending = b''
+        if all(len(src) == 1 and len(dst) <= 1 for src, dst in self.rules.items()):
+            table = bytearray(range(256))
+            delete = bytearray()
+            for src, dst in self.rules.items():
+                if dst:
+                    table[src[0]] = dst[0]
+                else:
+                    delete += src
+            self._table, self._delete = bytes(table), bytes(delete)
+            self._pattern = None
+        else:
+            self._table = self._delete = None
+            self._pattern = re.compile(b'|'.join(
+                re.escape(src) for src in sorted(self.rules, key=len, reverse=True)))
+
+    def clone(self):
+        """The same compiled rules with nothing held back, for another stream."""
+        other = copy.copy(self)
+        other._pending = b''
+        return other
+
+    @property
+    def pending(self):
+        """Bytes held back as a possible start of a multi-byte rule."""
+        return len(self._pending)
+
+    def feed(self, data):
+        """Map one chunk; returns bytes (possibly empty)."""
+        if self._pattern is None:
+            return bytes(data).translate(self._table, self._delete)
+        buf = self._pending + data if self._pending else bytes(data)
+        end = len(buf)
+        out = []
+        pos = 0
+        held = None
+        for m in self._pattern.finditer(buf):
+            start = m.start()
+            # A longer rule might still match once the next chunk arrives.
+            if end - start <= self._hold and buf[start:] in self._prefixes:
+                held = start
+                break
+            out.append(buf[pos:start])
+            out.append(self.rules[m.group()])
+            pos = m.end()
+        if held is None:
+            held = end - self._partial(buf, pos)
+        out.append(buf[pos:held])
+        self._pending = buf[held:]
+        return b''.join(out)
+
+    def flush(self):
+        """Map and return the held-back bytes: no more data is coming."""
+        buf, self._pending = self._pending, b''
+        if not buf:
+            return b''
+        return self._pattern.sub(lambda m: self.rules[m.group()], buf)
+
+    def _partial(self, buf, pos):
+        """Length of the longest suffix of ``buf[pos:]`` that starts a rule."""
+        end = len(buf)
+        for size in range(min(self._hold, end - pos), 0, -1):
+            if buf[end - size:] in self._prefixes:
+                return size
+        return 0
+
+
+def compile_maps(names):
+    """Compile map names into ``(input_map, output_map)``; None when unused.
+
+    ``names`` is a list or a comma-separated string such as ``'ICRNL,ODELBS'``.
+    Raises ValueError naming an unknown map.
+    """
+    if isinstance(names, str):
+        names = names.split(',')
+    rules = {'input': [], 'output': []}
+    for name in names or ():
+        name = name.strip().upper()
+        if not name:
+            continue
+        if name not in CHAR_MAPS:
+            raise ValueError("Unknown map: {}, available: {}".format(name, ', '.join(CHAR_MAPS)))
+        direction, src, dst = CHAR_MAPS[name]
+        rules[direction].append((src, dst))
+    return (CharMap(rules['input']) if rules['input'] else None,
+            CharMap(rules['output']) if rules['output'] else None)
+
+
+class _Releaser:
+    """One daemon thread that releases the held-back bytes of every MapStream."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._due = {}          # MapStream -> monotonic deadline
+        self._thread = None
+
+    def schedule(self, stream, deadline):
+        with self._cond:
+            self._due[stream] = deadline
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='charmap-release',
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, stream):
+        with self._cond:
+            self._due.pop(stream, None)
+
+    def _run(self):
+        never_wait()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [(s, t) for s, t in self._due.items() if t <= now]
+                for stream, _ in due:
+                    del self._due[stream]
+                if not due:
+                    self._cond.wait(min(self._due.values()) - now if self._due else None)
+                    continue
+            for stream, deadline in due:
+                stream._release(deadline)
+
+
+_RELEASER = _Releaser()
+
+
+class MapStream:
+    """Pass a byte stream through a :class:`CharMap` on to ``sink(data)``.
+
+    Thread-safe; ``sink`` is called in stream order, outside the stream's
+    lock. A held-back partial match is released through ``sink`` after
+    :data:`HOLD_TIMEOUT` without new data. One instance per byte stream, like
+    its CharMap.
+    """
+
+    def __init__(self, charmap, sink, hold_timeout=HOLD_TIMEOUT):
+        self.charmap = charmap
+        self.sink = sink
+        self.hold_timeout = hold_timeout
+        self._cond = threading.Condition()
+        self._deadline = None   # when the held bytes go out; None: nothing held
+        self._outbox = deque()  # mapped chunks not yet handed to sink
+        self._queued = 0        # chunks ever put in the outbox ...
+        self._sent = 0          # ... and taken out of it again
+        self._draining = False  # a thread is calling sink
+
+    def write(self, data):
+        with self._cond:
+            out = self.charmap.feed(data)
+            if self.charmap.pending:
+                self._deadline = time.monotonic() + self.hold_timeout
+                _RELEASER.schedule(self, self._deadline)
+            elif self._deadline is not None:
+                self._deadline = None
+                _RELEASER.cancel(self)
+            if out:
+                self._deliver(out, wait=True)
+
+    def _release(self, deadline):
+        with self._cond:
+            # A write() since the deadline was set has moved or cleared it.
+            if deadline != self._deadline:
+                return
+            self._deadline = None
+            out = self.charmap.flush()
+            if out:
+                self._deliver(out, wait=False)
+
+    def _deliver(self, out, wait):
+        """Send ``out`` after the chunks queued before it (lock held).
+
+        The first thread to find nobody sending calls ``sink`` for the whole
+        outbox, releasing the lock around each call. Anyone else leaves its
+        chunk behind for that thread; with ``wait`` it then blocks until the
+        chunk has gone out, so writers still feel the sink's back-pressure.
+        """
+        self._outbox.append(out)
+        self._queued += 1
+        if self._draining:
+            if wait:
+                seq = self._queued
+                self._cond.wait_for(lambda: self._sent >= seq)
+            return
+        self._draining = True
+        try:
+            while self._outbox:
+                chunk = self._outbox.popleft()
+                self._cond.release()
+                try:
+                    self.sink(chunk)
+                finally:
+                    self._cond.acquire()
+                    self._sent += 1
+                    self._cond.notify_all()
+        finally:
+            self._draining = False
+
+    def close(self):
+        """Drop any held or undelivered bytes and cancel their release."""
+        with self._cond:
+            self._deadline = None
+            _RELEASER.cancel(self)
+            self.charmap.flush()
+            self._outbox.clear()
+            self._sent = self._queued
+            self._cond.notify_all()
@@ -1,8 +1,194 @@
+import re
+import time
 import socket
 import threading
 import logging
 from collections import deque
 
+# What to do when a client's outbound queue is full (the client reads slower
+# than the serial device produces):
+#   drop_oldest - discard the oldest queued bytes to make room
+#   disconnect  - drop the client
+#   block       - make the producer wait until the writer catches up, for at
+#                 most SLOW_CLIENT_BLOCK_TIMEOUT; then drop the client
+SLOW_CLIENT_DROP_OLDEST = 'drop_oldest'
+SLOW_CLIENT_DISCONNECT = 'disconnect'
+SLOW_CLIENT_BLOCK = 'block'
+SLOW_CLIENT_POLICIES = (SLOW_CLIENT_DROP_OLDEST, SLOW_CLIENT_DISCONNECT, SLOW_CLIENT_BLOCK)
+
+# Longest a 'block' producer (the serial receive path) waits for one client.
+SLOW_CLIENT_BLOCK_TIMEOUT = 2.0
+
+# Default bound of each client's outbound queue, in bytes.
+DEFAULT_SEND_QUEUE = 256 * 1024
+
+# Default size of one TCP read (was a fixed 1024).
+DEFAULT_RECV_BUFFER = 16 * 1024
+
+# Up-arrow + CR typed by a terminal: resend the previous command. A regex
+# rather than ``in`` so it also searches memoryviews without copying them.
+_UP_ARROW = re.compile(re.escape(b'\x1b[A\r'))
+
+# Zero-copy chunks longer than this (pastes, uploads) are not copied into the
+# up-arrow history; only typed commands are worth recalling.
+_HISTORY_MAX_CHUNK = 256
+
+# Threads that must never wait on a full 'block' queue because they serve
+# every mapping (the charmap releaser): their puts grow the queue instead,
+# as the event-loop thread's do.
+_producer = threading.local()
+
+
+def never_wait():
+    """Mark the calling thread: its ``SendQueue.put`` calls never block."""
+    _producer.never_wait = True
+
+
+class SendQueue():
+    """Bounded byte backlog between producers and one writer.
+
+    Used per TCP client (serial -> socket) and by SerialPort's TX writer
+    (clients -> device). ``put`` never blocks unless the policy is ``block``,
+    and then for at most ``block_timeout`` seconds (None: until there is
+    room); the writer drains the whole backlog in one go, so bursts are
+    coalesced into large writes.
+    """
+
+    def __init__(self, limit=DEFAULT_SEND_QUEUE, policy=SLOW_CLIENT_DROP_OLDEST,
+                 block_timeout=SLOW_CLIENT_BLOCK_TIMEOUT):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError("unknown slow-client policy {!r}, expected one of {}".format(
+                policy, ', '.join(SLOW_CLIENT_POLICIES)))
+        self.limit = limit
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0          # bytes discarded by drop_oldest / disconnect
+        self.closed = False
+        self._buf = bytearray()
+        self._busy = False        # writer is still writing what get() returned
+        self.cond = threading.Condition()
+        # Optional latency.Histogram of how long the oldest queued byte waits
+        # until it is written. Only recorded while holding ``cond``, which
+        # keeps it single-writer even when several threads call send_to().
+        self.latency = None
+        self._since_ns = 0        # when the queue last became non-empty
+        self._batch_ns = 0        # the same for the batch the writer holds
+
+    def __len__(self):
+        return len(self._buf)
+
+    def put(self, data, block=True, timeout=None):
+        """Queue ``data``; return False if the client has to be disconnected.
+
+        With ``block=False`` the ``block`` policy lets the queue grow past its
+        limit instead of waiting (used when the caller is the writer itself),
+        as it does for threads marked with :func:`never_wait`.
+        A ``block`` wait that runs out of ``block_timeout`` (or ``timeout``,
+        if given; 0 does not wait at all) drops ``data`` and returns False,
+        like ``disconnect``.
+        """
+        with self.cond:
+            if self.closed:
+                return True
+            if self.limit and len(self._buf) + len(data) > self.limit:
+                if self.policy == SLOW_CLIENT_DISCONNECT:
+                    self.dropped += len(data)
+                    return False
+                if self.policy == SLOW_CLIENT_DROP_OLDEST:
+                    excess = len(self._buf) + len(data) - self.limit
+                    self.dropped += excess
+                    if excess >= len(self._buf):
+                        data = data[excess - len(self._buf):]
+                        self._buf.clear()
+                    else:
+                        del self._buf[:excess]
+                elif block and not getattr(_producer, 'never_wait', False):
+                    room = self.cond.wait_for(
+                        lambda: (not self._buf or len(self._buf) + len(data) <= self.limit
+                                 or self.closed),
+                        self.block_timeout if timeout is None else timeout)
+                    if self.closed:
+                        return True
+                    if not room:
+                        self.dropped += len(data)
+                        return False
+            if self.latency is not None and not self._buf:
+                self._since_ns = time.perf_counter_ns()
+            self._buf += data
+            self.cond.notify_all()
+        return True
+
+    def get(self, timeout=None):
+        """Take the whole backlog (writer thread); b'' on timeout or close."""
+        with self.cond:
+            if not self._buf and not self.closed:
+                self.cond.wait(timeout)
+            data = bytes(self._buf)
+            self._buf.clear()
+            self._busy = bool(data)
+            self._batch_ns = self._since_ns if data else 0
+            self.cond.notify_all()
+        return data
+
+    def done(self):
+        """Writer: the data from the last ``get`` has been written."""
+        with self.cond:
+            if self.latency is not None and self._batch_ns:
+                self.latency.record(time.perf_counter_ns() - self._batch_ns)
+                self._batch_ns = 0
+            self._busy = False
+            self.cond.notify_all()
+
+    def requeue(self, data):
+        """Writer: put the unsent tail of the last ``get`` back at the head.
+
+        Under ``drop_oldest`` the queue is trimmed back to its limit from the
+        head, so a stalled reader loses the oldest bytes, and they are counted.
+        """
+        with self.cond:
+            if self.closed:
+                return
+            self._buf[:0] = data
+            if self._batch_ns:
+                self._since_ns = self._batch_ns
+                self._batch_ns = 0
+            if (self.policy == SLOW_CLIENT_DROP_OLDEST and self.limit
+                    and len(self._buf) > self.limit):
+                excess = len(self._buf) - self.limit
+                self.dropped += excess
+                del self._buf[:excess]
+            self._busy = False
+            self.cond.notify_all()
+
+    def flush(self, timeout):
+        """Wait up to ``timeout`` for the writer to write out the queue."""
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: (not self._buf and not self._busy) or self.closed, timeout)
+
+    def send_to(self, sock):
+        """Write as much as a non-blocking ``sock`` accepts; return bytes left.
+
+        Safe to call from several threads at once (the event loop and the
+        serial receive thread): the write and the latency sample are taken
+        under the queue lock.
+        """
+        with self.cond:
+            if self._buf:
+                with memoryview(self._buf) as view:
+                    sent = sock.send(view)
+                del self._buf[:sent]
+                if not self._buf and self.latency is not None and self._since_ns:
+                    self.latency.record(time.perf_counter_ns() - self._since_ns)
+                self.cond.notify_all()
+            return len(self._buf)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self._buf.clear()
+            self.cond.notify_all()
+
 
 class SerialClient():
     MAX_ERROR = 5
@@ -11,12 +197,23 @@ class SerialClient():
                  address,
                  on_disconnect=lambda self: None,
                  on_connect=lambda self: None,
-                 on_received=lambda data: None):
+                 on_received=lambda data: None,
+                 send_queue=DEFAULT_SEND_QUEUE,
+                 slow_client=SLOW_CLIENT_DROP_OLDEST,
+                 recv_buffer=DEFAULT_RECV_BUFFER,
+                 zero_copy=False):
         self.socket = client_socket
         self.address = address
         self.thread = None
+        self.writer_thread = None
+        self.queue = SendQueue(send_queue, slow_client)
         self._stop = False
-        self._buffersize = 1024
+        self._buffersize = recv_buffer
+        # Zero-copy mode: every read lands in one reusable buffer and is handed
+        # on as a memoryview that is only valid until the next read, so
+        # on_received callbacks must copy whatever they keep.
+        self._rx_buf = bytearray(recv_buffer) if zero_copy else None
+        self._rx_view = memoryview(self._rx_buf) if zero_copy else None
         self.logger = logging.getLogger("Client{}".format(address))
         self.err_cnt = 0
         try:
@@ -43,11 +240,23 @@ class SerialClient():
     def set_on_received(self, on_received):
         self._on_received = on_received
 
+    @property
+    def dropped_bytes(self):
+        """Bytes discarded because this client could not keep up."""
+        return self.queue.dropped
+
+    @property
+    def queued_bytes(self):
+        """Bytes waiting in the outbound queue."""
+        return len(self.queue)
+
     def start(self):
         self.logger.debug("start")
 
         self.err_cnt = 0
         self.thread = threading.Thread(target=SerialClient.run, args=(self, ), daemon=True)
+        self.writer_thread = threading.Thread(target=SerialClient.run_writer, args=(self, ), daemon=True)
+        self.writer_thread.start()
         self.thread.start()
 
     def on_received(self, data):
@@ -56,27 +265,55 @@ class SerialClient():
         Data received from TCP
         """
         self.logger.debug("received: {} bytes".format(len(data)))
-        if '\x1b[A\r'.encode() in data:
+        if _UP_ARROW.search(data):
             self.send(self.history.pop())
-        else:
+        elif not isinstance(data, memoryview):
             self.history.append(data)
+        elif len(data) <= _HISTORY_MAX_CHUNK:
+            self.history.append(bytes(data))
         self._on_received(data)
 
+    def recv(self):
+        """Read one chunk: bytes, or a view into the reusable zero-copy buffer."""
+        if self._rx_view is None:
+            return self.socket.recv(self._buffersize)
+        return self._rx_view[:self.socket.recv_into(self._rx_buf)]
+
     def send(self, data):
         """
-        Send from serial to the TCP socket
+        Queue data from serial for the TCP socket; the writer thread sends it
         :param data:
         :return:
         """
         self.logger.debug("send: {} bytes".format(len(data)))
-        try:
-            self.socket.sendall(data)
-        except Exception as e:
-            self.logger.exception("send failed: {}".format(e))
-            self.err_cnt += 1
+        if not self.queue.put(data):
+            self.logger.warning("send queue full ({} bytes), disconnecting".format(self.queue.limit))
+            self.stop()
+
+    def run_writer(self):
+        while True:
+            data = self.queue.get(timeout=2)
+            if self.queue.closed:
+                break
+            if not data:
+                continue
+            view = memoryview(data)
+            try:
+                while view:
+                    view = view[self.socket.send(view):]
+            except socket.timeout:
+                # The reader stalled: keep what is left queued instead of
+                # losing it; the slow-client policy decides what goes.
+                self.queue.requeue(view)
+                continue
+            except Exception as e:
+                self.logger.exception("send failed: {}".format(e))
+                self.err_cnt += 1
+            self.queue.done()
 
     def stop(self):
         self._stop = True
+        self.queue.close()
         try:
             self.socket.shutdown(socket.SHUT_RDWR)
         except Exception:
@@ -88,7 +325,7 @@ class SerialClient():
 
         while not self._stop:
             try:
-                data = self.socket.recv(self._buffersize)
+                data = self.recv()
                 if len(data):
                     self.on_received(data)
                 else:
@@ -103,5 +340,6 @@ class SerialClient():
                 self.logger.warning("error count > {}".format(self.MAX_ERROR))
                 self.stop()
         self.logger.debug("stop")
+        self.queue.close()
         self.socket.close()
         self._on_disconnect(self)
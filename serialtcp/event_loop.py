@@ -0,0 +1,208 @@
+"""Single-threaded selector loop shared by every event-driven mapping.
+
+The ``threads`` engine runs one accept thread per server, one receive thread
+per TCP client and one receive thread per serial port, each of which wakes up
+on a timeout. The ``selector`` engine instead registers all of those file
+descriptors with one :class:`EventLoop` per process and dispatches readiness
+callbacks from a single thread, so hundreds of clients cost no extra threads.
+
+Every change to the set of watched descriptors is applied on the loop thread:
+queued through :meth:`EventLoop.call_soon` in FIFO order, or inline when a
+callback makes it, once the calls queued before it have run. Either way a
+"remove fd 7" queued before an "add fd 7" (a port closed and reopened onto the
+same descriptor number) can never be reordered.
+"""
+
+import socket
+import logging
+import selectors
+import threading
+from collections import deque
+
+
+class EventLoop:
+    """Dispatch read/write readiness of registered files from one thread."""
+
+    def __init__(self, name='serialtcp-loop'):
+        self.logger = logging.getLogger('EventLoop')
+        self.name = name
+        self._selector = selectors.DefaultSelector()
+        self._calls = deque()
+        self._calls_lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+        self._in_calls = False   # the loop is running queued calls
+        # Self-pipe so call_soon() can interrupt a blocking select().
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, (self._drain_wakeup, None))
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        if self.running:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=3):
+        self._stop = True
+        self._wakeup()
+        if self._thread and not self.in_loop_thread():
+            self._thread.join(timeout=timeout)
+
+    # ------------------------------------------------------------ scheduling
+    def call_soon(self, fn, *args):
+        """Run ``fn(*args)`` on the loop thread (thread-safe, FIFO)."""
+        with self._calls_lock:
+            self._calls.append((fn, args))
+        if not self.in_loop_thread():
+            self._wakeup()
+
+    def call_sync(self, fn, *args, timeout=3):
+        """Run ``fn(*args)`` on the loop thread and wait for it to finish.
+
+        Runs inline when already on the loop thread. Returns the result, or
+        None if the loop did not get to it within ``timeout``.
+        """
+        if self.in_loop_thread() or not self.running:
+            return fn(*args)
+        done = threading.Event()
+        result = []
+
+        def runner():
+            try:
+                result.append(fn(*args))
+            finally:
+                done.set()
+
+        self.call_soon(runner)
+        if not done.wait(timeout):
+            self.logger.warning('loop call {} timed out'.format(getattr(fn, '__name__', fn)))
+            return None
+        return result[0] if result else None
+
+    # --------------------------------------------------------- registration
+    def add_reader(self, fileobj, callback):
+        self._apply(self._update, fileobj, 0, callback)
+
+    def remove_reader(self, fileobj):
+        self._apply(self._update, fileobj, 0, None)
+
+    def add_writer(self, fileobj, callback):
+        self._apply(self._update, fileobj, 1, callback)
+
+    def remove_writer(self, fileobj):
+        self._apply(self._update, fileobj, 1, None)
+
+    def remove(self, fileobj):
+        """Stop watching ``fileobj`` for both reading and writing."""
+        self._apply(self._unregister, fileobj)
+
+    def _apply(self, fn, *args):
+        if self.in_loop_thread():
+            # From a readiness callback, changes queued by other threads are
+            # older than this one; inside a queued call they already ran.
+            if not self._in_calls:
+                self._run_calls()
+            fn(*args)
+        else:
+            self.call_soon(fn, *args)
+
+    def _update(self, fileobj, slot, callback):
+        try:
+            key = self._selector.get_key(fileobj)
+            handlers = list(key.data)
+        except (KeyError, ValueError):
+            key = None
+            handlers = [None, None]
+        handlers[slot] = callback
+        events = ((selectors.EVENT_READ if handlers[0] else 0) |
+                  (selectors.EVENT_WRITE if handlers[1] else 0))
+        try:
+            if key is None:
+                if events:
+                    self._selector.register(fileobj, events, tuple(handlers))
+            elif events:
+                self._selector.modify(fileobj, events, tuple(handlers))
+            else:
+                self._selector.unregister(fileobj)
+        except (KeyError, ValueError, OSError) as e:
+            # A file closed before its (un)registration was processed.
+            self.logger.debug("update {} failed: {}".format(fileobj, e))
+
+    def _unregister(self, fileobj):
+        try:
+            self._selector.unregister(fileobj)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    # ------------------------------------------------------------------ loop
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # a wakeup is already pending
+
+    def _drain_wakeup(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_calls(self):
+        with self._calls_lock:
+            calls = list(self._calls)
+            self._calls.clear()
+        self._in_calls = True
+        try:
+            for fn, args in calls:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.logger.exception("loop call failed: {}".format(e))
+        finally:
+            self._in_calls = False
+
+    def _run(self):
+        self.logger.debug("started")
+        while not self._stop:
+            self._run_calls()
+            try:
+                ready = self._selector.select(timeout=None if not self._calls else 0)
+            except OSError as e:
+                self.logger.exception("select failed: {}".format(e))
+                continue
+            for key, mask in ready:
+                reader, writer = key.data
+                try:
+                    if mask & selectors.EVENT_READ and reader:
+                        reader()
+                    if mask & selectors.EVENT_WRITE and writer:
+                        writer()
+                except Exception as e:
+                    self.logger.exception("callback for {} failed: {}".format(key.fileobj, e))
+        self._run_calls()
+        self.logger.debug("stopped")
+
+
+_default_loop = None
+_default_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Return the process-wide loop, starting it on first use."""
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None:
+            _default_loop = EventLoop()
+        _default_loop.start()
+        return _default_loop
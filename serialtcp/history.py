@@ -0,0 +1,447 @@
+"""Console log events and their retained history, under one process-wide budget.
+
+Every :class:`~serialtcp.service.PortService` keeps its recent
+:class:`LogEvent` lines in a :class:`LogHistory` for re-rendering the console.
+The history holds no event objects: the bytes of all retained lines sit back
+to back in one bytearray arena, and their end offsets, stamps and kinds in
+three :mod:`array` columns. Every appended line gets the next sequence number,
+and :meth:`LogHistory.read_since` rebuilds only the events after a consumer's
+cursor, so the console, REST readers and file tailers each take just what is
+new. Dropping the oldest lines only moves the head; the dead front of the
+arena and the columns is cut off once it is half of them. The colour runs of
+lines with ANSI escapes (:attr:`LogEvent.segments`, worked out by the thread
+that logged them) are kept beside the arena by sequence number, packed into
+the line's text and one int per run, so events read back carry them and the
+console never parses a line twice. Plain lines keep no runs: they are one
+cleaned run, which :func:`~serialtcp.ansi.segment` makes without the parser
+when the console draws them.
+
+The count bound alone does not bound memory: a binary stream cut into
+4096-byte partial lines pins megabytes per mapping. All histories of the
+process therefore charge their bytes to one :class:`HistoryGovernor`. When the
+total goes over the budget, histories above their fair share (budget / number
+of histories) lose their oldest events, down to that share at most: the
+inactive ones (no console showing them) first, then the ones that were
+appended to least recently, until the total is back under the low-water mark.
+"""
+
+import sys
+import time
+import weakref
+import threading
+from array import array
+from collections import OrderedDict
+
+from serialtcp.ansi import segment
+
+# LogEvent kinds, stored as their index. The kind drives the colour the GUI
+# renders:
+#   conn   - TCP client connected / disconnected
+#   rx     - data received from the serial device
+#   tx     - data sent to the serial device
+#   status - lifecycle notices (listening, serial connected, stopped)
+#   retry  - reconnect attempts while the device is lost
+KINDS = ('conn', 'rx', 'tx', 'status', 'retry')
+KIND_IDS = {kind: i for i, kind in enumerate(KINDS)}
+
+# Wall-clock time at monotonic zero, to show the monotonic event stamps.
+_WALL_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+# Default process-wide budget for all console histories, bytes.
+DEFAULT_HISTORY_BUDGET = 64 * 1024 * 1024
+
+# Eviction frees down to this fraction of the budget, so the next appends do
+# not evict again right away.
+_LOW_WATER = 0.9
+
+# Bytes of one event in the columns: end offset, stamp, kind.
+_COLUMN_BYTES = 8 + 8 + 1
+
+# Kind column flag: the arena holds the UTF-8 text of a notice, not raw bytes.
+_NOTICE = 0x80
+
+# Per stored colour-run entry besides its text and marks: the two tuples, the
+# charged-size int and the OrderedDict slot (measured with tracemalloc).
+_RUNS_ENTRY_BYTES = 224
+
+# Dropped events are cut off the front once there are at least this many and
+# they are half of the columns.
+_COMPACT_MIN = 256
+
+
+class LogEvent:
+    """A single console log line.
+
+    Only what the I/O thread has at hand is stored: the kind index, a
+    ``time.monotonic_ns()`` stamp and, for rx/tx lines, ``raw``, the exact
+    bytes received/sent with their line terminator (for the GUI's hex view).
+    ``text`` is decoded from ``raw`` the first time it is read, and ``ts`` is
+    formatted on every read, so a mapping nobody watches never pays for
+    either. Synthetic status/conn/retry notices carry their text and no raw.
+    ``segments``, the colour runs, is worked out by :meth:`prepare` for lines
+    with escapes and on first read for the others.
+    """
+
+    __slots__ = ('kind_id', 'mono_ns', 'raw', '_text', '_segments')
+
+    def __init__(self, kind_id, mono_ns, raw=None, text=None, segments=None):
+        self.kind_id = kind_id
+        self.mono_ns = mono_ns
+        self.raw = raw
+        self._text = text
+        self._segments = segments
+
+    @property
+    def kind(self):
+        return KINDS[self.kind_id]
+
+    @property
+    def text(self):
+        text = self._text
+        if text is None:
+            # A line has one terminator and no CR/LF before it.
+            text = self._text = self.raw.rstrip(b'\r\n').decode('utf-8', 'replace')
+        return text
+
+    @property
+    def segments(self):
+        """``(chunk, sgr)`` colour runs of :attr:`text`, see :func:`serialtcp.ansi.segment`."""
+        segments = self._segments
+        if segments is None:
+            segments = self._segments = segment(self.text)
+        return segments
+
+    def prepare(self):
+        """Work out the colour runs now if the line has any escapes.
+
+        Called by the thread that logs the event, so the console does not
+        parse on the GUI thread; plain lines need no parsing at all.
+        """
+        raw = self.raw
+        if self._segments is None and (b'\x1b' in raw if raw is not None else '\x1b' in self._text):
+            self._segments = segment(self.text)
+
+    @property
+    def time(self):
+        """Wall-clock seconds since the epoch."""
+        return (self.mono_ns + _WALL_OFFSET_NS) / 1e9
+
+    @property
+    def ts(self):
+        """``HH:MM:SS:mmm`` local time, as the console shows it."""
+        ms = (self.mono_ns + _WALL_OFFSET_NS) // 1000000
+        return time.strftime('%H:%M:%S', time.localtime(ms // 1000)) + ':{:03d}'.format(ms % 1000)
+
+    def __reduce__(self):
+        # Pickled by the worker processes: text and runs only if worked out.
+        return LogEvent, (self.kind_id, self.mono_ns, self.raw, self._text, self._segments)
+
+    def __repr__(self):
+        return 'LogEvent({}, {!r})'.format(self.kind, self.text)
+
+
+def _pack_runs(runs):
+    """``(text, marks)`` for colour runs: their chunks joined, and per run its
+    end offset in ``text`` shifted left 8 bits, or'ed with its SGR code (0 for
+    the default colour)."""
+    marks = array('I')
+    end = 0
+    for chunk, sgr in runs:
+        end += len(chunk)
+        marks.append(end << 8 | (sgr or 0))
+    return ''.join(chunk for chunk, _sgr in runs), marks
+
+
+def _unpack_runs(packed):
+    """The ``(chunk, sgr)`` runs :func:`_pack_runs` packed."""
+    text, marks = packed
+    runs = []
+    start = 0
+    for mark in marks:
+        end = mark >> 8
+        runs.append((text[start:end], mark & 0xff or None))
+        start = end
+    return tuple(runs)
+
+
+class HistoryGovernor:
+    """Byte budget shared by every :class:`LogHistory` registered with it.
+
+    Histories are held weakly: a mapping that is dropped leaves the budget
+    with its last reference.
+    """
+
+    def __init__(self, budget=DEFAULT_HISTORY_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.evicted = 0                # events dropped to stay in budget
+        self._histories = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register(self, history):
+        with self._lock:
+            self._histories.add(history)
+
+    @property
+    def fair_share(self):
+        """Bytes each history may keep when all of them are busy."""
+        return self.budget // max(1, len(self._histories))
+
+    def charge(self, nbytes):
+        """Account ``nbytes`` more (or fewer) and evict when over budget.
+
+        The running total is updated without the lock: every line of every
+        mapping passes here. An update lost to a race only shifts when the
+        next eviction starts, which re-sums the histories first.
+        """
+        self.used += nbytes
+        if self.used > self.budget:
+            with self._lock:
+                if self.used > self.budget:
+                    self._evict_locked()
+
+    def set_budget(self, budget):
+        with self._lock:
+            self.budget = budget
+            if self.used > budget:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        histories = list(self._histories)
+        # Re-sum: histories of mappings that are gone took their bytes along.
+        self.used = sum(h.bytes for h in histories)
+        target = int(self.budget * _LOW_WATER)
+        share = self.budget // max(1, len(histories))
+        victims = sorted((h for h in histories if h.bytes > share),
+                         key=lambda h: (h.active, h.last_append))
+        for history in victims:
+            if self.used <= target:
+                break
+            freed, count = history.trim(max(share, history.bytes - (self.used - target)))
+            self.used -= freed
+            self.evicted += count
+
+
+class LogHistory:
+    """The last ``maxlen`` log events of one mapping, charged to ``governor``.
+
+    Events are numbered from 0 in append order; :attr:`first_seq` is the
+    oldest still held and :attr:`next_seq` the one the next append gets.
+    An event's colour runs, if it came with them, are kept (and charged at
+    the memory they take) until the event is dropped.
+    ``active`` marks a history a console is showing; the governor evicts it
+    last. Thread-safe: appended to by the I/O threads, read by the GUI and
+    the API.
+    """
+
+    def __init__(self, maxlen, governor=None):
+        self.maxlen = maxlen
+        self.governor = governor if governor is not None else GOVERNOR
+        self.bytes = 0
+        self.active = False
+        self.last_append = 0            # mono_ns of the newest event
+        self._arena = bytearray()
+        self._base = 0                  # stream offset of _arena[0]
+        self._ends = array('q')         # stream offset just past each event
+        self._stamps = array('q')       # mono_ns of each event
+        self._kinds = array('B')        # kind id, | _NOTICE for text
+        self._head = 0                  # column index of the oldest event held
+        self._seq0 = 0                  # sequence number of column index 0
+        self._segments = OrderedDict()  # seq -> (colour runs, bytes charged)
+        self._lock = threading.Lock()
+        self.governor.register(self)
+
+    def __len__(self):
+        return len(self._ends) - self._head
+
+    @property
+    def first_seq(self):
+        return self._seq0 + self._head
+
+    @property
+    def next_seq(self):
+        return self._seq0 + len(self._ends)
+
+    def append(self, event):
+        self.extend((event,))
+
+    def extend(self, events):
+        arena = self._arena
+        ends = self._ends
+        add_end, add_stamp, add_kind = ends.append, self._stamps.append, self._kinds.append
+        with self._lock:
+            size = len(arena)
+            base = self._base
+            count = len(ends)
+            seq = self._seq0 + count
+            runs = 0
+            for event in events:
+                raw = event.raw
+                if raw is None:
+                    arena += event.text.encode('utf-8')
+                    add_kind(event.kind_id | _NOTICE)
+                else:
+                    arena += raw
+                    add_kind(event.kind_id)
+                add_end(base + len(arena))
+                add_stamp(event.mono_ns)
+                if event._segments is not None:
+                    packed = _pack_runs(event._segments)
+                    cost = sys.getsizeof(packed[0]) + sys.getsizeof(packed[1]) + _RUNS_ENTRY_BYTES
+                    self._segments[seq] = (packed, cost)
+                    runs += cost
+                seq += 1
+            count = len(ends) - count
+            if not count:
+                return
+            self.last_append = self._stamps[-1]
+            delta = len(arena) - size + count * _COLUMN_BYTES + runs
+            excess = len(ends) - self._head - self.maxlen
+            if excess > 0:
+                delta -= self._drop_locked(excess)
+            self.bytes += delta
+        self.governor.charge(delta)
+
+    def read_since(self, seq, limit=None):
+        """``(events, next_seq)``: the events from ``seq`` on, oldest first.
+
+        At most ``limit`` events are returned. Events before
+        :attr:`first_seq` are gone; reading starts there instead. Pass the
+        returned ``next_seq`` to the next call to get only what is new.
+        """
+        with self._lock:
+            ends, stamps, kinds = self._ends, self._stamps, self._kinds
+            first = self._head
+            stop = len(ends)
+            i = min(max(seq - self._seq0, first), stop)
+            if limit is not None:
+                stop = min(stop, i + limit)
+            base = self._base
+            seq0 = self._seq0
+            runs = self._segments
+            events = []
+            with memoryview(self._arena) as arena:
+                start = ends[i - 1] - base if i else 0
+                for i in range(i, stop):
+                    end = ends[i] - base
+                    kind = kinds[i]
+                    if kind & _NOTICE:
+                        event = LogEvent(kind & ~_NOTICE, stamps[i],
+                                         text=str(arena[start:end], 'utf-8'))
+                    else:
+                        event = LogEvent(kind, stamps[i], bytes(arena[start:end]))
+                    if runs and seq0 + i in runs:
+                        event._segments = _unpack_runs(runs[seq0 + i][0])
+                    events.append(event)
+                    start = end
+            return events, self._seq0 + stop
+
+    def snapshot(self):
+        """Every retained event, oldest first."""
+        return self.read_since(0)[0]
+
+    def clear(self):
+        with self._lock:
+            freed = self._drop_locked(len(self._ends) - self._head)
+            self.bytes -= freed
+        self.governor.charge(-freed)
+
+    def trim(self, nbytes):
+        """Drop the oldest events until at most ``nbytes`` are held.
+
+        Called by the governor; returns ``(bytes freed, events dropped)``.
+        """
+        with self._lock:
+            ends = self._ends
+            runs = self._segments
+            seq = self.first_seq
+            start = ends[self._head - 1] if self._head else self._base
+            freed = count = 0
+            for end in ends[self._head:]:
+                if self.bytes - freed <= nbytes:
+                    break
+                freed += end - start + _COLUMN_BYTES
+                if runs and seq + count in runs:
+                    freed += runs[seq + count][1]
+                start = end
+                count += 1
+            freed = self._drop_locked(count)
+            self.bytes -= freed
+        return freed, count
+
+    def _drop_locked(self, count):
+        """Forget the ``count`` oldest events; returns their bytes."""
+        if count <= 0:
+            return 0
+        ends = self._ends
+        head = self._head
+        start = ends[head - 1] if head else self._base
+        head += count
+        freed = ends[head - 1] - start + count * _COLUMN_BYTES
+        runs = self._segments
+        if runs:
+            first = self._seq0 + head
+            # Keyed in append order: the dropped ones come first.
+            while runs and next(iter(runs)) < first:
+                freed += runs.popitem(last=False)[1][1]
+        if head == len(ends) or (head >= _COMPACT_MIN and head * 2 >= len(ends)):
+            # Cut the dead front off; amortised O(1) per dropped event.
+            cut = ends[head - 1]
+            del self._arena[:cut - self._base]
+            self._base = cut
+            del ends[:head]
+            del self._stamps[:head]
+            del self._kinds[:head]
+            self._seq0 += head
+            head = 0
+        self._head = head
+        return freed
+
+    def stats(self):
+        return {
+            'events': len(self),
+            'bytes': self.bytes,
+            'quota_bytes': self.governor.fair_share,
+            'active': self.active,
+            'next_seq': self.next_seq,
+        }
+
+
+class NullHistory:
+    """A :class:`LogHistory` stand-in that keeps nothing.
+
+    For a PortService whose events are only forwarded, e.g. in a worker
+    process whose parent keeps the history the console renders from. It is
+    not charged to any governor.
+    """
+
+    maxlen = 0
+    bytes = 0
+    active = False
+    last_append = 0
+    first_seq = next_seq = 0
+
+    def __len__(self):
+        return 0
+
+    def append(self, event):
+        pass
+
+    def extend(self, events):
+        pass
+
+    def read_since(self, seq, limit=None):
+        return [], 0
+
+    def snapshot(self):
+        return []
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'events': 0, 'bytes': 0, 'quota_bytes': 0, 'active': False, 'next_seq': 0}
+
+
+# The governor every history uses unless given another.
+GOVERNOR = HistoryGovernor()
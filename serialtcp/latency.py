@@ -0,0 +1,145 @@
+"""Per-chunk RX latency histograms (``latency_stats`` in a mapping).
+
+A chunk read from the serial device is stamped with ``perf_counter_ns`` as
+soon as the read returns, and the time it then spends in each stage of the
+RX path is recorded:
+
+    dispatch  read -> PortService (echo matching for wait_echo)
+    log       capture, log file and console line splitting
+    fanout    char maps and queueing for every TCP client
+    total     read -> queued for every client
+    send      oldest queued byte -> written to the client's socket
+
+:class:`Histogram` keeps power-of-two buckets and takes no lock, so it must
+have one writer at a time; readers may see a count a sample behind. The
+stage histograms are written by the serial receive thread. The send stage is
+written by whoever sends a client's queue, always under that queue's lock
+(``SendQueue.cond``), so every client has its own histogram and
+:class:`RxLatency` merges them when read.
+"""
+
+import threading
+
+# Bucket i counts durations of bit length i, i.e. below 2**i ns; the last
+# bucket takes everything from about 9 minutes on.
+BUCKETS = 40
+
+STAGES = ('dispatch', 'log', 'fanout', 'total', 'send')
+
+
+class Histogram:
+    """Durations in nanoseconds, in power-of-two buckets.
+
+    Not thread-safe: callers serialise :meth:`record` themselves.
+    """
+
+    __slots__ = ('counts', 'count', 'sum_ns', 'max_ns')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        if ns < 0:
+            ns = 0
+        self.counts[min(ns.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other):
+        """Add ``other``'s samples to this histogram."""
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.sum_ns += other.sum_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def copy(self):
+        h = Histogram()
+        h.merge(self)
+        return h
+
+    def percentile(self, q):
+        """Upper bound in ns of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(1 << i, self.max_ns)
+        return self.max_ns
+
+    def stats(self):
+        """Summary in microseconds plus the non-empty ``[le_us, count]`` buckets."""
+        count = self.count
+        return {
+            'count': count,
+            'sum_us': round(self.sum_ns / 1000, 3),
+            'mean_us': round(self.sum_ns / count / 1000, 3) if count else None,
+            'p50_us': _us(self.percentile(0.5)),
+            'p99_us': _us(self.percentile(0.99)),
+            'max_us': _us(self.max_ns) if count else None,
+            'buckets': [[(1 << i) / 1000, n] for i, n in enumerate(self.counts) if n],
+        }
+
+
+def _us(ns):
+    return None if ns is None else round(ns / 1000, 3)
+
+
+class RxLatency:
+    """The stage histograms of one mapping.
+
+    :meth:`record` is called by the serial receive thread only. Client send
+    histograms come from :meth:`client_histogram` and are folded in by
+    :meth:`release_client` when the client goes.
+    """
+
+    def __init__(self):
+        self.dispatch = Histogram()
+        self.log = Histogram()
+        self.fanout = Histogram()
+        self.total = Histogram()
+        self._lock = threading.Lock()    # guards the client set, not recording
+        self._clients = set()
+        self._closed_send = Histogram()
+
+    def record(self, read_ns, entered_ns, logged_ns, queued_ns):
+        self.dispatch.record(entered_ns - read_ns)
+        self.log.record(logged_ns - entered_ns)
+        self.fanout.record(queued_ns - logged_ns)
+        self.total.record(queued_ns - read_ns)
+
+    def client_histogram(self):
+        """A send-stage histogram for a new client's writer."""
+        hist = Histogram()
+        with self._lock:
+            self._clients.add(hist)
+        return hist
+
+    def release_client(self, hist):
+        with self._lock:
+            if hist in self._clients:
+                self._clients.discard(hist)
+                self._closed_send.merge(hist)
+
+    def send(self):
+        """The send stage over all clients, past and present."""
+        with self._lock:
+            merged = self._closed_send.copy()
+            for hist in self._clients:
+                merged.merge(hist)
+        return merged
+
+    def stats(self):
+        """``{stage: Histogram.stats()}`` for every stage."""
+        hists = {'dispatch': self.dispatch, 'log': self.log, 'fanout': self.fanout,
+                 'total': self.total, 'send': self.send()}
+        return {stage: hists[stage].stats() for stage in STAGES}
@@ -0,0 +1,77 @@
+"""Formatters for the serial I/O log files, run in batches by the LogWriter.
+
+The I/O threads only queue ``(direction, time, bytes)`` or ``(time, text)``
+records; the :class:`~serialtcp.logwriter.LogWriter` thread turns a whole
+batch into text with one of these formatters. The hex column comes from
+``bytes.hex(' ')`` and the printable column from one ``bytes.translate``, so
+no Python code runs per byte, and the timestamp text is rebuilt only when the
+millisecond changes.
+"""
+
+import time
+
+# Printable view of a byte: itself for ASCII 32..126, '.' otherwise.
+_PRINTABLE = bytes(b if 32 <= b < 127 else ord('.') for b in range(256))
+
+
+class TimestampCache:
+    """``time.strftime(fmt)`` plus milliseconds, cached per millisecond.
+
+    The strftime part is recomputed only when the second changes.
+    """
+
+    def __init__(self, fmt, ms_fmt='.{:03d}'):
+        self.fmt = fmt
+        self.ms_fmt = ms_fmt
+        self._sec = None
+        self._ms = None
+        self._prefix = ''
+        self._text = ''
+
+    def __call__(self, t):
+        ms = int(t * 1000)
+        if ms != self._ms:
+            sec = ms // 1000
+            if sec != self._sec:
+                self._sec = sec
+                self._prefix = time.strftime(self.fmt, time.localtime(sec))
+            self._ms = ms
+            self._text = self._prefix + self.ms_fmt.format(ms % 1000)
+        return self._text
+
+
+def hex_record_size(data):
+    """Approximate formatted size of a hex record, for the writer's budget."""
+    return 4 * len(data) + 48
+
+
+class HexRecordFormatter:
+    """``(direction, time, data)`` records -> the CLI's ``--log`` lines::
+
+        [2024-01-31 12:00:00.123] RX 3: 61 62 0d | ab.
+    """
+
+    def __init__(self):
+        self.timestamp = TimestampCache('%Y-%m-%d %H:%M:%S', '.{:03d}')
+
+    def __call__(self, records):
+        ts = self.timestamp
+        return ''.join([
+            '[{}] {} {}: {} | {}\n'.format(
+                ts(t), direction, len(data), data.hex(' '),
+                data.translate(_PRINTABLE).decode('ascii'))
+            for direction, t, data in records])
+
+
+class TextRecordFormatter:
+    """``(time, text)`` records -> PortService log lines::
+
+        [31.01.24 12:00:00:123] text
+    """
+
+    def __init__(self):
+        self.timestamp = TimestampCache('[%d.%m.%y %H:%M:%S', ':{:03d}]')
+
+    def __call__(self, records):
+        ts = self.timestamp
+        return ''.join(['{} {}\n'.format(ts(t), text) for t, text in records])
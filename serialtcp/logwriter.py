@@ -0,0 +1,258 @@
+"""Background writer for the serial I/O log files.
+
+Writing and flushing the log once per chunk or line put thousands of
+``write``/``flush`` syscalls per second on the RX/TX threads at high baud, and
+any disk stall stalled the data path with them. :class:`LogWriter` queues the
+records instead and a background thread commits them in groups: as soon as
+``flush_bytes`` are waiting or the oldest record is ``flush_interval`` old.
+With ``fsync_interval`` the file is also fsynced at most that often.
+
+``write`` never blocks on the disk; if the queue grows beyond ``max_queue``
+bytes (disk much slower than the serial line) records are dropped and
+counted.
+
+With a ``formatter`` the queued records need not be text: the writer thread
+calls ``formatter(records)`` once per batch to render them (see
+:mod:`serialtcp.logformat`), which keeps the formatting off the I/O threads
+as well. With ``binary`` the file is opened in binary mode and records
+(or the formatter's output) are bytes.
+
+A batch that cannot be written completely (e.g. disk full) is cut off the
+file again and counted as dropped, so the file only ever holds whole
+batches. ``on_commit()`` runs on the writer thread after each batch that
+made it to the file, ``on_close()`` after the file is closed.
+"""
+
+import os
+import time
+import logging
+import threading
+
+DEFAULT_FLUSH_INTERVAL = 0.2
+DEFAULT_FLUSH_BYTES = 64 * 1024
+DEFAULT_MAX_QUEUE = 8 * 1024 * 1024
+
+_log = logging.getLogger('LogWriter')
+
+
+class LogWriter:
+    """Append text records to ``path`` from a background thread.
+
+    Opens the file at once, so an unwritable path raises OSError here rather
+    than on the writer thread.
+    """
+
+    def __init__(self, path,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 flush_bytes=DEFAULT_FLUSH_BYTES,
+                 fsync_interval=0.0,
+                 max_queue=DEFAULT_MAX_QUEUE,
+                 formatter=None,
+                 binary=False,
+                 on_commit=None,
+                 on_close=None):
+        self.path = path
+        self.formatter = formatter
+        self.on_commit = on_commit
+        self.on_close = on_close
+        self._binary = binary
+        self._empty = b'' if binary else ''
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        self._fh = self._open()
+        self._size = os.fstat(self._fh.fileno()).st_size   # end of the last whole batch
+        self._cond = threading.Condition()
+        self._records = []
+        self._queued = 0          # bytes in _records
+        self._first_at = 0.0      # enqueue time of the oldest queued record
+        self._enqueued = 0        # records accepted so far
+        self._committed = 0       # records handed to the OS so far
+        self._closed = False
+        self._urgent = False      # flush() is waiting: commit without delay
+        self._dirty = False       # written since the last fsync
+        self._last_sync = time.monotonic()
+        # statistics
+        self.written_bytes = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.dropped = 0
+        self.last_latency = None  # oldest record's wait until it was flushed
+        self.max_latency = None
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, record, size=None):
+        """Queue ``record``; returns False if it was dropped.
+
+        ``record`` is text, or whatever the formatter takes; ``size`` is its
+        (approximate) formatted size, by default ``len(record)``.
+        """
+        if size is None:
+            size = len(record)
+        with self._cond:
+            if self._closed:
+                return False
+            if self._queued + size > self.max_queue:
+                self.dropped += 1
+                return False
+            if not self._records:
+                self._first_at = time.monotonic()
+                self._cond.notify()
+            self._records.append(record)
+            self._queued += size
+            self._enqueued += 1
+            if self._queued >= self.flush_bytes:
+                self._cond.notify()
+        return True
+
+    def flush(self, timeout=5.0):
+        """Wait until every record queued so far has been written."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            if self._committed < target:
+                self._urgent = True
+                self._cond.notify_all()
+            while self._committed < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Write what is queued, fsync if configured, and close the file.
+
+        Returns False if the writer thread is still busy after ``timeout``;
+        it then finishes and closes the file on its own.
+        """
+        with self._cond:
+            if not self._closed:
+                self._closed = True
+                self._cond.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def queue_depth(self):
+        """Records waiting to be written."""
+        return len(self._records)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._records),
+                'queued_bytes': self._queued,
+                'written_bytes': self.written_bytes,
+                'flushes': self.flushes,
+                'fsyncs': self.fsyncs,
+                'dropped': self.dropped,
+                'last_flush_latency_s': self.last_latency,
+                'max_flush_latency_s': self.max_latency,
+            }
+
+    # ------------------------------------------------------------ writer
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._records:
+                    timeout = self._sync_due() if self._dirty else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                while (not self._closed and not self._urgent and self._records
+                       and self._queued < self.flush_bytes):
+                    remaining = self._first_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                records, self._records = self._records, []
+                self._queued = 0
+                self._urgent = False
+                first_at = self._first_at
+                closing = self._closed
+            if records:
+                self._commit(records, first_at)
+            due = self._sync_due()
+            if self._dirty and (closing or (due is not None and due <= 0)):
+                self._fsync()
+            if closing:
+                try:
+                    self._fh.close()
+                except OSError:
+                    pass
+                if self.on_close is not None:
+                    self._hook(self.on_close)
+                return
+
+    def _sync_due(self):
+        """Seconds until the next fsync is due; None when fsync is off."""
+        if not self.fsync_interval:
+            return None
+        return self._last_sync + self.fsync_interval - time.monotonic()
+
+    def _open(self):
+        return open(self.path, 'ab') if self._binary else open(self.path, 'a', encoding='utf-8')
+
+    def _commit(self, records, first_at):
+        try:
+            text = self.formatter(records) if self.formatter else self._empty.join(records)
+            self._fh.write(text)
+            self._fh.flush()
+        except Exception as e:
+            _log.error('writing {} failed: {}'.format(self.path, e))
+            self._rollback()
+            failed = True
+        else:
+            self._size = os.fstat(self._fh.fileno()).st_size
+            latency = time.monotonic() - first_at
+            self.last_latency = latency
+            if self.max_latency is None or latency > self.max_latency:
+                self.max_latency = latency
+            self.written_bytes += len(text)
+            self.flushes += 1
+            self._dirty = bool(self.fsync_interval)
+            if self.on_commit is not None:
+                self._hook(self.on_commit)
+            failed = False
+        with self._cond:
+            if failed:
+                self.dropped += len(records)
+            self._committed += len(records)
+            self._cond.notify_all()
+
+    def _rollback(self):
+        """Cut a partly written batch off the file and reopen it.
+
+        Closing drops what is left in the file object's buffer; reopening
+        appends after the last whole batch again.
+        """
+        try:
+            self._fh.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            os.truncate(self.path, self._size)
+        except OSError as e:
+            _log.error('truncating {} failed: {}'.format(self.path, e))
+        try:
+            self._fh = self._open()
+        except OSError as e:
+            _log.error('reopening {} failed: {}'.format(self.path, e))
+
+    def _hook(self, fn):
+        try:
+            fn()
+        except Exception:
+            _log.exception('{} hook failed'.format(self.path))
+
+    def _fsync(self):
+        try:
+            os.fsync(self._fh.fileno())
+            self.fsyncs += 1
+        except (OSError, ValueError) as e:
+            _log.error('fsync {} failed: {}'.format(self.path, e))
+        self._dirty = False
+        self._last_sync = time.monotonic()
@@ -0,0 +1,214 @@
+"""Selector-driven counterparts of :class:`SerialServer`/:class:`SerialClient`.
+
+:class:`LoopServer` keeps the constructor, callbacks and public methods of
+:class:`~serialtcp.server.SerialServer`, but its listening socket and every
+accepted client are non-blocking and serviced by the shared
+:class:`~serialtcp.event_loop.EventLoop` instead of an accept thread plus one
+thread per client. Pick it with ``engine='selector'`` in
+:func:`~serialtcp.server.create_server`.
+"""
+
+import socket
+import logging
+import threading
+
+from serialtcp.client import SerialClient, DEFAULT_SEND_QUEUE, SLOW_CLIENT_DROP_OLDEST, DEFAULT_RECV_BUFFER
+from serialtcp.event_loop import get_event_loop
+from serialtcp.server import flush_clients
+
+
+class LoopClient(SerialClient):
+    """A TCP client whose socket is serviced by an :class:`EventLoop`.
+
+    ``send`` may be called from any thread: it queues the data, writes what
+    the kernel accepts right away and leaves the rest to the loop, which
+    flushes it once the socket becomes writable again.
+    """
+
+    def __init__(self, client_socket: socket.socket, address, loop=None, **kwargs):
+        super().__init__(client_socket, address, **kwargs)
+        self.loop = loop or get_event_loop()
+        self.socket.setblocking(False)
+        self._closed = False
+
+    def start(self):
+        self.logger.debug("start")
+        self.err_cnt = 0
+        self.loop.call_soon(self._attach)
+
+    def _attach(self):
+        self.logger.info('connected')
+        self._on_connect(self)
+        if not self._closed:
+            self.loop.add_reader(self.socket, self._on_readable)
+
+    def _on_readable(self):
+        if self._closed:
+            return
+        try:
+            data = self.recv()
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception as e:
+            self.logger.exception("receive failed: {}".format(e))
+            self.err_cnt += 1
+        else:
+            if len(data):
+                self.on_received(data)
+            else:
+                self.logger.info("disconnected")
+                self._close()
+                return
+        if self.err_cnt > self.MAX_ERROR:
+            self.logger.warning("error count > {}".format(self.MAX_ERROR))
+            self._close()
+
+    def send(self, data):
+        """
+        Queue data from serial for the TCP socket without waiting for the peer
+        :param data:
+        :return:
+        """
+        self.logger.debug("send: {} bytes".format(len(data)))
+        if self._closed:
+            return
+        # The loop thread must never wait on itself: a full 'block' queue
+        # grows instead when the producer is the loop (e.g. the serial fd).
+        if not self.queue.put(data, block=not self.loop.in_loop_thread()):
+            self.logger.warning("send queue full ({} bytes), disconnecting".format(self.queue.limit))
+            self.stop()
+            return
+        if self._flush():
+            self.loop.add_writer(self.socket, self._on_writable)
+
+    def _flush(self):
+        """Write what the socket accepts now; return the bytes still queued."""
+        try:
+            return self.queue.send_to(self.socket)
+        except (BlockingIOError, InterruptedError):
+            return len(self.queue)
+        except Exception as e:
+            self.logger.exception("send failed: {}".format(e))
+            self.err_cnt += 1
+            return 0
+
+    def _on_writable(self):
+        if self._closed or not self._flush():
+            self.loop.remove_writer(self.socket)
+
+    def stop(self):
+        self._stop = True
+        self.loop.call_soon(self._close)
+
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.close()
+        self.logger.debug("stop")
+        self.loop.remove(self.socket)
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        self.socket.close()
+        self._on_disconnect(self)
+
+    def run(self):
+        raise RuntimeError('LoopClient is driven by its event loop; use start()')
+
+
+class LoopServer():
+    def __init__(self, port,
+                 host='',
+                 on_tcp_receive=lambda data: None,
+                 on_client_connect=lambda client: None,
+                 on_client_disconnect=lambda client: None,
+                 send_queue=DEFAULT_SEND_QUEUE,
+                 slow_client=SLOW_CLIENT_DROP_OLDEST,
+                 recv_buffer=DEFAULT_RECV_BUFFER,
+                 zero_copy=False,
+                 loop=None):
+        self.logger = logging.getLogger('Server {}'.format(port))
+        self.port = port
+        self.host = host
+        self.loop = loop or get_event_loop()
+        self.__stop = False
+        self.clients = set()
+        self.ready = threading.Event()
+        self.socket = socket.socket()
+        self.client_on_recv = on_tcp_receive
+        self.on_client_connect = on_client_connect
+        self.on_client_disconnect = on_client_disconnect
+        self.send_queue = send_queue
+        self.slow_client = slow_client
+        self.recv_buffer = recv_buffer
+        self.zero_copy = zero_copy
+        self.dropped_closed = 0   # dropped bytes of clients that have left
+        self.lock = threading.Lock()
+
+    def __remove_client(self, client: LoopClient):
+        with self.lock:
+            self.clients.discard(client)
+            self.dropped_closed += client.dropped_bytes
+        self.logger.debug("client disconnected: {}, remaining: {}".format(client.address, len(self.clients)))
+        self.on_client_disconnect(client)
+
+    def __on_accept(self):
+        try:
+            client_socket, address = self.socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception as e:
+            if not self.__stop:
+                self.logger.exception("accept client failed: {}".format(e))
+            return
+        client = LoopClient(client_socket, address,
+                            loop=self.loop,
+                            on_disconnect=self.__remove_client,
+                            on_connect=self.on_client_connect,
+                            on_received=self.client_on_recv,
+                            send_queue=self.send_queue,
+                            slow_client=self.slow_client,
+                            recv_buffer=self.recv_buffer,
+                            zero_copy=self.zero_copy)
+        with self.lock:
+            self.clients.add(client)
+        self.logger.debug("client connected: {}, total: {}".format(address, len(self.clients)))
+        client.start()
+
+    def __close_all(self):
+        self.loop.remove(self.socket)
+        self.socket.close()
+        for client in self.get_clients():
+            client._close()
+
+    def stop(self):
+        self.logger.debug("stopping server, {} clients connected".format(len(self.clients)))
+        self.__stop = True
+        if not self.loop.in_loop_thread():
+            flush_clients(self.get_clients())
+        self.loop.call_sync(self.__close_all)
+
+    def get_clients(self):
+        with self.lock:
+            ret = set(self.clients)
+        return ret
+
+    def send_to_all(self, data):
+        for client in self.get_clients():
+            client.send(data)
+
+    @property
+    def dropped_bytes(self):
+        """Bytes dropped for slow clients since the server started."""
+        return self.dropped_closed + sum(c.dropped_bytes for c in self.get_clients())
+
+    def run(self):
+        self.logger.debug("Server: Run")
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(16)
+        self.socket.setblocking(False)
+        self.loop.add_reader(self.socket, self.__on_accept)
+        self.ready.set()
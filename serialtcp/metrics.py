@@ -0,0 +1,246 @@
+"""Prometheus text exposition of the mappings' counters and gauges.
+
+:func:`render` turns PortService-like objects (a
+:class:`~serialtcp.service.PortService`, a worker
+:class:`~serialtcp.workers.ServiceProxy`, or the headless CLI's stats) into
+the Prometheus text format. Scrapes are served from a :class:`MetricsCache`
+that re-renders in its own thread, so a scrape never waits on, or runs code
+in, the GUI or the data path; the values are at most ``interval`` old.
+
+The Port Manager serves it as ``GET /metrics`` on its REST API; headless
+``serial-tcp-server --metrics-port PORT`` serves it with :class:`MetricsServer`,
+which needs nothing beyond the standard library.
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from serialtcp.latency import STAGES
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_INTERVAL = 1.0
+
+# Latency histogram bounds: the power-of-two buckets from ~1us to ~1s.
+_LATENCY_BOUNDS_NS = [1 << i for i in range(10, 31)]
+
+_STATES = ('stopped', 'running', 'reconnecting')
+
+_log = logging.getLogger('Metrics')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class _Family:
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples = []
+
+    def add(self, labels, value, suffix=''):
+        if value is not None:
+            self.samples.append('{}{}{} {}'.format(self.name, suffix, _labels(labels), _number(value)))
+
+    def lines(self):
+        if not self.samples:
+            return []
+        return (['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)] + self.samples)
+
+
+def _writer_samples(families, labels, writer, stats):
+    if not stats:
+        return
+    labels = labels + [('writer', writer)]
+    families['writer_queue_records'].add(labels, stats['queue_depth'])
+    families['writer_queued_bytes'].add(labels, stats['queued_bytes'])
+    families['writer_written_bytes'].add(labels, stats['written_bytes'])
+    families['writer_dropped'].add(labels, stats['dropped'])
+    families['writer_flush_latency_seconds'].add(labels, stats['max_flush_latency_s'])
+
+
+def _latency_samples(family, labels, stats):
+    if not stats:
+        return
+    for stage in STAGES:
+        hist = stats[stage]
+        stage_labels = labels + [('stage', stage)]
+        cumulative = 0
+        buckets = iter(hist['buckets'])
+        pending = next(buckets, None)
+        for bound in _LATENCY_BOUNDS_NS:
+            while pending is not None and round(pending[0] * 1000) <= bound:
+                cumulative += pending[1]
+                pending = next(buckets, None)
+            family.add(stage_labels + [('le', repr(bound / 1e9))], cumulative, '_bucket')
+        family.add(stage_labels + [('le', '+Inf')], hist['count'], '_bucket')
+        family.add(stage_labels, hist['sum_us'] / 1e6, '_sum')
+        family.add(stage_labels, hist['count'], '_count')
+
+
+def render(services, console=None):
+    """Prometheus text for ``services``; one label set per mapping.
+
+    ``console`` is the GUI console's render stats
+    (:meth:`~serialtcp_gui.console.ConsoleStats.stats`), if there is one.
+    """
+    families = {}
+
+    def family(key, kind, help_text):
+        families[key] = _Family('serialtcp_' + key + ('_total' if kind == 'counter' else ''),
+                                kind, help_text)
+
+    family('status', 'gauge', '1 for the state the mapping is in.')
+    family('serial_connected', 'gauge', '1 while the serial device is open.')
+    family('clients', 'gauge', 'Connected TCP clients.')
+    family('uptime_seconds', 'gauge', 'Seconds since the mapping was started.')
+    family('rx_bytes', 'counter', 'Bytes read from the serial device since start.')
+    family('tx_bytes', 'counter', 'Bytes written to the serial device since start.')
+    family('dropped_bytes', 'counter', 'Serial bytes dropped for slow clients since start.')
+    family('reconnect_attempts', 'gauge', 'Reconnect attempts since the device was lost.')
+    family('echo_mismatches', 'counter', 'wait_echo: received bytes that did not match the echo.')
+    family('echo_timeouts', 'counter', 'wait_echo: characters whose echo did not arrive in time.')
+    family('client_queued_bytes', 'gauge', 'Bytes waiting in all client send queues.')
+    family('client_queued_bytes_max', 'gauge', 'Fullest client send queue, in bytes.')
+    family('writer_queue_records', 'gauge', 'Records waiting for the log or capture writer.')
+    family('writer_queued_bytes', 'gauge', 'Size of the records waiting for the writer.')
+    family('writer_written_bytes', 'counter', 'Bytes written to the log or capture file.')
+    family('writer_dropped', 'counter', 'Records dropped because the disk fell behind.')
+    family('writer_flush_latency_seconds', 'gauge', 'Longest wait of a record for the disk.')
+    family('history_bytes', 'gauge', 'Estimated memory held by the retained console lines.')
+    family('rx_latency_seconds', 'histogram', 'RX chunk time per stage (latency_stats).')
+    family('console_lag_seconds', 'gauge', 'Age of the newest console line when it was drawn.')
+    family('console_lag_seconds_max', 'gauge', 'Largest console lag since the GUI started.')
+    family('console_rendered_lines', 'counter', 'Lines drawn in the GUI console.')
+    family('console_skipped_lines', 'counter', 'Lines the GUI console skipped to catch up.')
+
+    for service in services:
+        config = service.config
+        labels = [('tcp_port', config.tcp_port), ('device', config.device), ('name', config.name)]
+        status = service.status
+        for state in _STATES:
+            families['status'].add(labels + [('state', state)], status == state)
+        families['serial_connected'].add(labels, service.serial_connected)
+        families['clients'].add(labels, service.client_count)
+        families['uptime_seconds'].add(labels, round(service.uptime, 3))
+        families['rx_bytes'].add(labels, service.rx_total)
+        families['tx_bytes'].add(labels, service.tx_total)
+        families['dropped_bytes'].add(labels, service.dropped_total)
+        families['reconnect_attempts'].add(labels, service.reconnect_attempt)
+        families['echo_mismatches'].add(labels, service.echo_mismatches)
+        families['echo_timeouts'].add(labels, service.echo_timeouts)
+        queued = [c['queued_bytes'] for c in service.client_stats()]
+        families['client_queued_bytes'].add(labels, sum(queued))
+        families['client_queued_bytes_max'].add(labels, max(queued, default=0))
+        history = service.history_stats()
+        if history:
+            families['history_bytes'].add(labels, history['bytes'])
+        _writer_samples(families, labels, 'log', service.log_stats())
+        _writer_samples(families, labels, 'capture', service.capture_stats())
+        _latency_samples(families['rx_latency_seconds'], labels, service.latency_stats())
+
+    if console:
+        families['console_lag_seconds'].add([], console['lag_s'])
+        families['console_lag_seconds_max'].add([], console['max_lag_s'])
+        families['console_rendered_lines'].add([], console['rendered_lines'])
+        families['console_skipped_lines'].add([], console['skipped_lines'])
+
+    lines = []
+    for fam in families.values():
+        lines.extend(fam.lines())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsCache:
+    """Latest :func:`render` output of ``source()``, refreshed every ``interval``.
+
+    The refresh thread starts with the first :meth:`text` call, so nothing
+    runs until someone scrapes.
+    """
+
+    def __init__(self, source, interval=DEFAULT_INTERVAL, console=None):
+        self.source = source
+        self.console = console          # callable -> console render stats
+        self.interval = interval
+        self._text = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def text(self):
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._refresh()
+                self._thread = threading.Thread(target=self._run, name='metrics-cache', daemon=True)
+                self._thread.start()
+            return self._text or ''
+
+    def _refresh(self):
+        try:
+            self._text = render(self.source(), self.console() if self.console else None)
+        except Exception:
+            _log.exception('rendering metrics failed')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._refresh()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.cache.text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        _log.debug(fmt, *args)
+
+
+class MetricsServer:
+    """Serve ``GET /metrics`` from ``cache`` on ``host:port`` in a daemon thread.
+
+    Binds in the constructor, so a port in use raises OSError right away.
+    """
+
+    def __init__(self, cache, port, host='127.0.0.1'):
+        self.cache = cache
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.cache = cache
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.cache.close()
@@ -0,0 +1,98 @@
+"""Inter-character pacing for ``char_delay`` transmission.
+
+``time.sleep`` alone overshoots by the scheduler tick (often 1 ms or more), so
+a requested 0.5 ms gap came out several times longer, and the per-byte error
+accumulated. :class:`Pacer` instead keeps an absolute schedule on
+``time.perf_counter``: it sleeps until shortly before each deadline and spins
+for the rest, and a late character shortens the next gap rather than pushing
+the whole stream back.
+
+When the interval is shorter than :data:`BURST_PERIOD`, an optional burst
+mode sends several characters per write and paces the bursts instead, which
+keeps the requested average rate with far fewer syscalls.
+"""
+
+import math
+import time
+
+# Sleep until this close to a deadline, then spin on the clock.
+SPIN_THRESHOLD = 0.002
+
+# Shortest burst-to-burst period used in burst mode.
+BURST_PERIOD = 0.001
+
+
+def sleep_until(deadline, clock=time.perf_counter, sleep=time.sleep):
+    """Return as close to ``deadline`` (a ``clock`` value) as possible."""
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return
+        if remaining > SPIN_THRESHOLD:
+            sleep(remaining - SPIN_THRESHOLD)
+        else:
+            sleep(0)   # spin, but let other threads take the GIL
+
+
+class Pacer:
+    """Release characters ``interval`` seconds apart on a monotonic schedule.
+
+    Only the TX writer thread calls :meth:`wait`; the statistics are plain
+    attributes that other threads may read at any time. ``clock`` and
+    ``sleep`` default to ``time.perf_counter`` and ``time.sleep``.
+    """
+
+    def __init__(self, interval, burst=False, clock=time.perf_counter, sleep=time.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        # Characters per write: 1, or enough that bursts are BURST_PERIOD apart.
+        self.burst = 1
+        if burst and 0 < interval < BURST_PERIOD:
+            self.burst = int(math.ceil(BURST_PERIOD / interval))
+        self._next = None    # deadline of the next write
+        self._last = None    # time of the previous write
+        self._last_count = 0
+        self.samples = 0
+        self.achieved_total = 0.0
+        self.achieved_min = None
+        self.achieved_max = None
+
+    @property
+    def achieved_mean(self):
+        return self.achieved_total / self.samples if self.samples else None
+
+    def wait(self, count=1):
+        """Block until ``count`` characters may be written, then book them."""
+        now = self._clock()
+        streaming = self._next is not None and now - self._next < self.interval
+        if streaming and now < self._next:
+            sleep_until(self._next, self._clock, self._sleep)
+            now = self._clock()
+        if streaming and self._last_count:
+            self._record((now - self._last) / self._last_count)
+        # On schedule (or slightly late): keep the schedule so the error does
+        # not accumulate. After an idle gap: start a new schedule from now.
+        start = self._next if streaming else now
+        self._next = start + self.interval * count
+        self._last = now
+        self._last_count = count
+
+    def _record(self, gap):
+        self.samples += 1
+        self.achieved_total += gap
+        if self.achieved_min is None or gap < self.achieved_min:
+            self.achieved_min = gap
+        if self.achieved_max is None or gap > self.achieved_max:
+            self.achieved_max = gap
+
+    def stats(self):
+        """Requested vs achieved inter-character time, in seconds."""
+        return {
+            'requested_s': self.interval,
+            'achieved_mean_s': self.achieved_mean,
+            'achieved_min_s': self.achieved_min,
+            'achieved_max_s': self.achieved_max,
+            'samples': self.samples,
+            'burst': self.burst,
+        }
@@ -0,0 +1,253 @@
+"""Replay a recorded session into a pty that stands in for the serial device.
+
+``python -m serialtcp replay session.cap`` (or ``serial-tcp-replay``) opens a
+pseudo-terminal, prints the name of its slave side and writes the RX stream of
+the capture into the master side: at the recorded pace, ``--speed`` times
+faster, or with ``--fast`` as fast as the reader takes it. Point a normal
+mapping's device at the printed name to load-test the whole serial -> TCP
+path with real traffic shapes and no hardware.
+
+Both the binary :mod:`~serialtcp.capture` format and the CLI's ``--log`` text
+are accepted; the format is detected from the file. Whatever the mapping
+sends to the device is read and discarded, so its writes never block.
+
+Needs ``os.openpty`` (Linux, macOS).
+"""
+
+import os
+import re
+import sys
+import time
+import select
+import logging
+import threading
+from datetime import datetime
+
+from serialtcp.capture import CaptureReader, MAGIC, DIR_RX
+from serialtcp.pacing import sleep_until
+
+# One CLI --log line: [2024-01-31 12:00:00.123] RX 3: 61 62 0d | ab.
+_LOG_LINE = re.compile(r'^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\.(\d{3})\] (RX|TX) \d+: ([0-9a-f ]*) \| ')
+
+
+def is_capture(path):
+    """True if ``path`` starts with the binary capture magic."""
+    with open(path, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def read_capture(path):
+    """Yield ``(seconds, data)`` for every RX record of a binary capture."""
+    with CaptureReader(path) as reader:
+        for rec in reader:
+            if rec.direction == DIR_RX:
+                yield rec.ts_ns / 1e9, bytes(rec.data)
+
+
+def read_log(path):
+    """Yield ``(seconds, data)`` for every RX line of a ``--log`` text file.
+
+    The log only has millisecond timestamps; lines that are not RX records
+    are skipped.
+    """
+    seconds = {}    # 'YYYY-mm-dd HH:MM:SS' -> epoch seconds, parsed once
+    with open(path, 'r', encoding='utf-8', errors='replace') as fh:
+        for line in fh:
+            m = _LOG_LINE.match(line)
+            if not m or m.group(3) != 'RX':
+                continue
+            stamp = m.group(1)
+            sec = seconds.get(stamp)
+            if sec is None:
+                sec = seconds[stamp] = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timestamp()
+            yield sec + int(m.group(2)) / 1000, bytes.fromhex(m.group(4))
+
+
+def read_chunks(path):
+    """RX chunks of a capture or ``--log`` file, whichever ``path`` is."""
+    return read_capture(path) if is_capture(path) else read_log(path)
+
+
+class VirtualDevice:
+    """A raw-mode pty pair; :attr:`device` is the path a SerialPort opens.
+
+    Keeps the slave side open itself so the pty survives the mapping closing
+    and reopening the device between clients. With ``link``, a symlink to
+    the slave is created so the device has a stable name.
+    """
+
+    def __init__(self, link=None):
+        import tty
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.device, link)
+            self.device = link
+        self.tx_bytes = 0   # bytes the mapping sent to the device
+        self._stop = threading.Event()
+        self._drain = threading.Thread(target=self._run_drain, name='replay-drain', daemon=True)
+        self._drain.start()
+
+    def write(self, data):
+        """Write to the device's RX side; blocks while the reader is behind."""
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master_fd, view):]
+
+    def _run_drain(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                self.tx_bytes += len(os.read(self.master_fd, 65536))
+            except OSError:
+                return
+
+    def close(self):
+        self._stop.set()
+        self._drain.join(1)
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replayer:
+    """Write timed chunks to ``write(data)`` on their recorded schedule.
+
+    ``speed`` scales the recorded gaps (2.0 = twice as fast); 0 writes every
+    chunk at once. A chunk that cannot be written on time shifts nothing: the
+    next one is still due at its own scheduled time; ``max_lag`` says how
+    far behind the schedule the writes fell.
+    """
+
+    def __init__(self, write, speed=1.0):
+        self.write = write
+        self.speed = speed
+        self.chunks = 0
+        self.bytes = 0
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+
+    def play(self, chunks, stop=None):
+        """Replay ``(seconds, data)`` pairs until done or ``stop`` is set."""
+        first = None
+        start = time.perf_counter()
+        for ts, data in chunks:
+            if stop is not None and stop.is_set():
+                break
+            if self.speed:
+                if first is None:
+                    first = ts
+                due = start + max(ts - first, 0) / self.speed
+                sleep_until(due)
+                self.max_lag = max(self.max_lag, time.perf_counter() - due)
+            self.write(data)
+            self.chunks += 1
+            self.bytes += len(data)
+        self.elapsed += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'chunks': self.chunks,
+            'bytes': self.bytes,
+            'elapsed_s': self.elapsed,
+            'max_lag_s': self.max_lag,
+        }
+
+
+def main(argv=None):
+    import argparse
+
+    aparse = argparse.ArgumentParser(
+        prog='serialtcp replay',
+        description='Replay the RX stream of a capture or --log file into a pty')
+    aparse.add_argument('file', help='binary capture (--capture) or text log (--log)')
+    aparse.add_argument(
+        '--speed',
+        type=float,
+        help='replay this many times faster than recorded, default: 1.0',
+        default=1.0
+    )
+    aparse.add_argument(
+        '--fast',
+        action='store_true',
+        help='ignore the timestamps and write as fast as the device is read',
+        default=False
+    )
+    aparse.add_argument(
+        '--repeat',
+        type=int,
+        help='play the file this many times, 0 = until stopped, default: 1',
+        default=1
+    )
+    aparse.add_argument(
+        '--delay',
+        type=float,
+        help='seconds to wait after creating the device before the first chunk, '
+             'e.g. until a client has connected to the mapping, default: 0',
+        default=0.0
+    )
+    aparse.add_argument(
+        '--link',
+        help='also make the device available under this path (symlink)',
+        default=None
+    )
+    aparse.add_argument(
+        '-v', '--verbose',
+        choices=['debug', 'info', 'warn', 'error', 'fatal'],
+        type=lambda c: c.lower(),
+        help='logger level, default: error',
+        default='error'
+    )
+    args = aparse.parse_args(argv)
+    logging.basicConfig(level=args.verbose.upper())
+
+    if not hasattr(os, 'openpty'):
+        print("replay needs a pty (os.openpty), not available on this platform")
+        sys.exit(1)
+    if args.speed <= 0 and not args.fast:
+        print("--speed must be positive, use --fast for no pacing")
+        sys.exit(1)
+    try:
+        is_capture(args.file)
+    except OSError as e:
+        print("Cannot read {}: {}".format(args.file, e))
+        sys.exit(1)
+
+    with VirtualDevice(args.link) as device:
+        print("Device {}".format(device.device))
+        sys.stdout.flush()
+        replayer = Replayer(device.write, speed=0 if args.fast else args.speed)
+        try:
+            time.sleep(args.delay)
+            played = 0
+            while not args.repeat or played < args.repeat:
+                replayer.play(read_chunks(args.file))
+                played += 1
+        except KeyboardInterrupt:
+            pass
+        except ValueError as e:
+            print("Cannot replay {}: {}".format(args.file, e))
+            sys.exit(1)
+        stats = replayer.stats()
+        print("Replayed {chunks} chunks, {bytes} bytes in {elapsed_s:.3f}s, "
+              "max lag {max_lag_s:.4f}s".format(**stats))
+
+
+if __name__ == '__main__':
+    main()
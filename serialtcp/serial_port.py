@@ -1,8 +1,34 @@
 import serial
 from serial.tools import list_ports
+from serialtcp.client import SendQueue, SLOW_CLIENT_BLOCK
+from serialtcp.pacing import Pacer
+import os
+import sys
 import time
+import select
 import logging
 import threading
+from collections import deque
+
+# Receive backends: 'pyserial' reads through Serial.read()/in_waiting (works
+# everywhere); 'poll' waits on the tty fd with poll() and drains it with one
+# readv() into a reusable buffer (Linux/POSIX only, falls back to pyserial).
+READER_PYSERIAL = 'pyserial'
+READER_POLL = 'poll'
+READERS = (READER_PYSERIAL, READER_POLL)
+
+# poll() on tty devices is unreliable on macOS, and Windows has no poll at all.
+POLL_SUPPORTED = hasattr(select, 'poll') and hasattr(os, 'readv') and sys.platform != 'darwin'
+
+# Largest chunk the poll reader drains per readv().
+DEFAULT_READ_SIZE = 64 * 1024
+
+# Bytes queued for the TX writer before send() applies back-pressure, so a
+# fast TCP sender is still throttled to the serial line rate.
+DEFAULT_TX_QUEUE = 64 * 1024
+
+# How long close() waits for already queued TX data to reach the device.
+TX_FLUSH_TIMEOUT = 1.0
 
 class SerialPort():
     def __init__(self, port, on_received=None,
@@ -19,11 +45,25 @@ class SerialPort():
 
         self.char_mode = kwargs.get('char_mode', False)
         self.wait_echo = kwargs.get('wait_echo', False)
+        # wait_echo: how many sent characters may await their echo at once
+        # (1 = classic stop-and-wait). Echoes are matched in order against
+        # the sent stream; unexpected bytes and late echoes are counted.
+        self.echo_window = max(1, int(kwargs.get('echo_window', 1) or 1))
+        self._echo_pending = deque()   # (byte, deadline) awaiting their echo
+        self._echo_cond = threading.Condition()
+        self.echo_matched = 0
+        self.echo_mismatches = 0
+        self.echo_timeouts = 0
         self.send_char_delay = kwargs.get('char_delay', None)
+        # char_delay is held on a monotonic schedule; with char_burst, sub-ms
+        # delays are sent as paced multi-character bursts.
+        self.pacer = Pacer(self.send_char_delay, burst=kwargs.get('char_burst', False)) \
+            if self.send_char_delay else None
         self.logger = logging.getLogger("Serial {}".format(port))
         self.is_connected = False
         self.lock = threading.Lock()
         self.lastbyte = 0
+        self.rx_read_ns = 0   # perf_counter_ns of the chunk being delivered
         self._on_received = on_received
         if not on_received:
             self._on_received = lambda x: x
@@ -41,9 +81,31 @@ class SerialPort():
         self.on_connect = on_connect
         self.on_disconnect = on_disconnect
 
+        # Optional shared EventLoop (selector engine): when set and the port
+        # exposes a file descriptor, the device is watched by the loop instead
+        # of a dedicated receive thread.
+        self.event_loop = kwargs.get('event_loop', None)
+        self._loop_fd = None
+
+        self.reader = kwargs.get('serial_reader', READER_PYSERIAL) or READER_PYSERIAL
+        if self.reader not in READERS:
+            raise ValueError("unknown serial reader {!r}, expected one of {}".format(
+                self.reader, ', '.join(READERS)))
+        # Poll reader: every readv() lands in this buffer and is passed on as a
+        # memoryview that is only valid until the next read.
+        self._read_buf = None
+        self._read_size = kwargs.get('read_size', DEFAULT_READ_SIZE)
+
+        # TX goes through a queue drained by one writer thread (started on
+        # open), which merges whatever piled up into a single write().
+        self._tx_limit = kwargs.get('tx_queue', DEFAULT_TX_QUEUE)
+        self._tx_queue = None
+        self.tx_thread = None
+
 
     def open(self):
         self._close_set = False
+        self.__start_writer()
         self.__open()
 
     def ensure_open(self):
@@ -70,8 +132,14 @@ class SerialPort():
                 self.logger.debug("opened port {} at {} baud".format(self.serial.port, self.serial.baudrate))
                 self._open_epoch += 1
                 epoch = self._open_epoch
-                self.receive_thread = threading.Thread(target=self.__async_receiver, args=(epoch,), daemon=True)
-                self.receive_thread.start()
+                fd = self.__fileno()
+                if self.event_loop is not None and fd is not None:
+                    self._loop_fd = fd
+                    self.event_loop.call_soon(self.on_connect)
+                    self.event_loop.add_reader(fd, lambda: self.__on_readable(epoch))
+                else:
+                    self.receive_thread = threading.Thread(target=self.__async_receiver, args=(epoch,), daemon=True)
+                    self.receive_thread.start()
             else:
                 if self.keep_active:
                     if not self.reconnect_thread or not self.reconnect_thread.is_alive():
@@ -79,8 +147,17 @@ class SerialPort():
                         self.reconnect_thread.start()
 
 
+    def __fileno(self):
+        try:
+            return self.serial.fileno()
+        except Exception:
+            return None  # no fd to select on (e.g. Windows): use a thread
+
     def __close(self):
         was_connected = self.is_connected
+        if self._loop_fd is not None:
+            self.event_loop.remove_reader(self._loop_fd)
+            self._loop_fd = None
         if self.serial.is_open:
             self.logger.debug("closing port {}".format(self.serial.port))
             try:
@@ -92,24 +169,116 @@ class SerialPort():
             self.on_disconnect()
 
     def close(self):
+        tx_queue = self._tx_queue
+        if tx_queue is not None and threading.current_thread() is not self.tx_thread:
+            tx_queue.flush(TX_FLUSH_TIMEOUT)
         self._close_set = True
         with self.lock:
             self.__close()
+        if tx_queue is not None:
+            tx_queue.close()
+        with self._echo_cond:
+            self._echo_pending.clear()   # nothing more will be echoed
+            self._echo_cond.notify_all()
         if self.receive_thread and self.receive_thread.is_alive():
             self.receive_thread.join(timeout=3)
         if self.reconnect_thread and self.reconnect_thread.is_alive():
             self.reconnect_thread.join(timeout=3)
             self.reconnect_thread = None
+        if self.tx_thread and self.tx_thread.is_alive() and threading.current_thread() is not self.tx_thread:
+            self.tx_thread.join(timeout=3)
 
     def on_received(self, data):
         """
         received data from serial
         """
+        self.rx_read_ns = time.perf_counter_ns()
         self.logger.debug("rx: {} bytes".format(len(data)))
         self.lastbyte = data[-1]
+        if self._echo_pending:
+            self.__match_echo(data)
         self._on_received(data)
 
+    def __match_echo(self, data):
+        """Acknowledge in-flight characters whose echo is in ``data``.
+
+        A byte that matches a character further into the window means the
+        echoes before it were lost or garbled: those are counted as mismatches
+        and dropped, so the window resynchronises instead of waiting out a
+        timeout for every later character.
+        """
+        with self._echo_cond:
+            pending = self._echo_pending
+            for byte in data:
+                if not pending:
+                    break
+                if byte == pending[0][0]:
+                    pending.popleft()
+                    self.echo_matched += 1
+                    continue
+                for skip in range(1, len(pending)):
+                    if pending[skip][0] == byte:
+                        break
+                else:
+                    self.echo_mismatches += 1   # unexpected byte
+                    continue
+                for _ in range(skip):
+                    pending.popleft()
+                pending.popleft()
+                self.echo_mismatches += skip
+                self.echo_matched += 1
+            self._echo_cond.notify_all()
+
+    def __use_poll(self):
+        if self.reader != READER_POLL:
+            return False
+        if not POLL_SUPPORTED or self.__fileno() is None:
+            self.logger.warning("poll reader not available here, using pyserial")
+            self.reader = READER_PYSERIAL
+            return False
+        if self._read_buf is None:
+            self._read_buf = bytearray(self._read_size)
+        return True
+
+    def __read_fd(self, fd):
+        """One readv() of everything available; b'' if nothing is ready."""
+        try:
+            n = os.readv(fd, [self._read_buf])
+        except (BlockingIOError, InterruptedError):
+            return b''
+        if n == 0:
+            raise serial.SerialException('device disconnected (read returned no data)')
+        return memoryview(self._read_buf)[:n]
+
+    def __poll_receiver(self, epoch):
+        self.logger.debug("poll receiver started")
+        self.on_connect()
+        fd = self.__fileno()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+        # pyserial closes this pipe on close(), which wakes the poll() at once.
+        abort_fd = getattr(self.serial, 'pipe_abort_read_r', None)
+        if abort_fd is not None:
+            poller.register(abort_fd, select.POLLIN)
+        timeout_ms = int((self.serial.timeout or 2) * 1000)
+        while self.serial.is_open and self.is_connected:
+            try:
+                events = poller.poll(timeout_ms)
+                if not self.serial.is_open or not self.is_connected:
+                    break
+                if any(ev_fd == fd for ev_fd, _ in events):
+                    data = self.__read_fd(fd)
+                    if len(data):
+                        self.on_received(data)
+            except Exception as e:
+                if not self._close_set:
+                    self.logger.exception("rx fail: {}".format(e))
+                break
+        self.__receiver_done(epoch)
+
     def __async_receiver(self, epoch):
+        if self.__use_poll():
+            return self.__poll_receiver(epoch)
         self.logger.debug("receiver started")
         self.on_connect()
         while self.serial.is_open and self.is_connected:
@@ -123,6 +292,27 @@ class SerialPort():
                 if not self._close_set:
                     self.logger.exception("rx fail: {}".format(e))
                 break
+        self.__receiver_done(epoch)
+
+    def __on_readable(self, epoch):
+        """Event-loop reader: drain what the device has buffered."""
+        if epoch != self._open_epoch or not self.is_connected:
+            return
+        try:
+            if self.__use_poll():
+                data = self.__read_fd(self._loop_fd)
+            else:
+                data = self.serial.read(self.serial.in_waiting or 1)
+            if len(data):
+                self.on_received(data)
+            return
+        except Exception as e:
+            if not self._close_set:
+                self.logger.exception("rx fail: {}".format(e))
+        self.__receiver_done(epoch)
+
+    def __receiver_done(self, epoch):
+        """Close or reconnect once the receiver for ``epoch`` hits an error."""
         # A newer open has taken over (epoch advanced): leave the port to it.
         if epoch != self._open_epoch:
             self.logger.debug("receiver stopped (superseded)")
@@ -153,27 +343,86 @@ class SerialPort():
 
 
     def __send_chars(self, data):
-        for char in data:
-            self.serial.write(bytes([char]))  # get a bunch of bytes and send them
-            if self.send_char_delay:
-                time.sleep(self.send_char_delay)
-            if self.wait_echo:
-                if char:
-                    t = time.time()
-                    while (time.time() - t) < self.wait_echo:
-                        if self.lastbyte == char:
-                            self.lastbyte = 0
-                            break
-
-    def send(self, data):
+        # Echo checking is per character, so bursts only apply without it.
+        step = self.pacer.burst if self.pacer and not self.wait_echo else 1
+        for pos in range(0, len(data), step):
+            chunk = data[pos:pos + step]
+            char = chunk[0]
+            if self.wait_echo and char:
+                self.__wait_echo_window(self.echo_window - 1)
+                with self._echo_cond:
+                    self._echo_pending.append((char, time.monotonic() + self.wait_echo))
+            if self.pacer:
+                self.pacer.wait(len(chunk))
+            self.serial.write(chunk)  # one char (or one paced burst) at a time
+        if self.wait_echo:
+            self.__wait_echo_window(0)
+
+    def __wait_echo_window(self, max_pending):
+        """Block until at most ``max_pending`` echoes are outstanding.
+
+        Woken by on_received; an echo not seen by its deadline is counted as
+        a timeout and given up on, as the old busy-wait did.
+        """
+        with self._echo_cond:
+            pending = self._echo_pending
+            while len(pending) > max_pending:
+                remaining = pending[0][1] - time.monotonic()
+                if remaining <= 0:
+                    pending.popleft()
+                    self.echo_timeouts += 1
+                    continue
+                self._echo_cond.wait(remaining)
+
+    def __start_writer(self):
+        if self.tx_thread and self.tx_thread.is_alive() and not self._tx_queue.closed:
+            return
+        # Clients wait for the device as long as it takes: TCP flow control.
+        self._tx_queue = SendQueue(self._tx_limit, SLOW_CLIENT_BLOCK, block_timeout=None)
+        self.tx_thread = threading.Thread(target=self.__tx_writer, args=(self._tx_queue,), daemon=True)
+        self.tx_thread.start()
+
+    def __tx_writer(self, tx_queue):
+        self.logger.debug("tx writer started")
+        while True:
+            data = tx_queue.get(timeout=2)
+            if tx_queue.closed:
+                break
+            if data:
+                self.__write(data)
+                tx_queue.done()
+        self.logger.debug("tx writer stopped")
+
+    def __write(self, data):
+        try:
+            if self.char_mode or self.send_char_delay or self.wait_echo:
+                self.__send_chars(data)
+            else:
+                self.serial.write(data)
+        except Exception as e:
+            self.logger.warning(e)
+
+    def send(self, data, timeout=None):
+        """Queue ``data`` for the TX writer; returns without waiting for the device.
+
+        Blocks only while the backlog exceeds the TX queue bound, which keeps
+        TCP flow control working against a slow serial line. The shared
+        event-loop thread never blocks (the backlog grows instead).
+        ``timeout`` bounds that wait (0: never wait); returns False if the
+        queue stayed full and ``data`` was dropped.
+        """
         self.logger.debug("tx: {} bytes".format(len(data)))
-        with self.lock:
-            try:
-                if self.char_mode or self.send_char_delay or self.wait_echo:
-                    self.__send_chars(data)
-                else:
-                    self.serial.write(data)
-            except Exception as e:
-                self.logger.warning(e)
+        tx_queue = self._tx_queue
+        if tx_queue is None or tx_queue.closed:
+            self.logger.warning("tx dropped, port {} is closed".format(self.serial.port))
+            return True
+        on_loop = self.event_loop is not None and self.event_loop.in_loop_thread()
+        return tx_queue.put(data, block=not on_loop, timeout=timeout)
+
+    def flush(self, timeout=TX_FLUSH_TIMEOUT):
+        """Wait up to ``timeout`` for queued TX data to be written."""
+        if self._tx_queue is not None:
+            return self._tx_queue.flush(timeout)
+        return True
 
 
@@ -1,15 +1,30 @@
 import socket
 import threading
-from serialtcp.client import SerialClient
+import time
+from serialtcp.client import SerialClient, DEFAULT_SEND_QUEUE, SLOW_CLIENT_DROP_OLDEST, DEFAULT_RECV_BUFFER
 import logging
 
+# How long stop() lets clients drain their send queues (e.g. a goodbye banner).
+FLUSH_TIMEOUT = 1.0
+
+
+def flush_clients(clients, timeout=FLUSH_TIMEOUT):
+    """Wait, up to ``timeout`` in total, for the clients' send queues to empty."""
+    deadline = time.monotonic() + timeout
+    for client in clients:
+        client.queue.flush(max(0.0, deadline - time.monotonic()))
+
 
 class SerialServer():
     def __init__(self, port,
                  host='',
                  on_tcp_receive=lambda data:None,
                  on_client_connect=lambda client:None,
-                 on_client_disconnect=lambda client:None ):
+                 on_client_disconnect=lambda client:None,
+                 send_queue=DEFAULT_SEND_QUEUE,
+                 slow_client=SLOW_CLIENT_DROP_OLDEST,
+                 recv_buffer=DEFAULT_RECV_BUFFER,
+                 zero_copy=False):
         self.logger = logging.getLogger('Server {}'.format(port))
         self.port = port
         self.host = host
@@ -21,11 +36,17 @@ class SerialServer():
         self.client_on_recv = on_tcp_receive
         self.on_client_connect = on_client_connect
         self.on_client_disconnect = on_client_disconnect
+        self.send_queue = send_queue
+        self.slow_client = slow_client
+        self.recv_buffer = recv_buffer
+        self.zero_copy = zero_copy
+        self.dropped_closed = 0   # dropped bytes of clients that have left
         self.lock = threading.Lock()
 
     def __remove_client(self, client: SerialClient):
         with self.lock:
             self.clients.remove(client)
+            self.dropped_closed += client.dropped_bytes
         self.logger.debug("client disconnected: {}, remaining: {}".format(client.address, len(self.clients)))
         self.on_client_disconnect(client)
 
@@ -37,7 +58,11 @@ class SerialServer():
                 client = SerialClient(client_socket, address,
                                       on_disconnect=self.__remove_client,
                                       on_connect=self.on_client_connect,
-                                      on_received=self.client_on_recv)
+                                      on_received=self.client_on_recv,
+                                      send_queue=self.send_queue,
+                                      slow_client=self.slow_client,
+                                      recv_buffer=self.recv_buffer,
+                                      zero_copy=self.zero_copy)
                 with self.lock:
                     self.clients.add(client)
                 self.logger.debug("client connected: {}, total: {}".format(address, len(self.clients)))
@@ -55,7 +80,7 @@ class SerialServer():
         # configure server socket
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind((self.host, self.port))
-        self.socket.listen(1)
+        self.socket.listen(16)
         self.socket.settimeout(1)
 
         self.thread_accept.start()
@@ -67,6 +92,7 @@ class SerialServer():
 
     def stop(self):
         self.logger.debug("stopping server, {} clients connected".format(len(self.clients)))
+        flush_clients(self.get_clients())
         self.__set_stop()
         self.socket.close()
         self.thread_accept.join(timeout=3)
@@ -82,7 +108,29 @@ class SerialServer():
         for client in self.get_clients():
             client.send(data)
 
+    @property
+    def dropped_bytes(self):
+        """Bytes dropped for slow clients since the server started."""
+        return self.dropped_closed + sum(c.dropped_bytes for c in self.get_clients())
+
     def run(self):
         self.logger.debug("Server: Run")
         self.__start_accept_thread()
 
+
+# Data-plane engines a mapping can run on: ``threads`` (one thread per TCP
+# client, the original design) or ``selector`` (every socket and serial fd of
+# the process multiplexed on one shared event-loop thread).
+ENGINE_THREADS = 'threads'
+ENGINE_SELECTOR = 'selector'
+ENGINES = (ENGINE_THREADS, ENGINE_SELECTOR)
+
+
+def create_server(port, engine=ENGINE_THREADS, **kwargs):
+    """Build the TCP server for ``engine``; arguments are those of SerialServer."""
+    if engine == ENGINE_SELECTOR:
+        from serialtcp.loop_server import LoopServer
+        return LoopServer(port, **kwargs)
+    if engine != ENGINE_THREADS:
+        raise ValueError("unknown engine {!r}, expected one of {}".format(engine, ', '.join(ENGINES)))
+    return SerialServer(port, **kwargs)
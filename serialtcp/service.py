@@ -1,6 +1,7 @@
 """Headless serial-to-TCP port service.
 
-Wraps the existing :class:`~serialtcp.server.SerialServer` and
+Wraps the existing :class:`~serialtcp.server.SerialServer` (or, with
+``engine: selector``, :class:`~serialtcp.loop_server.LoopServer`) and
 :class:`~serialtcp.serial_port.SerialPort` for a single serial -> TCP mapping
 without the CLI's signal handling or blocking loop, so a GUI can own many
 mappings at once and drive each one independently.
@@ -15,25 +16,21 @@ import re
 import time
 import logging
 import threading
-from datetime import datetime
-from collections import namedtuple, deque
 from dataclasses import dataclass, asdict
 
-from serialtcp.server import SerialServer
-from serialtcp.serial_port import SerialPort
+from serialtcp.server import create_server, ENGINE_SELECTOR, ENGINE_THREADS
+from serialtcp.client import DEFAULT_SEND_QUEUE, SLOW_CLIENT_DROP_OLDEST, DEFAULT_RECV_BUFFER
+from serialtcp.serial_port import SerialPort, READER_PYSERIAL
+from serialtcp.event_loop import get_event_loop
+from serialtcp.telnet import TelnetDecoder, TELNET_CHAR_MODE
+from serialtcp.charmap import MapStream, compile_maps
+from serialtcp.logwriter import LogWriter, DEFAULT_FLUSH_INTERVAL
+from serialtcp.logformat import TextRecordFormatter
+from serialtcp.capture import CaptureWriter, DIR_RX, DIR_TX, client_ids
+from serialtcp.latency import RxLatency
+from serialtcp.history import LogEvent, LogHistory, KIND_IDS
 
 
-# A single console log line. ``kind`` drives the colour the GUI renders:
-#   conn   - TCP client connected / disconnected
-#   rx     - data received from the serial device
-#   tx     - data sent to the serial device
-#   status - lifecycle notices (listening, serial connected, stopped)
-#   retry  - reconnect attempts while the device is lost
-# ``raw`` holds the exact bytes received/sent (with the line terminator) for
-# rx/tx lines so the GUI can render a faithful hex view; it is None for the
-# synthetic status/conn/retry notices.
-LogEvent = namedtuple('LogEvent', 'kind text ts raw', defaults=(None,))
-
 # Matches any of the line terminators the console splits on.
 _LINE_TERMINATORS = re.compile(b'\r\n|\r|\n')
 
@@ -62,6 +59,12 @@ _MAX_PARTIAL_LINE = 4096
 # How many recent log lines each service retains for re-rendering the console.
 _LOG_HISTORY = 1000
 
+# Batched event delivery over the worker pipe: an EventBatcher hands its
+# events over once it holds this many or the oldest has waited this long
+# (seconds).
+EVENT_BATCH_SIZE = 256
+EVENT_BATCH_DELAY = 0.05
+
 
 @dataclass
 class PortConfig:
@@ -74,11 +77,24 @@ class PortConfig:
     xonxoff: bool = False
     char_mode: bool = False
     char_delay: float = 0.0
+    char_burst: bool = False     # sub-ms char_delay: send paced multi-char bursts
     wait_echo: float = 0.0
+    echo_window: int = 1         # wait_echo: characters allowed in flight unechoed
     line_ending: str = 'CRLF'    # console send newline: CRLF | LF | CR | none
     log_file: str = ''           # path to log all serial activity (empty = off)
+    log_flush_interval: float = DEFAULT_FLUSH_INTERVAL  # max seconds a log line waits for the disk
+    log_fsync_interval: float = 0.0  # fsync the log at most this often (0 = never)
+    capture_file: str = ''       # binary capture of the raw serial I/O (empty = off)
     allow_remote: bool = False   # False -> bind 127.0.0.1, True -> bind 0.0.0.0
     autostart: bool = False
+    engine: str = ENGINE_THREADS  # data plane: threads | selector (one shared loop)
+    send_queue: int = DEFAULT_SEND_QUEUE   # per-client outbound queue bound, bytes
+    slow_client: str = SLOW_CLIENT_DROP_OLDEST   # full queue: drop_oldest | disconnect | block
+    recv_buffer: int = DEFAULT_RECV_BUFFER  # bytes per TCP read
+    zero_copy_rx: bool = False   # recv_into one reusable buffer, pass memoryviews on
+    serial_reader: str = READER_PYSERIAL   # serial RX backend: pyserial | poll (Linux)
+    maps: str = ''               # char maps, comma-separated (e.g. ICRNL,ODELBS)
+    latency_stats: bool = False  # per-stage RX latency histograms (serial read -> socket)
 
     @property
     def label(self):
@@ -104,12 +120,89 @@ class PortConfig:
         return cls(**{k: v for k, v in data.items() if k in known})
 
 
+def configs_from_data(data):
+    """Return the PortConfig list of a parsed YAML config document.
+
+    Accepts the ``{ports: [...]}`` mapping written by the GUI or a bare list;
+    entries without a device or TCP port are skipped.
+    """
+    if isinstance(data, dict):
+        ports = data.get('ports') or []
+    elif isinstance(data, list):
+        ports = data
+    else:
+        ports = []
+    return [PortConfig.from_dict(entry) for entry in ports
+            if isinstance(entry, dict) and entry.get('device') and entry.get('tcp_port')]
+
+
+class EventBatcher:
+    """Collects LogEvents so a consumer gets them as lists, not one by one.
+
+    In-process consumers (the console, the REST API) no longer need it: they
+    read a service's :class:`~serialtcp.history.LogHistory` with
+    ``read_since`` cursors. What is left is the worker pipe. A worker process
+    gives each of its services a batcher whose ``deliver`` queues the batch
+    for the pipe (see :mod:`serialtcp.workers`), so lines cross to the parent
+    one message per batch rather than one per line, and the parent's proxy
+    appends each batch to its history under one lock.
+
+    ``deliver(events)`` is called once ``size`` events are pending or the
+    oldest has waited ``delay`` seconds; the age is checked as events arrive
+    and by :meth:`flush`, which the consumer's loop calls so a quiet stream's
+    tail is not held back.
+    """
+
+    def __init__(self, deliver, size=EVENT_BATCH_SIZE, delay=EVENT_BATCH_DELAY):
+        self.deliver = deliver
+        self.size = size
+        self.delay = delay
+        self._events = []
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, event):
+        self.extend((event,))
+
+    def extend(self, events):
+        """Add several events at once, e.g. the lines of one read."""
+        with self._lock:
+            pending = self._events
+            if not pending:
+                self._since = time.monotonic()
+            pending.extend(events)
+            if len(pending) < self.size and time.monotonic() - self._since < self.delay:
+                return
+            batch = self._take_locked()
+        self.deliver(batch)
+
+    def flush(self, force=False):
+        """Deliver the pending events if the oldest has waited ``delay``, or now."""
+        with self._lock:
+            if not self._events or (not force and time.monotonic() - self._since < self.delay):
+                return
+            batch = self._take_locked()
+        self.deliver(batch)
+
+    def _take_locked(self):
+        batch = self._events
+        self._events = []
+        return batch
+
+
 class PortService:
-    """Runs one serial -> TCP mapping and exposes live stats + a log stream."""
+    """Runs one serial -> TCP mapping and exposes live stats + a log stream.
+
+    Log events go to ``on_event(service, event)`` one at a time and, when
+    ``events`` is an :class:`EventBatcher` (a worker process forwarding them
+    to its parent), also into it for batched delivery.
+    They are retained in ``history`` (a new LogHistory unless given).
+    """
 
-    def __init__(self, config: PortConfig, on_event=None):
+    def __init__(self, config: PortConfig, on_event=None, events=None, history=None):
         self.config = config
         self._on_event = on_event or (lambda service, event: None)
+        self.events = events     # EventBatcher feeding the worker pipe, or None
         self.logger = logging.getLogger('Port {}'.format(config.tcp_port))
 
         self._server = None
@@ -124,11 +217,25 @@ class PortService:
 
         self.reconnect_attempt = 0
         self._last_retry_log = 0.0
-        self._line_bufs = {}     # kind -> partial bytes awaiting a newline
-
-        self.log_buffer = deque(maxlen=_LOG_HISTORY)
+        self._line_bufs = {}     # kind -> _LineSplitter holding the partial line
+
+        # Byte paths to the device and to the clients; MapStreams when the
+        # config selects char maps. _to_serial is the console's; every TCP
+        # client gets its own output stream, so held-back bytes never mix.
+        self._to_serial = self._send_console
+        self._to_clients = self._send_clients
+        self._output_map = None
+        self._map_streams = []
+        self._client_streams = {}   # SerialClient -> its output MapStream
+        self._latency = None     # RxLatency while latency_stats is on
+
+        # Under the process-wide byte budget; a NullHistory when the events
+        # are only forwarded to a history kept elsewhere.
+        self.history = history if history is not None else LogHistory(_LOG_HISTORY)
         self._log_lock = threading.Lock()
-        self._log_fh = None      # open file handle when logging to disk
+        self._log_writer = None  # background LogWriter when logging to disk
+        self._capture = None     # CaptureWriter while capture_file is set
+        self._client_ids = client_ids()
 
         # Pending delayed serial close (linger grace period); guarded together.
         self._linger_timer = None
@@ -149,6 +256,48 @@ class PortService:
             return 0
         return len(self._server.get_clients())
 
+    @property
+    def dropped_total(self):
+        """Serial bytes dropped for TCP clients too slow to keep up."""
+        if not self._server:
+            return 0
+        return self._server.dropped_bytes
+
+    @property
+    def echo_mismatches(self):
+        """wait_echo: bytes received that did not match the expected echo."""
+        return self._serial.echo_mismatches if self._serial else 0
+
+    @property
+    def echo_timeouts(self):
+        """wait_echo: sent characters whose echo never arrived in time."""
+        return self._serial.echo_timeouts if self._serial else 0
+
+    def pacing_stats(self):
+        """char_delay: requested vs achieved inter-character time, or None."""
+        if not (self._serial and self._serial.pacer):
+            return None
+        return self._serial.pacer.stats()
+
+    def latency_stats(self):
+        """latency_stats: per-stage RX latency histograms, or None when off."""
+        latency = self._latency
+        return latency.stats() if latency else None
+
+    def capture_stats(self):
+        """Capture file writer queue depth and flush latency, or None when off."""
+        capture = self._capture
+        return capture.stats() if capture else None
+
+    def client_stats(self):
+        """Per-client outbound queue state: address, queued and dropped bytes."""
+        if not (self._server and self._running):
+            return []
+        return [{'address': _addr(c.address),
+                 'queued_bytes': c.queued_bytes,
+                 'dropped_bytes': c.dropped_bytes}
+                for c in self._server.get_clients()]
+
     @property
     def local_client(self):
         """True when the integrated terminal is connected as a client."""
@@ -175,16 +324,31 @@ class PortService:
 
     # --------------------------------------------------------------- control
     def start(self):
-        """Open the TCP listener. Raises OSError if the port can't be bound."""
+        """Open the TCP listener. Raises OSError if the port can't be bound
+        and ValueError for an unknown char map."""
         if self._running:
             return
+        input_map, output_map = compile_maps(self.config.maps)
+        self._output_map = output_map
+        self._map_streams = []
+        self._client_streams = {}
+        self._to_serial = self._send_console
+        self._to_clients = self._send_clients
+        if output_map:
+            self._map_streams.append(MapStream(output_map, self._send_console))
+            self._to_serial = self._map_streams[-1].write
+        if input_map:
+            self._map_streams.append(MapStream(input_map, self._send_clients))
+            self._to_clients = self._map_streams[-1].write
         self.tx_total = 0
         self.rx_total = 0
         self.reconnect_attempt = 0
         self._line_bufs = {}
         self._local_client = False
+        self._latency = RxLatency() if self.config.latency_stats else None
 
         cfg = self.config
+        loop = get_event_loop() if cfg.engine == ENGINE_SELECTOR else None
         self._serial = SerialPort(
             cfg.device,
             on_received=self._on_serial_receive,
@@ -196,11 +360,20 @@ class PortService:
             xonxoff=cfg.xonxoff,
             char_mode=cfg.char_mode,
             char_delay=cfg.char_delay,
+            char_burst=cfg.char_burst,
             wait_echo=cfg.wait_echo,
+            echo_window=cfg.echo_window,
+            event_loop=loop,
+            serial_reader=cfg.serial_reader,
         )
-        self._server = SerialServer(
+        self._server = create_server(
             cfg.tcp_port,
+            engine=cfg.engine,
             host=cfg.bind_host,
+            send_queue=cfg.send_queue,
+            slow_client=cfg.slow_client,
+            recv_buffer=cfg.recv_buffer,
+            zero_copy=cfg.zero_copy_rx,
             on_tcp_receive=self._on_tcp_receive,
             on_client_connect=self._on_client_connect,
             on_client_disconnect=self._on_client_disconnect,
@@ -215,6 +388,13 @@ class PortService:
         self.started_at = time.time()
         if cfg.log_file:
             self._open_log(cfg.log_file)
+        if cfg.capture_file:
+            try:
+                self._capture = CaptureWriter(cfg.capture_file,
+                                              flush_interval=cfg.log_flush_interval,
+                                              fsync_interval=cfg.log_fsync_interval)
+            except OSError as exc:
+                self.logger.error('cannot open capture file %s: %s', cfg.capture_file, exc)
         self._emit('status', 'listening on {}:{}'.format(cfg.bind_host, cfg.tcp_port))
 
     def stop(self):
@@ -230,10 +410,16 @@ class PortService:
         finally:
             if serial_port:
                 serial_port.close()
+            for stream in self._map_streams + list(self._client_streams.values()):
+                stream.close()
+            self._client_streams = {}
         self.started_at = None
         self.reconnect_attempt = 0
         self._emit('status', 'stopped')
         self._close_log()
+        capture, self._capture = self._capture, None
+        if capture:
+            capture.close()
 
     def connect_local(self):
         """Connect the integrated terminal as a client, opening the serial port.
@@ -291,12 +477,18 @@ class PortService:
             self._linger_timer = None
 
     def send_to_serial(self, data: bytes):
-        """Transmit bytes to the serial device (used by the console input)."""
+        """Queue bytes for the serial device (used by the console input).
+
+        Returns at once; the serial TX writer thread performs the write. If
+        the device has stalled and its TX queue is full, the input is dropped
+        and a 'conn' event reports it.
+        """
         if not (self._running and self._serial):
             return
-        self.tx_total += len(data)
-        self._buffer_lines('tx', data)
-        self._serial.send(data)
+        capture = self._capture
+        if capture:
+            capture.record(DIR_TX, data)
+        self._to_serial(data)
 
     def poll(self):
         """Periodic housekeeping; call ~once per second from the GUI thread."""
@@ -310,26 +502,83 @@ class PortService:
                        'reconnect attempt {} ...'.format(self.reconnect_attempt))
 
     # ------------------------------------------------------------- callbacks
-    def _on_tcp_receive(self, data):
+    def _on_tcp_receive(self, data, telnet=None, client_id=0, to_serial=None):
+        if telnet is not None:
+            data = telnet.feed(data)
+            if not data:
+                return
+        capture = self._capture
+        if capture:
+            # As the client sent it: before the output char maps.
+            capture.record(DIR_TX, data, client_id)
+        (to_serial or self._send_serial)(data)
+
+    def _send_serial(self, data):
+        # Counted and logged as sent, i.e. after the output char maps.
         self.tx_total += len(data)
         self._buffer_lines('tx', data)
         if self._serial:
             self._serial.send(data)
 
+    def _send_console(self, data):
+        # The GUI thread must not wait for a stalled device: unlike a TCP
+        # client it gets no flow control from the wait, so a full TX queue
+        # drops the input and says so.
+        serial_port = self._serial
+        if serial_port and not serial_port.send(data, timeout=0):
+            self._emit('conn', 'serial TX queue full, {} bytes of input dropped'.format(len(data)))
+            return
+        self.tx_total += len(data)
+        self._buffer_lines('tx', data)
+
     def _on_serial_receive(self, data):
+        latency = self._latency
+        if latency is not None:
+            entered = time.perf_counter_ns()
         self.rx_total += len(data)
+        capture = self._capture
+        if capture:
+            capture.record(DIR_RX, data)
         self._buffer_lines('rx', data)
+        if latency is not None:
+            logged = time.perf_counter_ns()
+        self._to_clients(data)
+        if latency is not None:
+            latency.record(self._serial.rx_read_ns, entered, logged, time.perf_counter_ns())
+
+    def _send_clients(self, data):
         if self._server:
             self._server.send_to_all(data)
 
     def _on_client_connect(self, client):
         self._cancel_linger()
+        if self._latency is not None:
+            client.queue.latency = self._latency.client_histogram()
+        # One decoder per client strips the Telnet commands it sends, even
+        # across chunks; the number tags its data in the capture file.
+        telnet = TelnetDecoder() if self.config.char_mode else None
+        client_id = next(self._client_ids)
+        to_serial = None
+        if self._output_map is not None:
+            stream = MapStream(self._output_map.clone(), self._send_serial)
+            self._client_streams[client] = stream
+            to_serial = stream.write
+        client.set_on_received(
+            lambda data: self._on_tcp_receive(data, telnet, client_id, to_serial))
+        if telnet is not None:
+            # Same negotiation as the CLI.
+            client.send(TELNET_CHAR_MODE)
         self._emit('conn', 'client {} connected ({} total)'.format(
             _addr(client.address), self.client_count))
         if self._serial:
             self._serial.ensure_open()
 
     def _on_client_disconnect(self, client):
+        stream = self._client_streams.pop(client, None)
+        if stream is not None:
+            stream.close()
+        if self._latency is not None and client.queue.latency is not None:
+            self._latency.release_client(client.queue.latency)
         remaining = self.client_count
         self._emit('conn', 'client {} disconnected ({} total)'.format(
             _addr(client.address), remaining))
@@ -355,36 +604,43 @@ class PortService:
         terminate lines with ``\\r`` (e.g. some DLT/serial logs) are split
         into rows instead of one endless line.
         """
-        buf = self._line_bufs.get(kind, b'') + bytes(data)
-        pos = 0
-        for m in _LINE_TERMINATORS.finditer(buf):
-            line = buf[pos:m.start()]
-            text = line.decode('utf-8', 'replace')
-            if text:
-                self._emit(kind, text, raw=buf[pos:m.end()])
-            pos = m.end()
-        rest = buf[pos:]
-        if len(rest) > _MAX_PARTIAL_LINE:
-            text = rest.decode('utf-8', 'replace')
-            if text:
-                self._emit(kind, text, raw=rest)
-            rest = b''
-        self._line_bufs[kind] = rest
+        splitter = self._line_bufs.get(kind)
+        if splitter is None:
+            splitter = self._line_bufs[kind] = _LineSplitter()
+        lines = splitter.feed(data)
+        if not lines:
+            return
+        kind_id = KIND_IDS[kind]
+        stamp = time.monotonic_ns()
+        events = [LogEvent(kind_id, stamp, raw) for raw in lines]
+        # Colour runs of ANSI lines are worked out here, off the GUI thread;
+        # one scan of the read tells whether any line has escapes.
+        if b'\x1b' in b''.join(lines):
+            for ev in events:
+                ev.prepare()
+        self._publish(events)
 
     def snapshot_log(self):
         """Thread-safe copy of the retained log lines (oldest first)."""
-        with self._log_lock:
-            return list(self.log_buffer)
+        return self.history.snapshot()
 
     def clear_log(self):
         """Drop the retained console history (backs the GUI 'clear' action)."""
-        with self._log_lock:
-            self.log_buffer.clear()
+        self.history.clear()
+
+    def history_stats(self):
+        """Retained console history: events, bytes and the fair-share quota."""
+        return self.history.stats()
 
     # ------------------------------------------------------------- logging
     @property
     def logging_to_file(self):
-        return self._log_fh is not None
+        return self._log_writer is not None
+
+    def log_stats(self):
+        """Log file writer queue depth and flush latency, or None when off."""
+        writer = self._log_writer
+        return writer.stats() if writer else None
 
     def start_logging(self, path):
         """Start (or switch) logging all serial activity to ``path``."""
@@ -397,7 +653,7 @@ class PortService:
         return ok
 
     def stop_logging(self):
-        if self._log_fh is not None:
+        if self._log_writer is not None:
             self._emit('status', 'logging stopped')
         with self._log_lock:
             self._close_log_locked()
@@ -409,10 +665,13 @@ class PortService:
 
     def _open_log_locked(self, path):
         try:
-            self._log_fh = open(path, 'a', encoding='utf-8')
+            self._log_writer = LogWriter(path,
+                                         flush_interval=self.config.log_flush_interval,
+                                         fsync_interval=self.config.log_fsync_interval,
+                                         formatter=TextRecordFormatter())
             return True
         except OSError as exc:
-            self._log_fh = None
+            self._log_writer = None
             self.logger.error('cannot open log file %s: %s', path, exc)
             return False
 
@@ -421,34 +680,86 @@ class PortService:
             self._close_log_locked()
 
     def _close_log_locked(self):
-        if self._log_fh is not None:
+        if self._log_writer is not None:
+            self._log_writer.close()
+            self._log_writer = None
+
+    def _emit(self, kind, text=None, raw=None):
+        ev = LogEvent(KIND_IDS[kind], time.monotonic_ns(), raw, text)
+        ev.prepare()
+        self._publish([ev])
+
+    def _publish(self, events):
+        # The lines of one read go into the history under one lock.
+        self.history.extend(events)
+        with self._log_lock:
+            if self._log_writer is not None:
+                for ev in events:
+                    text = ev.text
+                    self._log_writer.write((ev.time, text), len(text) + 26)
+        if self.events is not None:
+            self.events.extend(events)
+        for ev in events:
             try:
-                self._log_fh.close()
+                self._on_event(self, ev)
             except Exception:
-                pass
-            self._log_fh = None
-
-    @staticmethod
-    def _log_timestamp():
-        now = datetime.now()
-        return now.strftime('[%d.%m.%y %H:%M:%S:') + '{:03d}]'.format(now.microsecond // 1000)
-
-    def _emit(self, kind, text, raw=None):
-        now = datetime.now()
-        ts = now.strftime('%H:%M:%S:') + '{:03d}'.format(now.microsecond // 1000)
-        ev = LogEvent(kind, text, ts, raw)
-        with self._log_lock:
-            self.log_buffer.append(ev)
-            if self._log_fh is not None:
-                try:
-                    self._log_fh.write('{} {}\n'.format(self._log_timestamp(), text))
-                    self._log_fh.flush()
-                except Exception:
-                    pass
-        try:
-            self._on_event(self, ev)
-        except Exception:
-            self.logger.exception('event handler failed')
+                self.logger.exception('event handler failed')
+
+
+class _LineSplitter:
+    """Split one byte stream into lines at CR, LF or CRLF.
+
+    The partial line lives in a bytearray and only the new bytes are scanned
+    for terminators, so a device trickling a long line costs O(n), not a
+    copy of the whole partial line per read. A line cut at
+    ``_MAX_PARTIAL_LINE`` ends on a UTF-8 character boundary, the incomplete
+    character's bytes starting the next line.
+
+    Nothing is decoded here, so there is no incremental ``codecs`` decoder:
+    a LogEvent keeps its raw line and decodes it whole on first read, which
+    makes a character split across reads a non-issue everywhere but at the
+    cap. There :func:`_utf8_boundary` holds back exactly the bytes an
+    incremental decoder would keep buffered, by looking at the last four.
+    """
+
+    __slots__ = ('_raw',)
+
+    def __init__(self):
+        self._raw = bytearray()
+
+    def feed(self, data):
+        """The raw lines completed by ``data``, terminator included; the
+        remainder is kept. Bare terminators (e.g. the LF of a CRLF split
+        across reads) are dropped."""
+        lines = []
+        raw = self._raw
+        pos = 0
+        for m in _LINE_TERMINATORS.finditer(data):
+            start, end = m.span()
+            if raw or start > pos:
+                raw += data[pos:end]
+                lines.append(bytes(raw))
+                raw.clear()
+            pos = end
+        if pos < len(data):
+            raw += data[pos:]
+            if len(raw) > _MAX_PARTIAL_LINE:
+                cut = _utf8_boundary(raw)
+                lines.append(bytes(raw[:cut]))
+                del raw[:cut]
+        return lines
+
+
+def _utf8_boundary(buf):
+    """Length of ``buf`` without a trailing incomplete UTF-8 character."""
+    for back in range(1, min(4, len(buf)) + 1):
+        byte = buf[-back]
+        if byte < 0x80:
+            return len(buf)             # ASCII: nothing incomplete
+        if byte >= 0xc0:                # lead byte of a 2-, 3- or 4-byte char
+            need = 2 if byte < 0xe0 else 3 if byte < 0xf0 else 4
+            return len(buf) - back if back < need else len(buf)
+    return len(buf)                     # stray continuation bytes: invalid anyway
 
 
 def _addr(address):
@@ -1,43 +1,178 @@
 
-from serialtcp.server import SerialServer
-from serialtcp.serial_port import SerialPort
+from serialtcp.server import create_server, ENGINES, ENGINE_SELECTOR, ENGINE_THREADS
+from serialtcp.client import DEFAULT_SEND_QUEUE, SLOW_CLIENT_POLICIES, SLOW_CLIENT_DROP_OLDEST, DEFAULT_RECV_BUFFER
+from serialtcp.serial_port import SerialPort, READERS, READER_PYSERIAL
+from serialtcp.event_loop import get_event_loop
+from serialtcp.service import PortService, PortConfig, configs_from_data, STATUS_RUNNING, STATUS_RECONNECTING
+from serialtcp.workers import WorkerPool
+from serialtcp.telnet import TelnetDecoder, TELNET_CHAR_MODE
+from serialtcp.charmap import CHAR_MAPS, MapStream, compile_maps
+from serialtcp.logwriter import LogWriter, DEFAULT_FLUSH_INTERVAL
+from serialtcp.logformat import HexRecordFormatter, hex_record_size
+from serialtcp.capture import CaptureWriter, DIR_RX, DIR_TX, client_ids
+from serialtcp.metrics import MetricsCache, MetricsServer
+import re
 import time
 import signal
 import sys
-from datetime import datetime
+import threading
 
 import logging
 
 logger = logging.getLogger('Main')
 
-# Character mappings: name -> (direction, from_bytes, to_bytes)
-# I = input from device (serial RX), O = output to device (serial TX)
-CHAR_MAPS = {
-    'INLCRNL': ('input',  b'\n',   b'\r\n'),
-    'ICRNL':   ('input',  b'\r',   b'\n'),
-    'IGNCR':   ('input',  b'\r',   b''),
-    'IGNLF':   ('input',  b'\n',   b''),
-    'OCRNULNL':('output', b'\r\x00', b'\n'),
-    'OCRNLNL': ('output', b'\r\n', b'\n'),
-    'ONLCRNL': ('output', b'\n',   b'\r\n'),
-    'ONLCR':   ('output', b'\n',   b'\r'),
-    'OCRNL':   ('output', b'\r',   b'\n'),
-    'ODELBS':  ('output', b'\x7f', b'\x08'),
-    'OBSDEL':  ('output', b'\x08', b'\x7f'),
-}
 
+# Client request to shut the whole service down. A regex so the check also
+# works on the memoryviews handed over in --zero-copy mode.
+_EXIT_CMD = re.compile(re.escape(b'exit\xff'))
 
-def _apply_maps(data, maps):
-    for src, dst in maps:
-        data = data.replace(src, dst)
-    return data
 
+def _install_stop_signals(handler):
+    """Route SIGTERM (and SIGHUP where it exists) to ``handler``."""
+    signal.signal(signal.SIGTERM, handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, handler)
+
+
+def load_port_configs(path):
+    """Read the mappings of a Port Manager YAML config (requires PyYAML).
+
+    Raises ValueError if the file is not valid YAML.
+    """
+    import yaml
+    with open(path, 'r') as fh:
+        try:
+            data = yaml.safe_load(fh)
+        except yaml.YAMLError as e:
+            raise ValueError(str(e))
+    return configs_from_data(data)
+
+
+def _start_metrics(port, host, source):
+    """MetricsServer for ``--metrics-port``; None when off or it cannot bind."""
+    if port is None:
+        return None
+    host = host or '127.0.0.1'
+    try:
+        server = MetricsServer(MetricsCache(source), port, host=host)
+    except OSError as e:
+        logger.error("cannot serve metrics on {}:{}: {}".format(host, port, e))
+        return None
+    print("Metrics on http://{}:{}/metrics".format(host, server.port))
+    return server
+
+
+class _CliStats:
+    """What metrics.render reads from a PortService, for start_service."""
+
+    def __init__(self, device, tcp_port):
+        self.config = PortConfig(device=device, tcp_port=tcp_port)
+        self.started_at = time.time()
+        self.server = None
+        self.serial_port = None
+        self.log_file = None
+        self.capture = None
+        self.rx_total = 0
+        self.tx_total = 0
+        self.reconnect_attempt = 0
+
+    @property
+    def client_count(self):
+        return len(self.server.get_clients()) if self.server else 0
+
+    @property
+    def serial_connected(self):
+        return bool(self.serial_port and self.serial_port.is_connected)
+
+    @property
+    def status(self):
+        if self.client_count and not self.serial_connected:
+            return STATUS_RECONNECTING
+        return STATUS_RUNNING
+
+    @property
+    def uptime(self):
+        return time.time() - self.started_at
+
+    @property
+    def dropped_total(self):
+        return self.server.dropped_bytes if self.server else 0
+
+    @property
+    def echo_mismatches(self):
+        return self.serial_port.echo_mismatches if self.serial_port else 0
+
+    @property
+    def echo_timeouts(self):
+        return self.serial_port.echo_timeouts if self.serial_port else 0
+
+    def client_stats(self):
+        if not self.server:
+            return []
+        return [{'queued_bytes': c.queued_bytes} for c in self.server.get_clients()]
+
+    def log_stats(self):
+        return self.log_file.stats() if self.log_file else None
+
+    def capture_stats(self):
+        return self.capture.stats() if self.capture else None
+
+    def latency_stats(self):
+        return None
+
+    def history_stats(self):
+        return None
+
+
+def start_services(configs, stop=None, workers=0, metrics_port=None, metrics_host=None):
+    """Run every mapping in ``configs`` until stopped.
+
+    Each mapping is a :class:`~serialtcp.service.PortService`, in this process
+    or, with ``workers``, spread over that many worker processes. A mapping
+    whose TCP port cannot be bound is logged and skipped. Without a ``stop``
+    event, one set of signal handlers stops them all. With ``metrics_port``,
+    Prometheus metrics of all of them are served on that port. Returns the
+    number of mappings that were started.
+    """
+    if stop is None:
+        stop = threading.Event()
+        _install_stop_signals(lambda *args: stop.set())
+
+    def on_event(service, event):
+        if event.kind not in ('rx', 'tx'):
+            logger.info("{}: {}".format(service.config.label, event.text))
+
+    pool = WorkerPool(workers, on_event=on_event) if workers else None
+    services = []
+    for cfg in configs:
+        service = pool.create_service(cfg) if pool else PortService(cfg, on_event=on_event)
+        try:
+            service.start()
+        except Exception as e:
+            logger.error("{} <-> TCP {}: cannot start: {}".format(cfg.device, cfg.tcp_port, e))
+            continue
+        print("Device {} <-> TCP {}".format(cfg.device, cfg.tcp_port))
+        services.append(service)
+
+    metrics = None
+    if services:
+        metrics = _start_metrics(metrics_port, metrics_host, lambda: list(services))
+        try:
+            while not stop.wait(1):
+                for service in services:
+                    service.poll()
+        except KeyboardInterrupt:
+            pass
 
-def _format_log_entry(direction, data):
-    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    hex_part = ' '.join('{:02x}'.format(b) for b in data)
-    ascii_part = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data)
-    return '[{}] {} {}: {} | {}\n'.format(ts, direction, len(data), hex_part, ascii_part)
+    logger.debug("shutting down {} services".format(len(services)))
+    if metrics:
+        metrics.close()
+    for service in services:
+        service.stop()
+    if pool:
+        pool.close()
+    logger.debug("services stopped")
+    return len(services)
 
 
 def start_service(**kwargs):
@@ -47,66 +182,69 @@ def start_service(**kwargs):
 
     log_file = None
     if kwargs.get('log'):
-        log_file = open(kwargs['log'], 'a')
-
-    input_maps = []
-    output_maps = []
-    if kwargs.get('map'):
-        for name in kwargs['map'].split(','):
-            name = name.strip().upper()
-            if name not in CHAR_MAPS:
-                print("Unknown map: {}, available: {}".format(name, ', '.join(CHAR_MAPS)))
-                sys.exit(1)
-            direction, src, dst = CHAR_MAPS[name]
-            (input_maps if direction == 'input' else output_maps).append((src, dst))
+        log_file = LogWriter(kwargs['log'],
+                             flush_interval=kwargs.get('log_flush_interval', DEFAULT_FLUSH_INTERVAL),
+                             fsync_interval=kwargs.get('log_fsync_interval', 0.0),
+                             formatter=HexRecordFormatter())
+
+    capture = None
+    if kwargs.get('capture'):
+        capture = CaptureWriter(kwargs['capture'],
+                                flush_interval=kwargs.get('log_flush_interval', DEFAULT_FLUSH_INTERVAL),
+                                fsync_interval=kwargs.get('log_fsync_interval', 0.0))
+    next_client_ids = client_ids()
+    stats = _CliStats(device, tcp_port)
+    stats.log_file = log_file
+    stats.capture = capture
+
+    try:
+        input_map, output_map = compile_maps(kwargs.get('map'))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
 
     stop = []
 
     def request_stop(*args):
         stop.append(1)
 
-    signal.signal(signal.SIGTERM, request_stop)
-    if hasattr(signal, 'SIGHUP'):
-        signal.signal(signal.SIGHUP, request_stop)
-
-    def strip_telnet_commands(data):
-        """Remove Telnet IAC sequences (3-byte commands) from data."""
-        result = bytearray()
-        i = 0
-        while i < len(data):
-            if data[i] == 0xff and i + 2 < len(data) and data[i + 1] in (0xfb, 0xfc, 0xfd, 0xfe):
-                i += 3  # skip IAC WILL/WONT/DO/DONT <option>
-            else:
-                result.append(data[i])
-                i += 1
-        return bytes(result)
+    _install_stop_signals(request_stop)
 
-    def on_tcp_receive(data):
-        if 'exit\xff'.encode() in data:
+    def on_tcp_receive(data, telnet=None, client_id=0, to_serial=None):
+        if _EXIT_CMD.search(data):
             stop.append(1)
         else:
-            if kwargs.get('char_mode', False):
-                data = strip_telnet_commands(data)
+            if telnet is not None:
+                data = telnet.feed(data)
                 if not data:
                     return
-            if output_maps:
-                data = _apply_maps(data, output_maps)
-            if log_file:
-                log_file.write(_format_log_entry('TX', data))
-                log_file.flush()
-            serial_port.send(data)
+            if capture:
+                capture.record(DIR_TX, data, client_id)
+            (to_serial or send_serial)(data)
+
+    def send_serial(data):
+        stats.tx_total += len(data)
+        if log_file:
+            log_file.write(('TX', time.time(), bytes(data)), hex_record_size(data))
+        serial_port.send(data)
 
     def on_serial_receive(data):
+        stats.rx_total += len(data)
         if log_file:
-            log_file.write(_format_log_entry('RX', data))
-            log_file.flush()
-        if input_maps:
-            data = _apply_maps(data, input_maps)
+            log_file.write(('RX', time.time(), bytes(data)), hex_record_size(data))
+        if capture:
+            capture.record(DIR_RX, data)
+        to_clients(data)
+
+    def send_clients(data):
         server.send_to_all(data)
 
-    # Telnet negotiation: switch client to character-at-a-time mode
-    TELNET_CHAR_MODE = b'\xff\xfb\x01' \
-                       b'\xff\xfb\x03'  # IAC WILL ECHO, IAC WILL SUPPRESS-GO-AHEAD
+    # Selected --map rules, compiled once; they keep their state across chunks.
+    # Each client writes through its own output stream (held-back bytes are
+    # per stream), created on connect.
+    input_stream = MapStream(input_map, send_clients) if input_map else None
+    to_clients = input_stream.write if input_stream else send_clients
+    client_streams = {}
 
     def on_tcp_connect(client):
         logger.debug("tcp client connected: {}".format(client.address))
@@ -114,7 +252,17 @@ def start_service(**kwargs):
             logger.debug("opening serial port for first client")
         serial_port.ensure_open()
 
-        if kwargs.get('char_mode', False):
+        char_mode = kwargs.get('char_mode', False)
+        if char_mode or capture or output_map:
+            # one decoder per client: IAC sequences may span its recv chunks
+            telnet = TelnetDecoder() if char_mode else None
+            client_id = next(next_client_ids)
+            to_serial = None
+            if output_map:
+                client_streams[client] = MapStream(output_map.clone(), send_serial)
+                to_serial = client_streams[client].write
+            client.set_on_received(lambda data: on_tcp_receive(data, telnet, client_id, to_serial))
+        if char_mode:
             client.send(TELNET_CHAR_MODE)
 
         if debug:
@@ -125,11 +273,24 @@ def start_service(**kwargs):
                 client.send('\x02Device: {} is not accessible\x03\r\n'.format(serial_port.serial.port).encode())
 
     def on_tcp_disconnect(client):
+        stream = client_streams.pop(client, None)
+        if stream is not None:
+            stream.close()
         remaining = len(server.get_clients())
         logger.debug("tcp client disconnected: {}, remaining: {}".format(client.address, remaining))
         if remaining == 0:
-            logger.debug("last client disconnected, closing serial port")
-            serial_port.close()
+            if engine == ENGINE_SELECTOR:
+                # Runs on the shared loop thread: close() waits for the TX
+                # flush and joins threads, so it must not run here.
+                threading.Thread(target=close_serial_if_idle, daemon=True).start()
+            else:
+                close_serial_if_idle()
+
+    def close_serial_if_idle():
+        if server.get_clients():
+            return          # a client connected again meanwhile
+        logger.debug("last client disconnected, closing serial port")
+        serial_port.close()
 
     def on_serial_connect():
         logger.debug("serial device connected: {}".format(serial_port.serial.port))
@@ -141,6 +302,10 @@ def start_service(**kwargs):
         if debug:
             server.send_to_all('\x02Device: {} is disconnected\x03\r\n'.format(serial_port.serial.port).encode())
 
+    engine = kwargs.get('engine') or ENGINE_THREADS
+    if engine == ENGINE_SELECTOR:
+        kwargs['event_loop'] = get_event_loop()
+
     serial_port = SerialPort(device,
                              on_received=on_serial_receive,
                              on_connect=on_serial_connect,
@@ -148,13 +313,21 @@ def start_service(**kwargs):
                              keep_active=True,
                              **kwargs)
 
-    server = SerialServer(tcp_port,
-                          on_tcp_receive=on_tcp_receive,
-                          on_client_connect=on_tcp_connect,
-                          on_client_disconnect=on_tcp_disconnect)
+    server = create_server(tcp_port,
+                           engine=engine,
+                           send_queue=kwargs.get('send_queue', DEFAULT_SEND_QUEUE),
+                           slow_client=kwargs.get('slow_client', SLOW_CLIENT_DROP_OLDEST),
+                           recv_buffer=kwargs.get('recv_buffer', DEFAULT_RECV_BUFFER),
+                           zero_copy=kwargs.get('zero_copy', False),
+                           on_tcp_receive=on_tcp_receive,
+                           on_client_connect=on_tcp_connect,
+                           on_client_disconnect=on_tcp_disconnect)
 
     logger.debug("starting service on tcp port {} for device {}".format(tcp_port, device))
     server.run()
+    stats.server = server
+    stats.serial_port = serial_port
+    metrics = _start_metrics(kwargs.get('metrics_port'), kwargs.get('metrics_host'), lambda: [stats])
 
     while not stop:
         try:
@@ -166,8 +339,18 @@ def start_service(**kwargs):
     server.send_to_all('\x02Session is closed\x03\r\n\x04'.encode())
     server.stop()
     serial_port.close()
+    # After the serial close: no more RX reaches the maps, and the
+    # releaser must not flush held bytes to the stopped server.
+    if input_stream:
+        input_stream.close()
+    for stream in list(client_streams.values()):
+        stream.close()
+    if metrics:
+        metrics.close()
     if log_file:
         log_file.close()
+    if capture:
+        capture.close()
     logger.debug("service stopped")
 
 def parse_args():
@@ -182,12 +365,49 @@ def parse_args():
         default=False
     )
 
+    aparse.add_argument(
+        '--config',
+        help='run every mapping of a Port Manager YAML config (ports: list) '
+             'in this process instead of a single -p/-d pair',
+        default=None
+    )
+
+    aparse.add_argument(
+        '--workers',
+        type=int,
+        help='with --config, spread the mappings over this many worker '
+             'processes, default: 0 (all in this process)',
+        default=0
+    )
+
     aparse.add_argument(
         '--log',
         help='log serial port I/O to file',
         default=None
     )
 
+    aparse.add_argument(
+        '--log-flush-interval',
+        type=float,
+        help='with --log, longest time a record waits before it is written, '
+             'default: {}s'.format(DEFAULT_FLUSH_INTERVAL),
+        default=DEFAULT_FLUSH_INTERVAL
+    )
+
+    aparse.add_argument(
+        '--log-fsync-interval',
+        type=float,
+        help='with --log, fsync the file at most this often, default: 0 (never)',
+        default=0.0
+    )
+
+    aparse.add_argument(
+        '--capture',
+        help='record serial port I/O with timestamps to a binary capture '
+             'file (plus a .idx time index next to it)',
+        default=None
+    )
+
     aparse.add_argument(
         '--map',
         help='character mappings, comma-separated. '
@@ -197,6 +417,27 @@ def parse_args():
         default=None
     )
 
+    aparse.add_argument(
+        '--engine',
+        choices=ENGINES,
+        help='data-plane engine: one thread per TCP client, or one shared '
+             'selector loop for every socket and the serial device, default: threads',
+        default=ENGINE_THREADS
+    )
+
+    aparse.add_argument(
+        '--metrics-port',
+        type=int,
+        help='serve Prometheus metrics at http://HOST:PORT/metrics, default: off',
+        default=None
+    )
+
+    aparse.add_argument(
+        '--metrics-host',
+        help='address for --metrics-port, default: 127.0.0.1',
+        default='127.0.0.1'
+    )
+
     aparse.add_argument(
         '-v', '--verbose',
         choices=['debug', 'info', 'warn', 'error', 'fatal'],
@@ -213,6 +454,34 @@ def parse_args():
         help='TCP listen port'
     )
 
+    group_tcp.add_argument(
+        '--send-queue',
+        type=int,
+        help='per-client outbound queue size in bytes, default: {}'.format(DEFAULT_SEND_QUEUE),
+        default=DEFAULT_SEND_QUEUE
+    )
+
+    group_tcp.add_argument(
+        '--slow-client',
+        choices=SLOW_CLIENT_POLICIES,
+        help='what to do when a client\'s queue is full, default: drop_oldest',
+        default=SLOW_CLIENT_DROP_OLDEST
+    )
+
+    group_tcp.add_argument(
+        '--recv-buffer',
+        type=int,
+        help='bytes read from a client per call, default: {}'.format(DEFAULT_RECV_BUFFER),
+        default=DEFAULT_RECV_BUFFER
+    )
+
+    group_tcp.add_argument(
+        '--zero-copy',
+        action='store_true',
+        help='read clients with recv_into on a reusable buffer (default off)',
+        default=False
+    )
+
     group = aparse.add_argument_group('serial port')
 
     group.add_argument(
@@ -238,6 +507,14 @@ def parse_args():
         help='enable software flow control (default off)',
         default=False)
 
+    group.add_argument(
+        '--serial-reader',
+        choices=READERS,
+        help='receive backend: pyserial reads, or poll() + one readv() per '
+             'wakeup on the tty fd (Linux), default: pyserial',
+        default=READER_PYSERIAL
+    )
+
     group.add_argument(
         '-cm', '--char-mode',
         action='store_true',
@@ -252,6 +529,14 @@ def parse_args():
         default=0
     )
 
+    group.add_argument(
+        '--char-burst',
+        action='store_true',
+        help='with a char delay below 1ms, send paced multi-character bursts '
+             'at the same average rate (default off)',
+        default=False
+    )
+
     group.add_argument(
         '-we', '--wait-echo',
         type=float,
@@ -259,6 +544,13 @@ def parse_args():
         default=0
     )
 
+    group.add_argument(
+        '-ew', '--echo-window',
+        type=int,
+        help='with --wait-echo, characters sent ahead of their echo, default: 1',
+        default=1
+    )
+
     args = aparse.parse_args()
 
     log_fmt = '[%(asctime)s:%(msecs)03d]:%(name)s:%(levelname)s:%(message)s'
@@ -278,7 +570,22 @@ def parse_args():
     for k,v in vars(args).items():
         logger.debug("{}: {}".format(k, v))
 
-    if args.device and args.tcp_port:
+    if args.config:
+        try:
+            configs = load_port_configs(args.config)
+        except ImportError:
+            print("--config needs PyYAML: pip install pyyaml")
+            sys.exit(1)
+        except (OSError, ValueError) as e:
+            print("Cannot read config {}: {}".format(args.config, e))
+            sys.exit(1)
+        if not configs:
+            print("No mappings in {}".format(args.config))
+            sys.exit(1)
+        if not start_services(configs, workers=args.workers,
+                              metrics_port=args.metrics_port, metrics_host=args.metrics_host):
+            sys.exit(1)
+    elif args.device and args.tcp_port:
         print("Device {args.device} <-> TCP {args.tcp_port}".format(**locals()))
         start_service(**vars(args))
     else:
@@ -0,0 +1,108 @@
+"""Streaming Telnet command decoder for char-mode TCP clients.
+
+In char mode the server asks the client to go character-at-a-time
+(:data:`TELNET_CHAR_MODE`), and a Telnet client then mixes IAC command
+sequences into its data. :class:`TelnetDecoder` removes them so only payload
+reaches the serial device. It keeps its parser state between ``feed`` calls,
+so a sequence split across two ``recv`` chunks is still removed whole; use one
+decoder per client.
+
+Most chunks carry no IAC byte at all and are returned unchanged without being
+copied. Otherwise the decoder jumps from one 0xFF to the next with
+``bytes.find`` instead of walking every byte.
+"""
+
+import re
+
+IAC = 0xff
+SE = 0xf0     # end of subnegotiation
+SB = 0xfa     # start of subnegotiation
+WILL = 0xfb
+WONT = 0xfc
+DO = 0xfd
+DONT = 0xfe
+
+# Telnet negotiation: switch client to character-at-a-time mode
+TELNET_CHAR_MODE = b'\xff\xfb\x01' \
+                   b'\xff\xfb\x03'  # IAC WILL ECHO, IAC WILL SUPPRESS-GO-AHEAD
+
+# Parser states
+_DATA = 0       # plain payload
+_COMMAND = 1    # after IAC
+_OPTION = 2     # after IAC WILL/WONT/DO/DONT: the option byte follows
+_SUB = 3        # inside IAC SB ... IAC SE
+_SUB_IAC = 4    # IAC inside a subnegotiation
+
+# memoryviews (zero-copy receive) have no find(); a regex scans them in place.
+_IAC_RE = re.compile(b'\xff')
+
+
+def _find_iac(data, start):
+    if isinstance(data, memoryview):
+        m = _IAC_RE.search(data, start)
+        return m.start() if m else -1
+    return data.find(b'\xff', start)
+
+
+class TelnetDecoder:
+    """Strip Telnet commands from a client's byte stream.
+
+    ``IAC IAC`` yields one literal 0xFF byte; option negotiation
+    (``IAC WILL/WONT/DO/DONT <option>``), subnegotiation
+    (``IAC SB ... IAC SE``) and two-byte commands (``IAC NOP``, ``IAC GA``,
+    ...) are dropped. ``commands`` counts the sequences removed so far.
+    """
+
+    def __init__(self):
+        self._state = _DATA
+        self.commands = 0
+
+    def feed(self, data):
+        """Return the payload of ``data``; ``data`` itself when it has no IAC."""
+        if self._state == _DATA and _find_iac(data, 0) < 0:
+            return data
+        out = bytearray()
+        pos = 0
+        end = len(data)
+        while pos < end:
+            state = self._state
+            if state == _DATA:
+                i = _find_iac(data, pos)
+                if i < 0:
+                    out += data[pos:]
+                    break
+                out += data[pos:i]
+                pos = i + 1
+                self._state = _COMMAND
+            elif state == _COMMAND:
+                byte = data[pos]
+                pos += 1
+                if byte == IAC:
+                    out.append(IAC)
+                    self._state = _DATA
+                elif WILL <= byte <= DONT:
+                    self._state = _OPTION
+                elif byte == SB:
+                    self._state = _SUB
+                else:
+                    self.commands += 1
+                    self._state = _DATA
+            elif state == _OPTION:
+                pos += 1
+                self.commands += 1
+                self._state = _DATA
+            elif state == _SUB:
+                i = _find_iac(data, pos)
+                if i < 0:
+                    break
+                pos = i + 1
+                self._state = _SUB_IAC
+            else:   # _SUB_IAC
+                byte = data[pos]
+                pos += 1
+                if byte == SE:
+                    self.commands += 1
+                    self._state = _DATA
+                else:           # IAC IAC (escaped data) inside the subnegotiation
+                    self._state = _SUB
+        return bytes(out)
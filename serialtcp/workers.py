@@ -0,0 +1,487 @@
+"""Run :class:`~serialtcp.service.PortService` instances in worker processes.
+
+One Python process is bounded by the GIL: with many busy high-baud mappings
+the serial and socket threads of all of them compete for one core. A
+:class:`WorkerPool` spreads the mappings over N worker processes instead. Each
+worker owns a subset of the services; the parent holds a :class:`ServiceProxy`
+per mapping that looks like a ``PortService`` to the GUI, the REST API and the
+headless CLI.
+
+Control calls (``start``, ``stop``, ...) travel to the worker over its pipe and
+wait for the reply; ``send_to_serial`` is fire-and-forget. In the other
+direction each worker streams LogEvents in batches (see
+:class:`~serialtcp.service.EventBatcher`) and a stats snapshot of its services
+every :data:`STATS_INTERVAL`, which the proxies serve from.
+
+The pool supervises its workers: when one dies, it is respawned and the
+mappings that were running on it are started again.
+"""
+
+import time
+import queue
+import signal
+import logging
+import threading
+import itertools
+import multiprocessing
+
+from serialtcp.history import LogHistory, NullHistory
+from serialtcp.service import (
+    PortConfig, PortService, EventBatcher, STATUS_STOPPED, EVENT_BATCH_DELAY, _LOG_HISTORY,
+)
+
+# How often a worker sends the stats of its services to the parent.
+STATS_INTERVAL = 0.25
+
+# How long a control call waits for the worker's reply.
+CALL_TIMEOUT = 10.0
+
+# Seconds between PortService.poll() calls inside a worker (reconnect notices).
+_POLL_INTERVAL = 1.0
+
+_log = logging.getLogger('WorkerPool')
+
+
+def _snapshot(service):
+    """The PortService state a ServiceProxy serves, as plain picklable data."""
+    return {
+        'running': service.running,
+        'status': service.status,
+        'serial_connected': service.serial_connected,
+        'client_count': service.client_count,
+        'local_client': service.local_client,
+        'tx_total': service.tx_total,
+        'rx_total': service.rx_total,
+        'reconnect_attempt': service.reconnect_attempt,
+        'started_at': service.started_at,
+        'dropped_total': service.dropped_total,
+        'echo_mismatches': service.echo_mismatches,
+        'echo_timeouts': service.echo_timeouts,
+        'pacing': service.pacing_stats(),
+        'clients': service.client_stats(),
+        'logging_to_file': service.logging_to_file,
+        'log_writer': service.log_stats(),
+        'capture_writer': service.capture_stats(),
+        'latency': service.latency_stats(),
+    }
+
+
+_STOPPED = {
+    'running': False,
+    'status': STATUS_STOPPED,
+    'serial_connected': False,
+    'client_count': 0,
+    'local_client': False,
+    'tx_total': 0,
+    'rx_total': 0,
+    'reconnect_attempt': 0,
+    'started_at': None,
+    'dropped_total': 0,
+    'echo_mismatches': 0,
+    'echo_timeouts': 0,
+    'pacing': None,
+    'clients': [],
+    'logging_to_file': False,
+    'log_writer': None,
+    'capture_writer': None,
+    'latency': None,
+}
+
+
+# ------------------------------------------------------------------ worker
+class _Worker:
+    """Worker-process side: owns the services, answers the parent's calls.
+
+    The main thread reads requests off the pipe; one sender thread is the only
+    writer to it and batches events, replies and periodic stats.
+    """
+
+    def __init__(self, conn, stats_interval):
+        self.conn = conn
+        self.stats_interval = stats_interval
+        self.services = {}
+        self.out = queue.Queue()
+
+    def run(self):
+        sender = threading.Thread(target=self._send_loop, name='worker-sender', daemon=True)
+        sender.start()
+        try:
+            while True:
+                try:
+                    msg = self.conn.recv()
+                except (EOFError, OSError):
+                    break            # parent is gone
+                if msg[0] == 'exit':
+                    break
+                if msg[0] == 'call':
+                    _, rid, sid, method, args = msg
+                    try:
+                        value = self._dispatch(sid, method, args)
+                        self.out.put(('reply', rid, True, value))
+                    except Exception as e:
+                        self.out.put(('reply', rid, False, _picklable(e)))
+                elif msg[0] == 'cast':
+                    _, sid, method, args = msg
+                    try:
+                        self._dispatch(sid, method, args)
+                    except Exception:
+                        logging.getLogger('Worker').exception('{} failed'.format(method))
+        finally:
+            for service in self.services.values():
+                service.stop()
+                service.events.flush(force=True)
+            self.out.put(None)
+            sender.join(timeout=2)
+
+    def _dispatch(self, sid, method, args):
+        if method == 'start':
+            config = PortConfig.from_dict(args[0])
+            service = self.services.get(sid)
+            if service is None:
+                events = EventBatcher(lambda batch: self.out.put(('events', sid, batch)))
+                # The parent's ServiceProxy keeps the history; a second copy
+                # here would double the memory and escape its budget.
+                service = PortService(config, events=events, history=NullHistory())
+                self.services[sid] = service
+            else:
+                service.config = config
+            service.start()
+            return _snapshot(service)
+        if method == 'remove':
+            service = self.services.pop(sid, None)
+            if service:
+                service.stop()
+                service.events.flush(force=True)
+            return None
+        service = self.services.get(sid)
+        if service is None:
+            return dict(_STOPPED) if method != 'start_logging' else False
+        value = getattr(service, method)(*args)
+        if method == 'start_logging':
+            return value
+        return _snapshot(service)
+
+    def _send_loop(self):
+        next_stats = next_poll = time.monotonic()
+        while True:
+            now = time.monotonic()
+            try:
+                item = self.out.get(timeout=min(max(0.0, next_stats - now), EVENT_BATCH_DELAY))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return
+            # Hand over the tail of streams that went quiet before a full batch.
+            for service in list(self.services.values()):
+                service.events.flush()
+            events = []
+            replies = []
+            while item is not None:
+                if item:
+                    (events if item[0] == 'events' else replies).append(item)
+                try:
+                    item = self.out.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if events:
+                    self.conn.send(('events', [(sid, batch) for _, sid, batch in events]))
+                for reply in replies:
+                    self.conn.send(reply)
+                now = time.monotonic()
+                if now >= next_poll:
+                    next_poll = now + _POLL_INTERVAL
+                    for service in list(self.services.values()):
+                        service.poll()
+                if now >= next_stats:
+                    next_stats = now + self.stats_interval
+                    self.conn.send(('stats', {sid: _snapshot(s) for sid, s in list(self.services.items())}))
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+
+
+def _picklable(exc):
+    """OSError and friends pickle as-is; anything else is reduced to its text."""
+    if isinstance(exc, (OSError, ValueError, TypeError, KeyError)):
+        return exc
+    return RuntimeError('{}: {}'.format(type(exc).__name__, exc))
+
+
+def _worker_main(conn, stats_interval, log_level):
+    # Ctrl+C reaches the whole process group; the parent decides when to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=log_level,
+        format='[%(asctime)s:%(msecs)03d]:%(processName)s:%(name)s:%(levelname)s:%(message)s',
+        datefmt='%d.%m.%y %H:%M:%S')
+    _Worker(conn, stats_interval).run()
+
+
+# ------------------------------------------------------------------ parent
+def _state_property(key):
+    """Read-only attribute served from the proxy's latest worker snapshot."""
+    return property(lambda self: self._state[key])
+
+
+class ServiceProxy:
+    """Parent-side stand-in for a PortService running in a worker process.
+
+    State properties are served from the latest snapshot the worker sent;
+    control methods are forwarded and block until the worker has run them.
+    """
+
+    def __init__(self, pool, sid, config: PortConfig):
+        self.config = config
+        self.sid = sid
+        self.worker = None           # the _WorkerHandle that owns this mapping
+        self.logger = logging.getLogger('Port {}'.format(config.tcp_port))
+        self.history = LogHistory(_LOG_HISTORY)
+        self._state = dict(_STOPPED)
+        self._pool = pool
+        self._want_running = False   # restart on this mapping's worker respawn
+
+    # ------------------------------------------------------------------ state
+    running = _state_property('running')
+    status = _state_property('status')
+    serial_connected = _state_property('serial_connected')
+    client_count = _state_property('client_count')
+    local_client = _state_property('local_client')
+    tx_total = _state_property('tx_total')
+    rx_total = _state_property('rx_total')
+    reconnect_attempt = _state_property('reconnect_attempt')
+    started_at = _state_property('started_at')
+    dropped_total = _state_property('dropped_total')
+    echo_mismatches = _state_property('echo_mismatches')
+    echo_timeouts = _state_property('echo_timeouts')
+    logging_to_file = _state_property('logging_to_file')
+
+    @property
+    def has_consumers(self):
+        return self.client_count > 0 or self.local_client
+
+    @property
+    def uptime(self):
+        if self.started_at is None:
+            return 0.0
+        return time.time() - self.started_at
+
+    def pacing_stats(self):
+        return self._state['pacing']
+
+    def client_stats(self):
+        return list(self._state['clients'])
+
+    def log_stats(self):
+        return self._state['log_writer']
+
+    def capture_stats(self):
+        return self._state['capture_writer']
+
+    def latency_stats(self):
+        return self._state['latency']
+
+    # --------------------------------------------------------------- control
+    def start(self):
+        """Start the mapping in its worker. Raises what PortService.start raised."""
+        if self.running:
+            return
+        self._state = self.worker.call(self.sid, 'start', self.config.to_dict())
+        self._want_running = True
+
+    def stop(self):
+        self._want_running = False
+        if not self.running:
+            return
+        self._state = self.worker.call(self.sid, 'stop')
+
+    def connect_local(self):
+        self._state = self.worker.call(self.sid, 'connect_local')
+
+    def disconnect_local(self):
+        self._state = self.worker.call(self.sid, 'disconnect_local')
+
+    def send_to_serial(self, data: bytes):
+        if self.running:
+            self.worker.cast(self.sid, 'send_to_serial', bytes(data))
+
+    def poll(self):
+        """No-op: the worker polls its own services."""
+
+    def start_logging(self, path):
+        ok = self.worker.call(self.sid, 'start_logging', path)
+        if ok:
+            self.config.log_file = path
+        return ok
+
+    def stop_logging(self):
+        self._state = self.worker.call(self.sid, 'stop_logging')
+        self.config.log_file = ''
+
+    def snapshot_log(self):
+        return self.history.snapshot()
+
+    def clear_log(self):
+        self.history.clear()
+
+    def history_stats(self):
+        """The parent-side history the console renders from."""
+        return self.history.stats()
+
+    # ------------------------------------------------------------- callbacks
+    def _on_events(self, events):
+        self.history.extend(events)
+        for event in events:
+            try:
+                self._pool.on_event(self, event)
+            except Exception:
+                self.logger.exception('event handler failed')
+
+
+class _WorkerHandle:
+    """Parent-side end of one worker process: pipe, pending calls, reader."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.proxies = {}
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._closing = False
+        self.process = None
+        self.conn = None
+
+    def spawn(self):
+        ctx = self.pool.context
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child, self.pool.stats_interval, logging.getLogger().level),
+            name='serialtcp-worker-{}'.format(self.index),
+            daemon=True)
+        self.process.start()
+        child.close()
+        threading.Thread(target=self._read_loop, args=(self.conn,),
+                         name='worker-reader-{}'.format(self.index), daemon=True).start()
+
+    def call(self, sid, method, *args, timeout=CALL_TIMEOUT):
+        rid = next(self._ids)
+        box = {'done': threading.Event()}
+        self._pending[rid] = box
+        try:
+            self._send(('call', rid, sid, method, args))
+            if not box['done'].wait(timeout):
+                raise TimeoutError('worker {} did not answer {} within {}s'.format(
+                    self.index, method, timeout))
+        finally:
+            self._pending.pop(rid, None)
+        if not box['ok']:
+            raise box['value']
+        return box['value']
+
+    def cast(self, sid, method, *args):
+        try:
+            self._send(('cast', sid, method, args))
+        except (EOFError, OSError) as e:
+            _log.warning('worker {}: {} dropped: {}'.format(self.index, method, e))
+
+    def _send(self, msg):
+        with self._send_lock:
+            self.conn.send(msg)
+
+    def _read_loop(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = msg[0]
+            if kind == 'events':
+                for sid, batch in msg[1]:
+                    proxy = self.proxies.get(sid)
+                    if proxy is not None:
+                        proxy._on_events(batch)
+            elif kind == 'stats':
+                for sid, state in msg[1].items():
+                    proxy = self.proxies.get(sid)
+                    if proxy is not None:
+                        proxy._state = state
+            elif kind == 'reply':
+                _, rid, ok, value = msg
+                box = self._pending.get(rid)
+                if box is not None:
+                    box['ok'], box['value'] = ok, value
+                    box['done'].set()
+        if conn is self.conn and not self._closing:
+            self._respawn()
+
+    def _respawn(self):
+        """Supervisor: replace a dead worker and restart its running mappings."""
+        _log.error('worker {} (pid {}) exited with {}; respawning'.format(
+            self.index, self.process.pid, self.process.exitcode))
+        for box in list(self._pending.values()):
+            box['ok'], box['value'] = False, ConnectionError('worker {} died'.format(self.index))
+            box['done'].set()
+        self.spawn()
+        for proxy in list(self.proxies.values()):
+            restart = proxy._want_running
+            proxy._state = dict(_STOPPED)
+            if restart:
+                try:
+                    proxy.start()
+                except Exception as e:
+                    proxy._want_running = False
+                    _log.error('{}: restart failed: {}'.format(proxy.config.label, e))
+
+    def close(self, timeout=5):
+        self._closing = True
+        try:
+            self._send(('exit',))
+        except (EOFError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.conn.close()
+
+
+class WorkerPool:
+    """Spread PortService instances over ``workers`` processes.
+
+    ``on_event(proxy, event)`` is called from a reader thread for every
+    LogEvent, just like PortService's ``on_event``.
+    """
+
+    def __init__(self, workers, on_event=None, stats_interval=STATS_INTERVAL):
+        if workers < 1:
+            raise ValueError('workers must be >= 1, got {}'.format(workers))
+        self.on_event = on_event or (lambda service, event: None)
+        self.stats_interval = stats_interval
+        # spawn: forking a process that already runs I/O threads is unsafe
+        self.context = multiprocessing.get_context('spawn')
+        self._ids = itertools.count()
+        self.workers = [_WorkerHandle(self, i) for i in range(workers)]
+        for worker in self.workers:
+            worker.spawn()
+
+    def create_service(self, config: PortConfig):
+        """Return a stopped ServiceProxy for ``config`` on the least-loaded worker."""
+        proxy = ServiceProxy(self, next(self._ids), config)
+        worker = min(self.workers, key=lambda w: len(w.proxies))
+        proxy.worker = worker
+        worker.proxies[proxy.sid] = proxy
+        return proxy
+
+    def remove_service(self, proxy):
+        """Stop ``proxy`` and forget it in its worker."""
+        proxy.stop()
+        proxy.worker.proxies.pop(proxy.sid, None)
+        proxy.worker.cast(proxy.sid, 'remove')
+
+    def close(self):
+        """Stop every mapping and shut the workers down."""
+        for worker in self.workers:
+            worker.close()
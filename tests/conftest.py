@@ -11,6 +11,7 @@ import pytest
 
 from serialtcp.service import PortConfig, PortService
 from serialtcp_gui import config as config_mod
+from serialtcp_gui.console import ConsoleStats
 
 
 def free_tcp_port():
@@ -36,6 +37,9 @@ class FakeApp:
     def uptime(self):
         return time.time() - self.started_at
 
+    def console_stats(self):
+        return ConsoleStats().stats()
+
     def call_on_main(self, fn, timeout=5.0):
         return fn()
 
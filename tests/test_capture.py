@@ -0,0 +1,135 @@
+import errno
+import struct
+import threading
+
+import pytest
+
+from serialtcp import capture
+from serialtcp.capture import CaptureWriter, CaptureReader, DIR_RX, DIR_TX
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / 'session.cap')
+    writer = CaptureWriter(path)
+    writer.record(DIR_RX, b'login: ')
+    writer.record(DIR_TX, memoryview(b'root\r'), client=3)
+    writer.record(DIR_RX, b'')
+    writer.close()
+
+    with CaptureReader(path) as reader:
+        records = [(r.direction, r.client, bytes(r.data)) for r in reader]
+        stamps = [r.ts_ns for r in reader]
+        assert abs(reader.wall_time(stamps[0]) - reader.wall_ns / 1e9) < 5
+    assert records == [(DIR_RX, 0, b'login: '), (DIR_TX, 3, b'root\r'), (DIR_RX, 0, b'')]
+    assert stamps == sorted(stamps)
+
+
+def test_client_ids_wrap():
+    ids = capture.client_ids()
+    assert next(ids) == 1
+    for _ in range(65533):
+        next(ids)
+    assert next(ids) == 65535
+    assert next(ids) == 1
+
+
+def test_index_seek(tmp_path, monkeypatch):
+    path = str(tmp_path / 'big.cap')
+    monkeypatch.setattr(capture, 'INDEX_BYTES', 100)
+    clock = iter(range(0, 10 ** 6, 1000))
+    monkeypatch.setattr(capture.time, 'monotonic_ns', lambda: next(clock))
+    writer = CaptureWriter(path)
+    for i in range(200):
+        writer.record(DIR_RX, bytes([i]) * 20)
+    writer.close()
+
+    with CaptureReader(path) as reader:
+        times, offsets = reader._index
+        assert len(times) > 20
+        assert reader.offset_for(-1) == offsets[0]
+        # the header took the first clock tick: record i is stamped (i+1)*1000
+        assert [bytes(r.data)[0] for r in reader.records(50000, 53000)] == [49, 50, 51]
+        assert reader.offset_for(150500) <= reader.offset_for(160000)
+        assert len(list(reader.records(start_ns=200000))) == 1
+
+
+class _FullDisk:
+    """File stand-in that writes half of the next write, then fails with ENOSPC."""
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.armed = True
+
+    def write(self, data):
+        if self.armed:
+            self.armed = False
+            self._fh.write(data[:len(data) // 2])
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return self._fh.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+
+def test_failed_write_leaves_offsets_and_index_intact(tmp_path, monkeypatch):
+    path = str(tmp_path / 'full.cap')
+    monkeypatch.setattr(capture, 'INDEX_BYTES', 1)
+    writer = CaptureWriter(path)
+    writer.record(DIR_RX, b'first')
+    writer.flush()
+    disk = writer._writer._fh = _FullDisk(writer._writer._fh)
+    writer.record(DIR_RX, b'lost' * 100)
+    writer.flush()
+    assert not disk.armed
+    writer.record(DIR_RX, b'third')
+    writer.close()
+
+    assert writer.stats()['dropped'] == 1
+    with CaptureReader(path) as reader:
+        times, offsets = reader._index
+        assert len(offsets) == 2
+        assert [bytes(r.data) for r in reader.records(start_ns=times[-1])] == [b'third']
+        assert [bytes(r.data) for r in reader] == [b'first', b'third']
+
+
+def test_close_timeout_keeps_last_batch_and_index(tmp_path):
+    path = str(tmp_path / 'slow.cap')
+    writer = CaptureWriter(path)
+    encoder = writer._writer.formatter
+    release = threading.Event()
+
+    def stalled(records):
+        release.wait(5)
+        return type(encoder).__call__(encoder, records)
+
+    writer._writer.formatter = stalled
+    writer.record(DIR_RX, b'late')
+    assert writer.close(timeout=0.05) is False
+    assert not writer._index_fh.closed
+    release.set()
+    writer._writer._thread.join(5)
+
+    assert writer._index_fh.closed
+    with CaptureReader(path) as reader:
+        times, offsets = reader._index
+        assert len(offsets) == 1
+        assert [bytes(r.data) for r in reader.records(start_ns=times[0])] == [b'late']
+
+
+def test_torn_tail_and_missing_index(tmp_path):
+    path = str(tmp_path / 'torn.cap')
+    writer = CaptureWriter(path)
+    writer.record(DIR_RX, b'complete')
+    writer.close()
+    with open(path, 'ab') as fh:
+        fh.write(struct.pack('<QBxHI', 1, DIR_RX, 0, 100) + b'short')
+    (tmp_path / 'torn.cap.idx').unlink()
+    with CaptureReader(path) as reader:
+        assert [bytes(r.data) for r in reader.records(start_ns=0)] == [b'complete']
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / 'text.log'
+    path.write_text('[2024-01-31 12:00:00.123] RX 3: 61 62 0d | ab.\n')
+    with pytest.raises(ValueError, match='not a capture file'):
+        CaptureReader(str(path))
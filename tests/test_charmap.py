@@ -0,0 +1,155 @@
+import time
+import threading
+
+import pytest
+
+from serialtcp.charmap import CharMap, MapStream, compile_maps
+
+
+def _feed_all(charmap, chunks):
+    return b''.join(charmap.feed(chunk) for chunk in chunks) + charmap.flush()
+
+
+def test_single_byte_maps_use_translate():
+    _input, output = compile_maps('ODELBS,ONLCR')
+    assert output._pattern is None
+    assert output.feed(b'ab\x7fc\n') == b'ab\x08c\r'
+    assert output.feed(memoryview(b'\x7f')) == b'\x08'
+    assert output.pending == 0
+
+
+def test_deleting_maps():
+    input_map, _output = compile_maps(['IGNCR'])
+    assert input_map.feed(b'line\r\n') == b'line\n'
+
+
+def test_maps_split_by_direction():
+    input_map, output_map = compile_maps(' icrnl , ODELBS')
+    assert input_map.feed(b'\r') == b'\n'
+    assert output_map.feed(b'\r\x7f') == b'\r\x08'
+    assert compile_maps('') == (None, None)
+    assert compile_maps(None) == (None, None)
+
+
+def test_unknown_map_rejected():
+    with pytest.raises(ValueError, match='Unknown map: NOPE'):
+        compile_maps('ICRNL,NOPE')
+
+
+def test_longest_rule_wins_and_maps_do_not_chain():
+    _input, output = compile_maps('OCRNL,OCRNLNL')
+    assert output.feed(b'a\r\nb\rc') == b'a\nb\nc'
+    input_map, _output = compile_maps('ICRNL,INLCRNL')
+    assert input_map.feed(b'x\ry') == b'x\ny'   # not x\r\ny
+
+
+def test_multi_byte_rule_across_chunks():
+    _input, output = compile_maps('OCRNLNL')
+    assert output.feed(b'one\r') == b'one'
+    assert output.pending == 1
+    assert output.feed(b'\ntwo\r') == b'\ntwo'
+    assert output.flush() == b'\r'      # nothing followed: sent as is
+
+
+def test_every_split_gives_the_same_result():
+    rules = [(b'\r\x00', b'\n'), (b'\r\n', b'\n'), (b'\r', b'<CR>'), (b'\x7f', b'\x08')]
+    stream = b'a\r\x00b\r\nc\r\rd\x7f\r'
+    expected = _feed_all(CharMap(rules), [stream])
+    assert expected == b'a\nb\nc<CR><CR>d\x08<CR>'
+    for size in (1, 2, 3):
+        chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        assert _feed_all(CharMap(rules), chunks) == expected, size
+
+
+def test_map_stream_releases_held_tail():
+    _input, output = compile_maps('OCRNLNL')
+    out = []
+    got = threading.Event()
+
+    def sink(data):
+        out.append(data)
+        got.set()
+
+    stream = MapStream(output, sink, hold_timeout=0.02)
+    stream.write(b'cmd\r')
+    assert out == [b'cmd']
+    got.clear()
+    assert got.wait(2)
+    assert out == [b'cmd', b'\r']
+
+    out.clear()
+    stream.write(b'x\r')
+    stream.write(b'\n')                # completes the rule before the timer fires
+    time.sleep(0.05)
+    assert b''.join(out) == b'x\n'
+    stream.close()
+
+
+def test_map_streams_hold_their_own_bytes():
+    _input, output = compile_maps('OCRNLNL')
+    first, second = [], []
+    a = MapStream(output, first.append, hold_timeout=0.02)
+    b = MapStream(output.clone(), second.append, hold_timeout=0.02)
+    a.write(b'a\r')
+    b.write(b'\nb')
+    assert second == [b'\nb']
+    deadline = time.time() + 2
+    while first != [b'a', b'\r']:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_held_tails_do_not_start_a_thread_each():
+    _input, output = compile_maps('OCRNLNL')
+    out = []
+    streams = [MapStream(output.clone(), out.append, hold_timeout=0.02) for _ in range(50)]
+    for stream in streams:
+        stream.write(b'x\r')
+    threads = threading.active_count()
+    for stream in streams:
+        stream.write(b'y\r')
+    assert threading.active_count() <= threads
+    deadline = time.time() + 2
+    while b''.join(out).count(b'\r') < 50:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_stuck_sink_does_not_hold_up_other_streams():
+    _input, output = compile_maps('OCRNLNL')
+    stuck = threading.Event()
+    unstick = threading.Event()
+    released = threading.Event()
+
+    def stuck_sink(data):
+        stuck.set()
+        unstick.wait(5)               # a port whose TX never drains
+
+    a = MapStream(output.clone(), stuck_sink, hold_timeout=0.2)
+    b = MapStream(output.clone(), lambda data: released.set(), hold_timeout=0.02)
+    a.write(b'\r')                    # a tail due in 0.2 s ...
+    writer = threading.Thread(target=a.write, args=(b'y\r',), daemon=True)
+    writer.start()                    # ... while a's writer is stuck in sink
+    assert stuck.wait(2)
+    time.sleep(0.3)
+    b.write(b'\r')                    # held, then released by the shared thread
+    try:
+        assert released.wait(2)
+        a.close()                     # does not wait for the stuck sink either
+    finally:
+        unstick.set()
+    writer.join(2)
+
+
+def test_release_grows_a_full_blocking_queue():
+    from serialtcp.client import SendQueue
+    _input, output = compile_maps('OCRNLNL')
+    queue = SendQueue(4, 'block', block_timeout=None)   # like the serial TX queue
+    queue.put(b'abcd')
+    stream = MapStream(output, queue.put, hold_timeout=0.02)
+    stream.write(b'\r')
+    deadline = time.time() + 2
+    while len(queue) < 5:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert queue.get(0) == b'abcd\r'
@@ -5,6 +5,7 @@ application object implementing the same control surface as
 ``serialtcp_gui.app.App``), so no Tk window (and no display) is needed. Skipped
 when the optional API extra (fastapi/httpx) is not installed.
 """
+import time
 import socket
 
 import pytest
@@ -33,6 +34,8 @@ def test_health_ok(client):
     assert body['clients'] == 0
     assert body['uptime_s'] >= 0
     assert body['ports'] == {'total': 2, 'running': 0, 'reconnecting': 0, 'stopped': 2}
+    assert body['console'] == {'lag_s': 0.0, 'max_lag_s': 0.0,
+                               'rendered_lines': 0, 'skipped_lines': 0}
 
 
 def test_health_degraded_while_reconnecting(client, app):
@@ -46,6 +49,27 @@ def test_health_degraded_while_reconnecting(client, app):
     assert body['ports']['reconnecting'] == 1
 
 
+# ------------------------------------------------------------------ metrics
+def test_metrics_in_prometheus_format(client, app):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+    assert '# TYPE serialtcp_rx_bytes_total counter' in text
+    assert 'serialtcp_status{tcp_port="5000",device="COM3",name="Console",state="stopped"} 1' in text
+    assert 'serialtcp_clients{tcp_port="5002",device="/dev/ttyUSB0",name=""} 0' in text
+    assert 'serialtcp_console_lag_seconds 0.0' in text
+
+
+def test_metrics_snapshot_is_refreshed(client, app):
+    client.get('/metrics')
+    app.services[0].rx_total = 1234
+    deadline = time.time() + 5
+    while '} 1234' not in client.get('/metrics').text:
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
 # ------------------------------------------------------------------- config
 def test_config_snapshot(client):
     body = client.get('/config').json()
@@ -71,6 +95,8 @@ def test_list_ports(client):
     assert first['running'] is False
     assert first['listening_on'] == '127.0.0.1:5000'
     assert first['config']['baudrate'] == 115200
+    assert first['dropped_bytes'] == 0
+    assert first['client_queues'] == []
 
 
 def test_get_one_port(client):
@@ -79,6 +105,28 @@ def test_get_one_port(client):
     assert body['config']['parity'] == 'E'
 
 
+def test_port_reports_its_history_usage(client, app):
+    app.services[0]._emit('status', 'hello')
+    history = client.get('/ports/5000').json()['history']
+    assert history['events'] == 1
+    assert history['bytes'] > 0
+    assert history['quota_bytes'] > 0
+    assert history['active'] is False
+
+
+def test_port_log_reads_from_a_sequence_number(client, app):
+    for i in range(5):
+        app.services[0]._emit('status', 'line {}'.format(i))
+    body = client.get('/ports/5000/log', params={'since': 1, 'limit': 2}).json()
+    assert body['first_seq'] == 0 and body['next_seq'] == 3
+    assert [(l['seq'], l['kind'], l['text']) for l in body['lines']] == \
+        [(1, 'status', 'line 1'), (2, 'status', 'line 2')]
+    body = client.get('/ports/5000/log', params={'since': body['next_seq']}).json()
+    assert [l['text'] for l in body['lines']] == ['line 3', 'line 4']
+    assert client.get('/ports/5000/log', params={'since': 5}).json()['lines'] == []
+    assert client.get('/ports/5999/log').status_code == 404
+
+
 def test_get_unknown_port_is_404(client):
     response = client.get('/ports/9999')
     assert response.status_code == 404
@@ -108,6 +156,10 @@ def test_create_rejects_bad_values(client):
     assert client.post('/ports', json={'device': '  ', 'tcp_port': 5010}).status_code == 422
     assert client.post('/ports', json={'device': 'COM7', 'tcp_port': 5010,
                                        'line_ending': 'CRCR'}).status_code == 422
+    assert client.post('/ports', json={'device': 'COM7', 'tcp_port': 5010,
+                                       'slow_client': 'wait'}).status_code == 422
+    assert client.post('/ports', json={'device': 'COM7', 'tcp_port': 5010,
+                                       'maps': 'ICRNL,NOPE'}).status_code == 422
 
 
 def test_patch_changes_only_given_fields(client, app):
@@ -261,8 +313,8 @@ def test_api_server_bind_conflict_raises(app):
 
 def test_openapi_documents_every_endpoint(client):
     paths = client.get('/openapi.json').json()['paths']
-    assert set(paths) == {'/health', '/config', '/ports', '/ports/start-all',
-                          '/ports/stop-all', '/ports/{tcp_port}',
+    assert set(paths) == {'/health', '/metrics', '/config', '/ports', '/ports/start-all',
+                          '/ports/stop-all', '/ports/{tcp_port}', '/ports/{tcp_port}/log',
                           '/ports/{tcp_port}/start', '/ports/{tcp_port}/stop'}
     # every operation carries a summary and a description for /docs
     for path, methods in paths.items():
@@ -40,6 +40,7 @@ def test_health(run, capsys):
     out = capsys.readouterr().out
     assert 'Status:' in out and 'ok' in out
     assert '2 total - 0 running, 0 reconnecting, 2 stopped' in out
+    assert 'lag 0 ms (max 0 ms), 0 lines skipped' in out
 
 
 def test_config(run, capsys):
@@ -73,6 +74,16 @@ def test_show(run, capsys):
     assert 'Listen:' in out and '127.0.0.1:5002' in out
 
 
+def test_log(run, app, capsys):
+    for i in range(3):
+        app.services[0]._emit('status', 'line {}'.format(i))
+    assert run('log', '5000') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert [l.split('] ', 1)[1] for l in out] == ['line 0', 'line 1', 'line 2']
+    assert run('log', '5000', '-n', '1') == 0
+    assert capsys.readouterr().out.endswith('] line 2\n')
+
+
 def test_json_output(run, capsys):
     assert run('--json', 'ports') == 0
     body = json.loads(capsys.readouterr().out)
@@ -0,0 +1,160 @@
+import pickle
+
+from serialtcp.history import HistoryGovernor, LogEvent, LogHistory, KIND_IDS, _COLUMN_BYTES
+
+RX = KIND_IDS['rx']
+
+
+def _event(size, stamp=0):
+    return LogEvent(RX, stamp, b'x' * (size - 1) + b'\n')
+
+
+def _size(size):
+    return size + _COLUMN_BYTES
+
+
+def test_events_come_back_as_appended():
+    history = LogHistory(10, HistoryGovernor())
+    history.append(LogEvent(RX, 1, b'h\xc3\xa9llo\r\n'))
+    history.append(LogEvent(KIND_IDS['status'], 2, text='listening on :5000 – ok'))
+    rx, status = history.snapshot()
+    assert (rx.kind, rx.mono_ns, rx.raw, rx.text) == ('rx', 1, b'h\xc3\xa9llo\r\n', 'héllo')
+    assert (status.kind, status.raw, status.text) == ('status', None, 'listening on :5000 – ok')
+    assert pickle.loads(pickle.dumps(rx)).raw == rx.raw
+
+
+def test_colour_runs_are_kept_and_charged():
+    governor = HistoryGovernor()
+    history = LogHistory(2, governor)
+    coloured = LogEvent(RX, 0, b'\x1b[31mred\n')
+    coloured.prepare()
+    history.extend([coloured, _event(10)])
+    (_packed, cost), = history._segments.values()
+    assert cost > 2 * len(coloured.raw)          # the objects, not the line again
+    assert history.bytes == governor.used == _size(len(coloured.raw)) + cost + _size(10)
+    first, second = history.snapshot()
+    assert first._segments == (('red', 31),) and second._segments is None
+    history.extend([_event(10)] * 2)
+    assert not history._segments
+    assert history.bytes == governor.used == 2 * _size(10)
+
+
+def test_colour_runs_are_stored_packed():
+    history = LogHistory(2, HistoryGovernor())
+    coloured = LogEvent(RX, 0, 'a\x1b[31mré\x1b[0md\x1b[92m€\n'.encode('utf-8'))
+    coloured.prepare()
+    history.append(coloured)
+    (packed, _cost), = history._segments.values()
+    assert packed[0] == 'aréd€'
+    assert history.snapshot()[0]._segments == (('a', None), ('ré', 31), ('d', None), ('€', 92))
+
+
+def test_read_since_returns_only_new_events():
+    history = LogHistory(100, HistoryGovernor())
+    history.extend([_event(10, i) for i in range(5)])
+    events, cursor = history.read_since(0, limit=3)
+    assert [e.mono_ns for e in events] == [0, 1, 2] and cursor == 3
+    events, cursor = history.read_since(cursor)
+    assert [e.mono_ns for e in events] == [3, 4] and cursor == 5
+    assert history.read_since(cursor) == ([], 5)
+    history.append(_event(10, 5))
+    events, cursor = history.read_since(cursor)
+    assert [e.mono_ns for e in events] == [5] and cursor == 6
+
+
+def test_read_since_skips_dropped_events():
+    history = LogHistory(1000, HistoryGovernor())
+    history.extend([_event(10, i) for i in range(2000)])
+    assert (history.first_seq, history.next_seq, len(history)) == (1000, 2000, 1000)
+    events, cursor = history.read_since(5, limit=2)
+    assert [e.mono_ns for e in events] == [1000, 1001] and cursor == 1002
+    assert history.read_since(5000) == ([], 2000)
+
+
+def test_history_counts_bytes_and_keeps_maxlen():
+    governor = HistoryGovernor(budget=10 ** 9)
+    history = LogHistory(3, governor)
+    history.extend([_event(10), _event(20)])
+    assert history.bytes == governor.used == _size(10) + _size(20)
+    history.extend([_event(1)] * 3)
+    assert len(history) == 3
+    assert history.bytes == governor.used == 3 * _size(1)
+    history.clear()
+    assert history.bytes == governor.used == 0
+    assert history.snapshot() == []
+    assert history.next_seq == 5
+
+
+def test_arena_is_compacted():
+    history = LogHistory(10, HistoryGovernor())
+    for i in range(5000):
+        history.append(_event(100, i))
+    assert len(history._arena) <= 2 * 10 * 100 + 256 * 100
+    assert [e.mono_ns for e in history.snapshot()] == list(range(4990, 5000))
+
+
+def test_governor_evicts_down_to_the_fair_share():
+    size = _size(100)
+    governor = HistoryGovernor(budget=30 * size)
+    shown, idle, busy = (LogHistory(1000, governor) for _ in range(3))
+    shown.active = True
+    idle.extend([_event(100, 1)] * 12)
+    shown.extend([_event(100, 2)] * 10)
+    busy.extend([_event(100, 3)] * 8)
+    assert governor.evicted == 0
+    busy.extend([_event(100, 4)] * 5)    # over budget
+    assert governor.used <= governor.budget
+    assert governor.evicted == 5
+    # down to the fair share of 10 each, the shown one not at all
+    assert (len(shown), len(idle), len(busy)) == (10, 10, 10)
+
+
+def test_governor_trims_the_least_recently_appended_first():
+    size = _size(100)
+    governor = HistoryGovernor(budget=30 * size)
+    small, idle, busy = (LogHistory(1000, governor) for _ in range(3))
+    small.extend([_event(100, 1)] * 4)
+    idle.extend([_event(100, 2)] * 15)
+    busy.extend([_event(100, 3)] * 12)   # 31 > 30: evict down to 27
+    assert (len(idle), len(busy)) == (11, 12)
+
+
+def test_governor_keeps_fair_share_of_a_quiet_history():
+    size = _size(100)
+    governor = HistoryGovernor(budget=40 * size)
+    quiet, flood = LogHistory(1000, governor), LogHistory(1000, governor)
+    quiet.extend([_event(100)] * 10)
+    for i in range(100):
+        flood.append(_event(100, i))
+    assert len(quiet) == 10             # under its fair share: untouched
+    assert governor.used <= governor.budget
+    assert quiet.stats()['quota_bytes'] == 20 * size
+
+
+def test_dropped_history_leaves_the_budget():
+    size = _size(100)
+    governor = HistoryGovernor(budget=20 * size)
+    gone = LogHistory(1000, governor)
+    gone.extend([_event(100)] * 15)
+    del gone
+    kept = LogHistory(1000, governor)
+    kept.extend([_event(100)] * 15)
+    assert len(kept) == 15
+    assert governor.used == 15 * size
+
+
+def test_colour_runs_charge_what_they_take():
+    import tracemalloc
+    line = b'\x1b[32m' + b'x' * 30 + b'\x1b[0m ' + b'y' * 40 + b'\n'
+    events = [LogEvent(RX, i, line) for i in range(500)]
+    for event in events:
+        event.prepare()
+    history = LogHistory(500, HistoryGovernor())
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        history.extend(events)
+        measured = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert 0.75 * measured <= history.bytes <= 1.25 * measured
@@ -0,0 +1,75 @@
+import threading
+
+from serialtcp.client import SendQueue
+from serialtcp.latency import Histogram, RxLatency, STAGES
+
+
+def test_histogram_buckets_and_percentiles():
+    hist = Histogram()
+    assert hist.percentile(0.5) is None
+    for ns in [1000] * 98 + [1000000, 5000000]:
+        hist.record(ns)
+    assert hist.count == 100
+    assert hist.percentile(0.5) == 1024         # bucket upper bound
+    assert hist.percentile(0.99) == 1 << 20
+    assert hist.percentile(1.0) == 5000000      # capped at the real maximum
+    stats = hist.stats()
+    assert stats['max_us'] == 5000.0
+    assert stats['buckets'] == [[1.024, 98], [1048.576, 1], [8388.608, 1]]
+    hist.record(-5)                             # clock skew counts as 0
+    assert hist.counts[0] == 1
+
+
+def test_send_histograms_survive_their_clients():
+    latency = RxLatency()
+    latency.record(100, 200, 1200, 1300)
+    first, second = latency.client_histogram(), latency.client_histogram()
+    first.record(10)
+    second.record(20)
+    latency.release_client(first)
+    latency.release_client(first)              # second release is a no-op
+    stats = latency.stats()
+    assert set(stats) == set(STAGES)
+    assert stats['send']['count'] == 2
+    assert stats['log']['count'] == 1
+    assert stats['total']['max_us'] == 1.2
+
+
+def test_send_queue_records_wait_until_written():
+    queue = SendQueue()
+    queue.latency = Histogram()
+    queue.put(b'abc')
+    queue.put(b'def')                          # joins the same batch
+    assert queue.get() == b'abcdef'
+    queue.done()
+    assert queue.latency.count == 1
+    queue.done()                               # nothing new was taken
+    assert queue.latency.count == 1
+
+
+def test_send_to_from_several_threads_keeps_the_histogram_whole():
+    class Sink:
+        def send(self, view):
+            return len(view)
+
+    queue = SendQueue()
+    queue.latency = Histogram()
+    sink = Sink()
+    drained = []
+
+    def sender():
+        n = 0
+        for _ in range(2000):
+            queue.put(b'x')
+            with queue.cond:               # count the drains that will record
+                n += bool(len(queue))
+                queue.send_to(sink)
+        drained.append(n)
+
+    threads = [threading.Thread(target=sender) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert queue.latency.count == sum(drained)
+    assert sum(queue.latency.counts) == queue.latency.count
@@ -0,0 +1,137 @@
+import re
+import time
+from datetime import datetime
+
+import pytest
+
+from serialtcp.logwriter import LogWriter
+from serialtcp.logformat import HexRecordFormatter, TextRecordFormatter, TimestampCache
+
+
+def test_records_are_group_committed(tmp_path):
+    path = tmp_path / 'io.log'
+    writer = LogWriter(str(path), flush_interval=0.5)
+    for i in range(100):
+        assert writer.write('line {}\n'.format(i))
+    # nothing forces a commit yet: still queued, not on disk
+    assert writer.queue_depth == 100
+    assert path.read_text() == ''
+    assert writer.flush()
+    assert path.read_text() == ''.join('line {}\n'.format(i) for i in range(100))
+    stats = writer.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['flushes'] == 1
+    assert stats['last_flush_latency_s'] is not None
+    writer.close()
+
+
+def test_flush_interval_bounds_latency(tmp_path):
+    path = tmp_path / 'io.log'
+    writer = LogWriter(str(path), flush_interval=0.05)
+    writer.write('tick\n')
+    deadline = time.time() + 2
+    while path.read_text() != 'tick\n' and time.time() < deadline:
+        time.sleep(0.01)
+    assert path.read_text() == 'tick\n'
+    assert writer.stats()['max_flush_latency_s'] < 1
+    writer.close()
+
+
+def test_size_triggers_commit(tmp_path):
+    path = tmp_path / 'io.log'
+    writer = LogWriter(str(path), flush_interval=60, flush_bytes=100)
+    writer.write('x' * 150 + '\n')
+    deadline = time.time() + 2
+    while not path.read_text() and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(path.read_text()) == 151
+    writer.close()
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    writer = LogWriter(str(tmp_path / 'io.log'), flush_interval=60, flush_bytes=10 ** 6, max_queue=100)
+    assert writer.write('a' * 80)
+    assert not writer.write('b' * 80)
+    assert writer.stats()['dropped'] == 1
+    writer.close()
+
+
+def test_close_writes_and_fsyncs(tmp_path):
+    path = tmp_path / 'io.log'
+    writer = LogWriter(str(path), flush_interval=60, fsync_interval=10)
+    writer.write('last words\n')
+    writer.close()
+    assert path.read_text() == 'last words\n'
+    assert writer.fsyncs == 1
+    assert not writer.write('too late\n')
+
+
+def test_unwritable_path_raises(tmp_path):
+    with pytest.raises(OSError):
+        LogWriter(str(tmp_path / 'missing' / 'io.log'))
+
+
+def _legacy_hex_entry(direction, t, data):
+    ts = datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    hex_part = ' '.join('{:02x}'.format(b) for b in data)
+    ascii_part = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data)
+    return '[{}] {} {}: {} | {}\n'.format(ts, direction, len(data), hex_part, ascii_part)
+
+
+def test_hex_formatter_matches_per_byte_format():
+    t = 1700000000.0     # offsets below are exact binary fractions
+    records = [('RX', t, bytes(range(256))), ('TX', t + 0.25, b''),
+               ('RX', t + 0.625, b'ab\r\n'), ('TX', t + 2.5, b'\xff\x00 ~')]
+    expected = ''.join(_legacy_hex_entry(*r) for r in records)
+    assert HexRecordFormatter()(records) == expected
+
+
+def test_timestamp_cache_per_millisecond():
+    ts = TimestampCache('%H:%M:%S', ':{:03d}')
+    t = 1700000000.1234
+    first = ts(t)
+    assert first.endswith(':123')
+    assert ts(t + 0.0005) is first          # same millisecond: cached text
+    assert ts(t + 0.001).endswith(':124')
+    assert ts(t + 1).endswith(':123') and ts(t + 1) != first
+
+
+def test_writer_formats_records_in_batches(tmp_path):
+    path = tmp_path / 'io.log'
+    batches = []
+
+    def formatter(records):
+        batches.append(len(records))
+        return TextRecordFormatter()(records)
+
+    writer = LogWriter(str(path), flush_interval=60, formatter=formatter)
+    t = time.time()
+    for i in range(10):
+        writer.write((t, 'line {}'.format(i)), 32)
+    writer.close()
+    assert batches == [10]
+    lines = path.read_text().splitlines()
+    assert len(lines) == 10
+    assert re.match(r'\[\d{2}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}:\d{3}\] line 0$', lines[0])
+
+
+def test_failed_batch_is_cut_off(tmp_path):
+    path = tmp_path / 'cut.log'
+    commits = []
+    writer = LogWriter(str(path), flush_interval=60, on_commit=lambda: commits.append(1))
+    writer.write('ok\n')
+    writer.flush()
+
+    def fail(records):
+        writer._fh.write(''.join(records))
+        raise OSError('disk full')
+
+    writer.formatter = fail
+    writer.write('partial\n')
+    writer.flush()
+    writer.formatter = None
+    writer.write('again\n')
+    writer.close()
+    assert path.read_text() == 'ok\nagain\n'
+    assert writer.stats()['dropped'] == 1
+    assert commits == [1, 1]
@@ -0,0 +1,147 @@
+from unittest import TestCase
+from unittest.mock import Mock
+import socket
+import threading
+import time
+
+from serialtcp.event_loop import EventLoop
+from serialtcp.loop_server import LoopServer
+from serialtcp.server import create_server, SerialServer
+
+
+def _free_tcp_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestEventLoop(TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.loop.start()
+
+    def tearDown(self):
+        self.loop.stop()
+
+    def test_inline_change_does_not_overtake_queued_ones(self):
+        a_r, a_w = socket.socketpair()
+        b_r, b_w = socket.socketpair()
+        started = threading.Event()
+        queued = threading.Event()
+        done = threading.Event()
+
+        def on_a():
+            a_r.recv(64)
+            started.set()
+            queued.wait(2)                   # another thread adds b meanwhile
+            self.loop.remove_reader(b_r)     # inline, but queued after the add
+            done.set()
+
+        self.loop.add_reader(a_r, on_a)
+        a_w.send(b'x')
+        self.assertTrue(started.wait(2))
+        self.loop.add_reader(b_r, lambda: None)
+        queued.set()
+        self.assertTrue(done.wait(2))
+        watched = self.loop.call_sync(lambda: b_r in self.loop._selector.get_map())
+        self.assertFalse(watched)
+        for sock in (a_r, a_w, b_r, b_w):
+            sock.close()
+
+
+class TestLoopServer(TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.loop.start()
+
+    def tearDown(self):
+        self.loop.stop()
+
+    def _server(self, **kwargs):
+        server = LoopServer(_free_tcp_port(), host='127.0.0.1', loop=self.loop, **kwargs)
+        server.run()
+        server.ready.wait(2)
+        return server
+
+    def test_create_server_engines(self):
+        self.assertIsInstance(create_server(1234), SerialServer)
+        self.assertIsInstance(create_server(1234, engine='selector', loop=self.loop), LoopServer)
+        with self.assertRaises(ValueError):
+            create_server(1234, engine='fibers')
+
+    def test_two_clients_one_thread(self):
+        on_connect = Mock()
+        on_disconnect = Mock()
+        server = self._server(on_client_connect=on_connect, on_client_disconnect=on_disconnect)
+
+        client1 = socket.create_connection(('127.0.0.1', server.port))
+        client2 = socket.create_connection(('127.0.0.1', server.port))
+        self.assertTrue(_wait(lambda: len(server.clients) == 2))
+        self.assertTrue(_wait(lambda: on_connect.call_count == 2))
+        # no per-client threads: everything runs on the shared loop
+        self.assertTrue(all(c.thread is None for c in server.get_clients()))
+
+        client1.close()
+        self.assertTrue(_wait(lambda: len(server.clients) == 1))
+        self.assertEqual(1, on_disconnect.call_count)
+
+        server.stop()
+        client2.close()
+        self.assertEqual(0, len(server.clients))
+
+    def test_receive_and_send_to_all(self):
+        on_recv = Mock()
+        server = self._server(on_tcp_receive=on_recv)
+
+        client = socket.create_connection(('127.0.0.1', server.port))
+        client.settimeout(5)
+        self.assertTrue(_wait(lambda: len(server.clients) == 1))
+
+        client.sendall(b'test')
+        self.assertTrue(_wait(lambda: on_recv.called))
+        on_recv.assert_called_once_with(b'test')
+
+        server.send_to_all(b'hello')
+        self.assertEqual(b'hello', client.recv(64))
+
+        server.stop()
+        client.close()
+
+    def test_send_backlog_is_flushed_in_order(self):
+        server = self._server()
+        # Small socket buffers on both ends keep most of the payload in the
+        # server's send queue. The receive buffer is set before connect:
+        # shrinking it afterwards makes loopback TCP crawl.
+        client = socket.socket()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.connect(('127.0.0.1', server.port))
+        self.assertTrue(_wait(lambda: len(server.clients) == 1))
+        peer = next(iter(server.clients))
+        peer.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+        payload = bytes(range(256)) * 768    # 192 KiB: fits the send queue, not the sockets
+        server.send_to_all(payload)          # returns without waiting for the reader
+        self.assertGreater(len(peer.queue), 64 * 1024)
+
+        received = bytearray()
+        client.settimeout(5)
+        while len(received) < len(payload):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            received += chunk
+        self.assertEqual(payload, bytes(received))
+
+        server.stop()
+        client.close()
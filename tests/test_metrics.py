@@ -0,0 +1,87 @@
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from serialtcp.latency import RxLatency
+from serialtcp.metrics import MetricsCache, MetricsServer, render
+from serialtcp.service import PortConfig, PortService
+
+
+def _service(**state):
+    service = PortService(PortConfig(device='/dev/ttyUSB0', tcp_port=5000, name='rack "A"'))
+    for key, value in state.items():
+        setattr(service, key, value)
+    return service
+
+
+def test_render_counters_and_labels():
+    text = render([_service(rx_total=10, tx_total=3)])
+    labels = '{tcp_port="5000",device="/dev/ttyUSB0",name="rack \\"A\\""}'
+    assert 'serialtcp_rx_bytes_total' + labels + ' 10' in text
+    assert 'serialtcp_tx_bytes_total' + labels + ' 3' in text
+    assert 'serialtcp_status' + labels[:-1] + ',state="stopped"} 1' in text
+    assert 'serialtcp_status' + labels[:-1] + ',state="running"} 0' in text
+    assert '# TYPE serialtcp_clients gauge' in text
+    assert 'writer' not in text            # no log or capture file
+    assert 'rx_latency' not in text        # latency_stats off
+    assert text.endswith('\n')
+
+
+def test_render_latency_histogram():
+    latency = RxLatency()
+    for ns in (900, 1500, 3000000):
+        latency.record(0, 0, 0, ns)
+    service = _service()
+    service.latency_stats = latency.stats
+    lines = [l for l in render([service]).splitlines() if 'stage="total"' in l]
+    buckets = {l.split('le="')[1].split('"')[0]: int(l.rsplit(' ', 1)[1])
+               for l in lines if '_bucket' in l}
+    assert buckets['1.024e-06'] == 1
+    assert buckets['2.048e-06'] == 2
+    assert buckets['0.004194304'] == 3
+    assert buckets['+Inf'] == 3
+    assert any(l.startswith('serialtcp_rx_latency_seconds_count') and l.endswith(' 3') for l in lines)
+
+
+def test_render_console_stats_without_labels():
+    console = {'lag_s': 0.25, 'max_lag_s': 1.5, 'rendered_lines': 900, 'skipped_lines': 40}
+    text = render([_service()], console)
+    assert 'serialtcp_console_lag_seconds 0.25\n' in text
+    assert 'serialtcp_console_lag_seconds_max 1.5\n' in text
+    assert 'serialtcp_console_skipped_lines_total 40\n' in text
+    assert 'serialtcp_console' not in render([_service()])
+
+
+def test_cache_serves_the_snapshot_between_refreshes():
+    services = [_service(rx_total=1)]
+    cache = MetricsCache(lambda: services, interval=60)
+    try:
+        assert ' 1\n' in cache.text()
+        services[0].rx_total = 2
+        assert cache.text().count('serialtcp_rx_bytes_total{') == 1
+        assert 'serialtcp_rx_bytes_total{tcp_port="5000",device="/dev/ttyUSB0",name="rack \\"A\\""} 1' \
+            in cache.text()
+    finally:
+        cache.close()
+
+
+def test_render_failure_keeps_the_last_text():
+    broken = SimpleNamespace(config=None)
+    cache = MetricsCache(lambda: [broken], interval=60)
+    assert cache.text() == ''
+    cache.close()
+
+
+def test_metrics_server():
+    server = MetricsServer(MetricsCache(lambda: [_service(rx_total=7)]), 0)
+    try:
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        url = 'http://127.0.0.1:{}/'.format(server.port)
+        with opener.open(url + 'metrics', timeout=5) as resp:
+            assert resp.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert b'serialtcp_rx_bytes_total' in resp.read()
+        with pytest.raises(urllib.error.HTTPError):
+            opener.open(url + 'other', timeout=5)
+    finally:
+        server.close()
@@ -0,0 +1,102 @@
+"""Tests for the char_delay pacer. The schedule is checked against a fake
+clock, so the deadlines are exact whatever the machine's load."""
+import time
+
+import pytest
+
+from serialtcp.pacing import Pacer, sleep_until, SPIN_THRESHOLD
+
+
+class FakeClock:
+    """perf_counter/sleep stand-in: sleeping advances the time, and a zero
+    sleep (one spin of the busy-wait) advances it by ``spin``."""
+
+    def __init__(self, spin=0.00001):
+        self.now = 1000.0
+        self.spin = spin
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds or self.spin
+
+
+def test_sleep_until_does_not_return_early():
+    deadline = time.perf_counter() + 0.005
+    sleep_until(deadline)
+    assert time.perf_counter() >= deadline
+
+
+def test_sleep_until_sleeps_then_spins():
+    clock = FakeClock()
+    sleep_until(clock.now + 0.01, clock, clock.sleep)
+    assert clock.sleeps[0] == pytest.approx(0.01 - SPIN_THRESHOLD)
+    assert set(clock.sleeps[1:]) == {0}          # the last stretch is spun
+    assert clock.now >= 1000.01
+
+
+def test_pacer_holds_requested_rate():
+    clock = FakeClock()
+    pacer = Pacer(0.0005, clock=clock, sleep=clock.sleep)
+    start = clock.now
+    released = []
+    for _ in range(200):
+        pacer.wait()
+        released.append(clock.now)
+    # Character i goes out at its deadline start + i * interval, never before
+    # it and at most one spin after it: the schedule does not drift.
+    for i, at in enumerate(released):
+        deadline = start + i * 0.0005
+        assert deadline - 1e-9 <= at <= deadline + clock.spin + 1e-9
+    assert pacer._next == pytest.approx(start + 200 * 0.0005)
+    assert pacer.samples == 199
+    assert pacer.achieved_min <= pacer.achieved_mean <= pacer.achieved_max
+    assert pacer.achieved_mean == pytest.approx(0.0005, abs=clock.spin)
+
+
+def test_pacer_late_character_shortens_the_next_gap():
+    clock = FakeClock()
+    pacer = Pacer(0.001, clock=clock, sleep=clock.sleep)
+    start = clock.now
+    pacer.wait()
+    pacer.wait()
+    clock.now += 0.0015                         # the write ran 0.5 ms late
+    sleeps = len(clock.sleeps)
+    pacer.wait()                                # goes at once ...
+    assert len(clock.sleeps) == sleeps
+    assert pacer._next == pytest.approx(start + 0.003)   # ... on the old schedule
+
+
+def test_pacer_restarts_schedule_after_idle_gap():
+    clock = FakeClock()
+    pacer = Pacer(0.001, clock=clock, sleep=clock.sleep)
+    pacer.wait()
+    clock.now += 0.02
+    pacer.wait()    # idle: no catch-up burst, no waiting either
+    assert clock.sleeps == []
+    assert pacer._next == clock.now + 0.001
+    assert pacer.samples == 0
+
+
+def test_pacer_burst_size():
+    assert Pacer(0.0001).burst == 1
+    assert Pacer(0.0001, burst=True).burst == 10
+    assert Pacer(0.002, burst=True).burst == 1   # already slower than a burst period
+    stats = Pacer(0.0001, burst=True).stats()
+    assert stats['requested_s'] == 0.0001
+    assert stats['achieved_mean_s'] is None
+    assert stats['burst'] == 10
+
+
+def test_pacer_burst_keeps_average_rate():
+    clock = FakeClock()
+    pacer = Pacer(0.0001, burst=True, clock=clock, sleep=clock.sleep)
+    start = clock.now
+    for _ in range(50):
+        pacer.wait(pacer.burst)
+    assert pacer._next == pytest.approx(start + 50 * pacer.burst * 0.0001)
+    assert clock.now >= start + 49 * pacer.burst * 0.0001
+    assert pacer.achieved_mean == pytest.approx(0.0001, abs=clock.spin)
@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from serialtcp.capture import CaptureWriter, DIR_RX, DIR_TX
+from serialtcp.logformat import HexRecordFormatter
+from serialtcp.replay import Replayer, VirtualDevice, read_chunks
+
+
+def test_reads_rx_of_a_capture(tmp_path):
+    path = str(tmp_path / 'session.cap')
+    writer = CaptureWriter(path)
+    writer.record(DIR_RX, b'login: ')
+    writer.record(DIR_TX, b'root\r', client=1)
+    writer.record(DIR_RX, b'# ')
+    writer.close()
+    chunks = list(read_chunks(path))
+    assert [data for _ts, data in chunks] == [b'login: ', b'# ']
+    assert chunks[0][0] <= chunks[1][0]
+
+
+def test_reads_rx_of_a_text_log(tmp_path):
+    path = tmp_path / 'session.log'
+    path.write_text(HexRecordFormatter()([
+        ('RX', 1700000000.25, b'a|b\r\n'),
+        ('TX', 1700000000.5, b'x'),
+        ('RX', 1700000001.0, b''),
+        ('RX', 1700000001.5, bytes(range(256))),
+    ]) + 'not a record\n')
+    chunks = list(read_chunks(str(path)))
+    assert [data for _ts, data in chunks] == [b'a|b\r\n', b'', bytes(range(256))]
+    assert [ts - chunks[0][0] for ts, _data in chunks] == [0.0, 0.75, 1.25]
+
+
+def test_replay_keeps_the_recorded_gaps():
+    written = []
+    replayer = Replayer(lambda data: written.append((time.perf_counter(), data)), speed=2.0)
+    replayer.play([(10.0, b'a'), (10.1, b'b'), (10.3, b'c')])
+    assert [data for _t, data in written] == [b'a', b'b', b'c']
+    assert written[2][0] - written[0][0] == pytest.approx(0.15, abs=0.02)
+    assert replayer.stats()['bytes'] == 3
+
+    fast = Replayer(lambda data: None, speed=0)
+    started = time.perf_counter()
+    fast.play([(0, b'a'), (100, b'b')])
+    assert time.perf_counter() - started < 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='requires os.openpty')
+def test_virtual_device(tmp_path):
+    link = str(tmp_path / 'ttyREPLAY')
+    with VirtualDevice(link) as device:
+        assert device.device == link
+        fd = os.open(link, os.O_RDWR | os.O_NOCTTY)
+        try:
+            Replayer(device.write, speed=0).play([(0, b'boot\r\n'), (1, b'\xff\x00')])
+            received = b''
+            while len(received) < 8:
+                received += os.read(fd, 64)
+            assert received == b'boot\r\n\xff\x00'
+            os.write(fd, b'cmd')
+            deadline = time.time() + 5
+            while device.tx_bytes < 3 and time.time() < deadline:
+                time.sleep(0.02)
+            assert device.tx_bytes == 3
+        finally:
+            os.close(fd)
+    assert not os.path.lexists(link)
@@ -1,8 +1,9 @@
 from unittest import TestCase
 import logging
 import socket
-from time import sleep
-from serialtcp.client import SerialClient
+import threading
+from time import sleep, monotonic
+from serialtcp.client import SerialClient, SendQueue
 logging.basicConfig(level=logging.DEBUG)
 
 
@@ -35,4 +36,151 @@ class TestSerialClient(TestCase):
         self.assertEqual(len(clients), 0)
 
 
+    def test_zero_copy_receive(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        peer = socket.create_connection(listener.getsockname())
+        sock, address = listener.accept()
+        listener.close()
+        received = []
 
+        def on_received(data):
+            received.append((type(data), bytes(data)))   # copy: the view is reused
+
+        client = SerialClient(sock, address, on_received=on_received,
+                              recv_buffer=64, zero_copy=True)
+        client.start()
+        peer.sendall(b'ls\r')
+        for _ in range(100):
+            if received:
+                break
+            sleep(0.01)
+        peer.sendall(b'\x1b[A\r')
+        self.assertEqual(b'ls\r', peer.recv(64))         # up-arrow resends history
+        self.assertEqual((memoryview, b'ls\r'), received[0])
+        client.stop()
+        peer.close()
+
+class TestSendQueue(TestCase):
+    def test_drop_oldest(self):
+        queue = SendQueue(8, 'drop_oldest')
+        self.assertTrue(queue.put(b'abcdef'))
+        self.assertTrue(queue.put(b'ghij'))
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual(b'cdefghij', queue.get(0))
+
+    def test_drop_oldest_oversized_chunk(self):
+        queue = SendQueue(4, 'drop_oldest')
+        queue.put(b'ab')
+        queue.put(b'0123456789')
+        self.assertEqual(8, queue.dropped)
+        self.assertEqual(b'6789', queue.get(0))
+
+    def test_disconnect(self):
+        queue = SendQueue(4, 'disconnect')
+        self.assertTrue(queue.put(b'abcd'))
+        self.assertFalse(queue.put(b'e'))
+        self.assertEqual(1, queue.dropped)
+
+    def test_default_policy_is_drop_oldest(self):
+        self.assertEqual('drop_oldest', SendQueue().policy)
+
+    def test_block_grows_without_blocking_when_asked(self):
+        queue = SendQueue(4, 'block')
+        queue.put(b'abcd')
+        self.assertTrue(queue.put(b'x', block=False))   # grows instead of waiting
+        self.assertEqual(5, len(queue))
+        queue.close()
+        self.assertTrue(queue.put(b'y'))               # closed: silently ignored
+        self.assertEqual(0, len(queue))
+
+    def test_block_waits_for_writer(self):
+        queue = SendQueue(4, 'block', block_timeout=5)
+        queue.put(b'abcd')
+        drain = threading.Timer(0.2, queue.get, args=(0,))
+        drain.start()
+        start = monotonic()
+        self.assertTrue(queue.put(b'ef'))
+        self.assertGreaterEqual(monotonic() - start, 0.15)
+        self.assertEqual(b'ef', queue.get(0))
+        drain.join()
+
+    def test_block_gives_up_after_its_timeout(self):
+        queue = SendQueue(4, 'block', block_timeout=0.2)
+        queue.put(b'abcd')
+        start = monotonic()
+        self.assertFalse(queue.put(b'ef'))              # writer never drains
+        self.assertLess(monotonic() - start, 2)
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual(b'abcd', queue.get(0))
+
+    def test_slow_client_does_not_block_sender(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        peer = socket.create_connection(listener.getsockname())
+        server, address = listener.accept()
+        listener.close()
+        client = SerialClient(server, address, send_queue=1024, slow_client='drop_oldest')
+        client.start()
+        for _ in range(1000):
+            client.send(b'x' * 1024)   # peer never reads
+        self.assertGreater(client.dropped_bytes, 0)
+        client.stop()
+        peer.close()
+
+    def test_peer_that_never_reads_does_not_stall_sender_by_default(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        peer = socket.create_connection(listener.getsockname())
+        server, address = listener.accept()
+        listener.close()
+        client = SerialClient(server, address)
+        client.start()
+        start = monotonic()
+        for _ in range(4096):
+            client.send(b'x' * 1024)   # 4 MiB, far past queue and socket buffers
+        self.assertLess(monotonic() - start, 2)
+        self.assertGreater(client.dropped_bytes, 0)
+        self.assertLessEqual(client.queued_bytes, client.queue.limit)
+        client.stop()
+        peer.close()
+
+    def test_reader_stalling_past_socket_timeout_loses_nothing(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        peer = socket.socket()
+        peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)   # before connect
+        peer.connect(listener.getsockname())
+        server, address = listener.accept()
+        listener.close()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        client = SerialClient(server, address, send_queue=1024 * 1024)
+        client.socket.settimeout(0.1)
+        client.start()
+        payload = bytes(range(256)) * 1024               # far past both socket buffers
+        client.send(payload)
+        sleep(0.5)                                       # several send timeouts
+        received = bytearray()
+        peer.settimeout(2)
+        while len(received) < len(payload):
+            chunk = peer.recv(65536)
+            if not chunk:
+                break
+            received += chunk
+        self.assertEqual(payload, bytes(received))
+        self.assertEqual(0, client.dropped_bytes)
+        self.assertEqual(0, client.err_cnt)
+        self.assertTrue(client.thread.is_alive())
+        client.stop()
+        peer.close()
+
+    def test_requeue_keeps_order_and_trims_oldest(self):
+        queue = SendQueue(8, 'drop_oldest')
+        queue.put(b'abcdef')
+        self.assertEqual(b'abcdef', queue.get(0))
+        queue.put(b'ghij')
+        queue.requeue(b'def')                            # unsent tail of the batch
+        self.assertEqual(b'defghij', queue.get(0))
+        self.assertEqual(0, queue.dropped)
+        queue.put(b'abcdef')
+        queue.get(0)
+        queue.put(b'ghijkl')
+        queue.requeue(b'abcdef')
+        self.assertEqual(4, queue.dropped)
+        self.assertEqual(b'efghijkl', queue.get(0))
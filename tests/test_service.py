@@ -191,3 +191,373 @@ def test_send_to_serial(pty_device):
         client.close()
     finally:
         service.stop()
+
+
+def test_send_to_serial_never_waits_for_a_stalled_device(pty_device):
+    """A full TX queue drops console input instead of blocking the GUI thread."""
+    from serialtcp.serial_port import DEFAULT_TX_QUEUE
+    _master_fd, _slave_fd, device = pty_device
+    service = PortService(PortConfig(device=device, tcp_port=_free_tcp_port()))
+    service.start()
+    release = threading.Event()
+    try:
+        service.connect_local()
+        assert _wait(lambda: service.serial_connected)
+        service._serial.serial.write = lambda data: release.wait(10)   # stalled device
+        chunk = b'x' * 4096
+        start = time.monotonic()
+        for _ in range(2 * DEFAULT_TX_QUEUE // len(chunk)):
+            service.send_to_serial(chunk)
+        assert time.monotonic() - start < 1
+        assert service.tx_total <= DEFAULT_TX_QUEUE + len(chunk)
+        texts = [ev.text for ev in service.history.read_since(0)[0]]
+        assert any('input dropped' in text for text in texts)
+    finally:
+        release.set()
+        service.stop()
+
+
+def test_roundtrip_selector_engine(pty_device):
+    """The selector engine serves clients and the serial fd from one loop."""
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(), engine='selector')
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        assert _wait(lambda: service.serial_connected), 'serial did not open'
+        assert _wait(lambda: service.client_count == 1)
+        assert service._serial.receive_thread is None   # read by the loop
+
+        os.write(master_fd, b'hello from device\n')
+        assert client.recv(64) == b'hello from device\n'
+
+        client.sendall(b'ping\n')
+        assert _wait(lambda: os.read(master_fd, 64) == b'ping\n')
+
+        client.close()
+        assert _wait(lambda: service.client_count == 0)
+        assert _wait(lambda: not service.serial_connected)
+    finally:
+        service.stop()
+
+
+def test_zero_copy_rx_reaches_serial(pty_device):
+    """memoryviews from the recv_into path are written out intact."""
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(),
+                     zero_copy_rx=True, recv_buffer=4096)
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        assert _wait(lambda: service.serial_connected), 'serial did not open'
+        client.sendall(b'zero copy\n')
+        assert _wait(lambda: os.read(master_fd, 64) == b'zero copy\n')
+        assert _wait(lambda: service.tx_total == len(b'zero copy\n'))
+        client.close()
+    finally:
+        service.stop()
+
+
+@pytest.mark.parametrize('engine', ['threads', 'selector'])
+def test_poll_serial_reader(pty_device, engine):
+    """The poll()/readv() reader delivers device output and notices close."""
+    from serialtcp.serial_port import POLL_SUPPORTED
+    if not POLL_SUPPORTED:
+        pytest.skip('poll reader not supported on this platform')
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(),
+                     serial_reader='poll', engine=engine)
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        assert _wait(lambda: service.serial_connected), 'serial did not open'
+
+        os.write(master_fd, b'x' * 5000 + b'\n')
+        received = b''
+        while len(received) < 5001:
+            received += client.recv(8192)
+        assert received == b'x' * 5000 + b'\n'
+        assert service._serial.reader == 'poll'
+
+        client.close()
+        assert _wait(lambda: not service.serial_connected)
+    finally:
+        service.stop()
+
+
+def test_serial_tx_writer_coalesces(pty_device):
+    """send() returns at once; queued chunks reach the device in fewer writes."""
+    from serialtcp.serial_port import SerialPort
+    master_fd, _slave_fd, device = pty_device
+    port = SerialPort(device, baudrate=115200)
+    port.open()
+    try:
+        assert port.is_connected
+        writes = []
+        real_write = port.serial.write
+
+        def slow_write(data):
+            writes.append(bytes(data))
+            time.sleep(0.05)          # let the next sends pile up
+            return real_write(data)
+
+        port.serial.write = slow_write
+        start = time.monotonic()
+        for i in range(50):
+            port.send(b'%02d' % i)
+        assert time.monotonic() - start < 0.5      # callers never wait on the device
+        assert port.flush(5)
+
+        received = b''
+        while len(received) < 100:
+            received += os.read(master_fd, 256)
+        assert received == b''.join(b'%02d' % i for i in range(50))
+        assert len(writes) < 50
+    finally:
+        port.close()
+    assert not port.tx_thread.is_alive()
+
+
+def test_wait_echo_window(pty_device):
+    """Echoes are matched against the sent stream; missing ones time out."""
+    from serialtcp.serial_port import SerialPort
+    master_fd, _slave_fd, device = pty_device
+    stop = threading.Event()
+
+    def echo_device():
+        while not stop.is_set():
+            try:
+                data = os.read(master_fd, 64)
+            except OSError:
+                return
+            os.write(master_fd, data.replace(b'z', b'?'))   # garble every 'z'
+
+    echo = threading.Thread(target=echo_device, daemon=True)
+    echo.start()
+    port = SerialPort(device, baudrate=115200, wait_echo=0.2, echo_window=4)
+    port.open()
+    try:
+        port.send(b'hello')
+        assert port.flush(5)
+        assert port.echo_matched == 5
+        assert port.echo_mismatches == 0 and port.echo_timeouts == 0
+
+        port.send(b'z')
+        assert port.flush(5)
+        assert port.echo_mismatches == 1
+        assert port.echo_timeouts == 1
+    finally:
+        stop.set()
+        port.close()
+
+
+def test_wait_echo_resyncs_after_lost_echo(pty_device):
+    """A lost echo byte is skipped over, not waited out for every later byte."""
+    from serialtcp.serial_port import SerialPort
+    master_fd, _slave_fd, device = pty_device
+    stop = threading.Event()
+
+    def echo_device():
+        while not stop.is_set():
+            try:
+                data = os.read(master_fd, 64)
+            except OSError:
+                return
+            os.write(master_fd, data.replace(b'b', b''))    # lose every 'b'
+
+    echo = threading.Thread(target=echo_device, daemon=True)
+    echo.start()
+    port = SerialPort(device, baudrate=115200, wait_echo=2, echo_window=4)
+    port.open()
+    try:
+        port.send(b'abcdefgh')
+        start = time.monotonic()
+        assert port.flush(5)
+        assert time.monotonic() - start < 1       # nothing waited out a timeout
+        assert port.echo_matched == 7
+        assert port.echo_mismatches == 1 and port.echo_timeouts == 0
+    finally:
+        stop.set()
+        port.close()
+
+
+def test_headless_config_runs_every_mapping(tmp_path):
+    from serialtcp.tcp_server import load_port_configs, start_services
+
+    ptys = [os.openpty() for _ in range(2)]
+    busy = socket.socket()
+    busy.bind(('127.0.0.1', 0))
+    busy.listen(1)
+    ports = [_free_tcp_port(), _free_tcp_port(), busy.getsockname()[1]]
+    path = tmp_path / 'ports.yaml'
+    path.write_text(
+        'api:\n  enabled: false\n'
+        'ports:\n'
+        '  - {{device: {}, tcp_port: {}}}\n'
+        '  - {{device: {}, tcp_port: {}, engine: selector}}\n'
+        '  - {{device: /dev/null, tcp_port: {}}}\n'   # port in use: skipped
+        '  - {{name: incomplete}}\n'.format(
+            os.ttyname(ptys[0][1]), ports[0], os.ttyname(ptys[1][1]), ports[1], ports[2]))
+    configs = load_port_configs(str(path))
+    assert [c.tcp_port for c in configs] == ports
+
+    stop = threading.Event()
+    started = []
+    runner = threading.Thread(target=lambda: started.append(start_services(configs, stop=stop)))
+    runner.start()
+    try:
+        for (master_fd, _slave_fd), port in zip(ptys, ports):
+            client = None
+            deadline = time.time() + 5
+            while client is None and time.time() < deadline:
+                try:
+                    client = socket.create_connection(('127.0.0.1', port), timeout=5)
+                except ConnectionRefusedError:
+                    time.sleep(0.02)
+            assert client is not None, 'mapping on {} not listening'.format(port)
+            with client:
+                client.settimeout(5)
+                client.sendall(b'ping\n')
+                assert _wait(lambda: os.read(master_fd, 64) == b'ping\n')
+    finally:
+        stop.set()
+        runner.join(10)
+        busy.close()
+        for fds in ptys:
+            for fd in fds:
+                os.close(fd)
+    assert not runner.is_alive()
+    assert started == [2]
+
+
+def test_char_mode_strips_telnet_commands(pty_device):
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(), char_mode=True)
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        # the client is asked to go character-at-a-time
+        assert client.recv(64) == b'\xff\xfb\x01\xff\xfb\x03'
+        assert _wait(lambda: service.serial_connected)
+
+        # a negotiation split across two chunks never reaches the device
+        client.sendall(b'a\xff\xfd')
+        time.sleep(0.1)
+        client.sendall(b'\x01b\xff\xffc')
+        received = bytearray()
+        assert _wait(lambda: received.extend(os.read(master_fd, 64)) or bytes(received) == b'ab\xffc')
+        assert _wait(lambda: service.tx_total == 4)
+        client.close()
+    finally:
+        service.stop()
+
+
+def test_char_maps_applied_both_ways(pty_device):
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(), maps='ICRNL,OCRNLNL')
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        assert _wait(lambda: service.serial_connected)
+
+        os.write(master_fd, b'prompt\r')
+        assert client.recv(64) == b'prompt\n'
+
+        client.sendall(b'cmd\r')        # \r\n split over two reads
+        time.sleep(0.01)
+        client.sendall(b'\n')
+        received = bytearray()
+        assert _wait(lambda: received.extend(os.read(master_fd, 64)) or bytes(received) == b'cmd\n')
+        assert _wait(lambda: service.tx_total == 4)
+        client.close()
+    finally:
+        service.stop()
+
+
+def test_output_map_state_is_per_client(pty_device):
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(), maps='OCRNLNL')
+    service = PortService(cfg)
+    service.start()
+    try:
+        first = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        second = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        assert _wait(lambda: service.client_count == 2 and service.serial_connected)
+
+        first.sendall(b'a\r')           # held back: could start \r\n
+        assert _wait(lambda: service.tx_total == 1)
+        second.sendall(b'\nb')          # not the rest of the first client's \r\n
+        received = bytearray()
+        assert _wait(lambda: received.extend(os.read(master_fd, 64)) or len(received) >= 4)
+        assert bytes(received) == b'a\nb\r'
+        first.close()
+        second.close()
+    finally:
+        service.stop()
+
+
+def test_capture_file_records_both_directions(pty_device, tmp_path):
+    from serialtcp.capture import CaptureReader, DIR_RX, DIR_TX
+
+    master_fd, _slave_fd, device = pty_device
+    path = str(tmp_path / 'port.cap')
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(),
+                     maps='OCRNL', capture_file=path)
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        assert _wait(lambda: service.serial_connected)
+        client.sendall(b'cmd\r')
+        received = bytearray()
+        assert _wait(lambda: received.extend(os.read(master_fd, 64)) or bytes(received) == b'cmd\n')
+        os.write(master_fd, b'ok')
+        answer = bytearray()
+        assert _wait(lambda: answer.extend(client.recv(64)) or bytes(answer) == b'ok')
+        client.close()
+        assert service.capture_stats()['dropped'] == 0
+    finally:
+        service.stop()
+    assert service.capture_stats() is None
+
+    with CaptureReader(path) as reader:
+        records = [(r.direction, r.client, bytes(r.data)) for r in reader]
+    # TX as the client sent it, before the OCRNL map
+    assert records[0] == (DIR_TX, 1, b'cmd\r')
+    assert {r[:2] for r in records[1:]} == {(DIR_RX, 0)}
+    assert b''.join(r[2] for r in records[1:]) == b'ok'
+
+
+def test_latency_stats_cover_every_rx_stage(pty_device):
+    master_fd, _slave_fd, device = pty_device
+    cfg = PortConfig(device=device, tcp_port=_free_tcp_port(), latency_stats=True)
+    service = PortService(cfg)
+    service.start()
+    try:
+        client = socket.create_connection(('127.0.0.1', cfg.tcp_port), timeout=5)
+        client.settimeout(5)
+        assert _wait(lambda: service.serial_connected)
+        os.write(master_fd, b'hello\r\n')
+        received = bytearray()
+        assert _wait(lambda: received.extend(client.recv(64)) or bytes(received) == b'hello\r\n')
+        assert _wait(lambda: service.latency_stats()['send']['count'] >= 1)
+        stats = service.latency_stats()
+        assert stats['total']['count'] >= 1
+        assert stats['total']['max_us'] < 5000000
+        client.close()
+        # the closed client's send samples are kept
+        assert _wait(lambda: service.client_count == 0)
+        assert service.latency_stats()['send']['count'] >= 1
+    finally:
+        service.stop()
+    assert PortService(PortConfig(device=device, tcp_port=1)).latency_stats() is None
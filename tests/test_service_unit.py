@@ -1,9 +1,15 @@
 """Pty-free unit tests for the service line-splitting, file logging and the
-tkinter-free ANSI parser. These run on every platform (incl. Windows)."""
+tkinter-free ANSI parser and console runs. These run on every platform (incl.
+Windows)."""
 import re
+import time
+import pickle
 
-from serialtcp.service import PortConfig, PortService
+from serialtcp.service import PortConfig, PortService, EventBatcher
+from serialtcp.ansi import segment
+from serialtcp.history import LogEvent, KIND_IDS
 from serialtcp_gui.ansi import parse_ansi, clean
+from serialtcp_gui.console import Runs, ConsoleStats, add_event, add_skipped
 
 
 def _events(data, kind='rx'):
@@ -37,6 +43,39 @@ def test_line_split_buffers_partial():
     assert seen == ['hello', 'world']
 
 
+def test_line_split_keeps_utf8_split_across_reads():
+    seen = []
+    svc = PortService(PortConfig(device='X', tcp_port=1),
+                      on_event=lambda s, e: seen.append(e.text))
+    data = 'größe €\n'.encode('utf-8')
+    for i in range(len(data)):
+        svc._buffer_lines('rx', data[i:i + 1])
+    assert seen == ['größe €']
+
+
+def test_partial_line_cap_ends_on_a_character_boundary():
+    seen = []
+    svc = PortService(PortConfig(device='X', tcp_port=1),
+                      on_event=lambda s, e: seen.append((e.text, e.raw)))
+    euro = '€'.encode('utf-8')
+    svc._buffer_lines('rx', b'a' * 4096 + euro[:1])
+    svc._buffer_lines('rx', euro[1:] + b'\n')
+    assert seen == [('a' * 4096, b'a' * 4096), ('€', euro + b'\n')]
+    assert '�' not in ''.join(text for text, _ in seen)
+
+
+def test_partial_line_cap_holds_a_character_cut_over_several_reads():
+    seen = []
+    svc = PortService(PortConfig(device='X', tcp_port=1),
+                      on_event=lambda s, e: seen.append((e.text, e.raw)))
+    smiley = '😀'.encode('utf-8')                # four bytes
+    svc._buffer_lines('rx', b'a' * 4095 + smiley[:1])
+    svc._buffer_lines('rx', smiley[1:2])         # past the cap, still incomplete
+    svc._buffer_lines('rx', smiley[2:3])
+    svc._buffer_lines('rx', smiley[3:] + b'!\n')
+    assert seen == [('a' * 4095, b'a' * 4095), ('😀!', smiley + b'!\n')]
+
+
 def test_log_file_written_with_timestamps(tmp_path):
     path = tmp_path / 'serial.log'
     svc = PortService(PortConfig(device='X', tcp_port=1))
@@ -44,8 +83,10 @@ def test_log_file_written_with_timestamps(tmp_path):
     assert svc.start_logging(str(path)) is True
     assert svc.logging_to_file is True
     svc._buffer_lines('rx', b'hello device\n')
+    assert svc.log_stats()['dropped'] == 0
     svc.stop_logging()
     assert svc.logging_to_file is False
+    assert svc.log_stats() is None
 
     content = path.read_text(encoding='utf-8')
     assert 'hello device' in content
@@ -69,6 +110,104 @@ def test_parse_ansi_drops_non_colour_escapes():
     assert ''.join(chunk for chunk, _ in segs) == 'hello'
 
 
+def test_segment_plain_text_skips_the_parser():
+    assert segment('plain\x07 text') == (('plain text', None),)
+    assert segment('\x00') == ()
+    assert segment('\x1b[1;32mok\x1b[39m done\x1b[2K') == (('ok', 32), (' done', None))
+
+
+def test_service_segments_ansi_lines_when_logged():
+    svc = PortService(PortConfig(device='X', tcp_port=1))
+    svc._buffer_lines('rx', b'\x1b[31mred\x1b[0m ok\r\nplain\n')
+    svc._emit('status', '\x1b[33mnotice')
+    coloured, plain, notice = svc.snapshot_log()
+    assert coloured._segments == (('red', 31), (' ok', None))
+    assert plain._segments is None and plain.segments == (('plain', None),)
+    assert notice._segments == (('notice', 33),)
+    copy = pickle.loads(pickle.dumps(coloured))
+    assert copy._segments == coloured._segments
+
+
 def test_clean_strips_control_chars():
     assert clean('a\x07b\x00c\x08d') == 'abcd'
     assert clean('keep\ttab') == 'keep\ttab'
+
+
+def test_console_runs_merge_equal_styles():
+    runs = Runs()
+    for i in range(3):
+        add_event(runs, LogEvent(KIND_IDS['rx'], 0, b'line %d\n' % i), 'ascii', '#fff')
+    flat = runs.flat()
+    assert runs.lines == 3
+    assert flat[1::2] == ['ts', '#fff'] * 3
+    assert ''.join(flat[::2]).count('\n') == 3
+    assert flat[2] == 'line 0\n'
+
+
+def test_console_runs_colours_and_hex():
+    runs = Runs()
+    add_skipped(runs, 12)
+    add_event(runs, LogEvent(KIND_IDS['status'], 0, text='\x1b[31mred\x1b[0m ok'), 'hex16', '#fff')
+    add_event(runs, LogEvent(KIND_IDS['rx'], 0, bytes(range(20))), 'hex16', '#abc')
+    flat = runs.flat()
+    pairs = list(zip(flat[::2], flat[1::2]))
+    assert pairs[0][0].startswith('··· 12 lines skipped ···\n[')
+    assert pairs[1:3] == [('red', '#e06c75'), (' ok\n', '#fff')]
+    hex_rows = pairs[4][0] + pairs[5][0] + pairs[6][0]
+    assert hex_rows.startswith('00 01 02') and hex_rows.endswith('12 13\n')
+    assert pairs[5][1] == 'ts'          # continuation indent
+
+
+def test_console_stats_lag():
+    stats = ConsoleStats()
+    stats.record([LogEvent(KIND_IDS['rx'], time.monotonic_ns() - 2 * 10 ** 9, b'x\n')], skipped=5)
+    assert 1.9 < stats.lag_s < 5 and stats.max_lag_s == stats.lag_s
+    stats.record(())
+    assert stats.stats()['lag_s'] == 0 and stats.max_lag_s > 1.9
+    assert (stats.rendered, stats.skipped) == (1, 5)
+
+
+def test_event_batcher_delivers_on_size_and_age():
+    delivered = []
+    batch = EventBatcher(delivered.append, size=3, delay=60)
+    batch.extend([1, 2])
+    assert delivered == []
+    batch.add(3)
+    assert delivered == [[1, 2, 3]]
+    batch.add(4)
+    batch.flush()
+    assert delivered == [[1, 2, 3]]      # not due yet
+    batch.delay = 0
+    batch.flush()
+    assert delivered == [[1, 2, 3], [4]]
+    batch.flush(force=True)
+    assert delivered == [[1, 2, 3], [4]]  # nothing pending
+
+
+def test_service_feeds_its_event_batcher():
+    delivered = []
+    svc = PortService(PortConfig(device='X', tcp_port=1),
+                      events=EventBatcher(delivered.append, delay=0))
+    svc._buffer_lines('rx', b'one\ntwo\n')
+    assert [[e.text for e in batch] for batch in delivered] == [['one', 'two']]
+    assert [e.text for e in svc.snapshot_log()] == ['one', 'two']
+
+
+def test_log_event_decodes_text_on_first_read():
+    svc = PortService(PortConfig(device='X', tcp_port=1))
+    svc._buffer_lines('rx', 'größe\r\n'.encode('utf-8'))
+    ev, = svc.snapshot_log()
+    assert ev.kind == 'rx' and ev._text is None
+    assert ev.text == 'größe'
+    assert ev._text == 'größe'
+    assert re.fullmatch(r'\d{2}:\d{2}:\d{2}:\d{3}', ev.ts)
+    assert abs(ev.time - time.time()) < 5
+
+
+def test_log_event_pickles_compactly():
+    svc = PortService(PortConfig(device='X', tcp_port=1))
+    svc._buffer_lines('tx', b'ping\n')
+    svc._emit('status', 'stopped')
+    rx, status = [pickle.loads(pickle.dumps(ev)) for ev in svc.snapshot_log()]
+    assert (rx.kind, rx.raw, rx._text, rx.text) == ('tx', b'ping\n', None, 'ping')
+    assert (status.kind, status.raw, status.text) == ('status', None, 'stopped')
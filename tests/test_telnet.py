@@ -0,0 +1,49 @@
+from serialtcp.telnet import TelnetDecoder
+
+
+def _feed_all(chunks):
+    decoder = TelnetDecoder()
+    return b''.join(decoder.feed(chunk) for chunk in chunks), decoder
+
+
+def test_plain_chunk_returned_unchanged():
+    data = b'no commands here\r\n'
+    assert TelnetDecoder().feed(data) is data
+    view = memoryview(bytearray(b'abc'))
+    assert TelnetDecoder().feed(view) is view
+
+
+def test_negotiation_removed():
+    out, decoder = _feed_all([b'\xff\xfd\x01a\xff\xfb\x03b\xff\xfe\x22c\xff\xfc\x01'])
+    assert out == b'abc'
+    assert decoder.commands == 4
+
+
+def test_iac_iac_is_literal_ff():
+    out, _ = _feed_all([b'a\xff\xffb'])
+    assert out == b'a\xffb'
+
+
+def test_two_byte_commands_removed():
+    out, _ = _feed_all([b'a\xff\xf1b\xff\xf9c'])   # IAC NOP, IAC GA
+    assert out == b'abc'
+
+
+def test_subnegotiation_removed():
+    # IAC SB NAWS 0 80 0 24 IAC SE, with an escaped 0xFF inside
+    out, _ = _feed_all([b'x\xff\xfa\x1f\x00\x50\xff\xff\x18\xff\xf0y'])
+    assert out == b'xy'
+
+
+def test_sequences_split_across_chunks():
+    stream = b'ab\xff\xfb\x01cd\xff\xff\xff\xfa\x18\x00VT100\xff\xf0e\xff\xf1f'
+    for size in (1, 2, 3, 5):
+        chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        out, decoder = _feed_all(chunks)
+        assert out == b'abcd\xffef', size
+        assert decoder.commands == 3
+
+
+def test_memoryview_input():
+    data = memoryview(bytearray(b'1\xff\xfd\x032\xff\xff3'))
+    assert TelnetDecoder().feed(data) == b'12\xff3'
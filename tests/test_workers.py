@@ -0,0 +1,130 @@
+"""Integration tests for serialtcp.workers: PortServices in worker processes,
+driven through their parent-side proxies. Uses ptys as serial devices."""
+import os
+import time
+import socket
+import threading
+
+import pytest
+
+openpty = getattr(os, 'openpty', None)
+pytestmark = pytest.mark.skipif(openpty is None, reason='requires os.openpty')
+
+from serialtcp.service import PortConfig, STATUS_RUNNING, STATUS_STOPPED
+from serialtcp.workers import WorkerPool
+
+
+def _free_tcp_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def ptys():
+    pairs = [os.openpty() for _ in range(2)]
+    yield [(master, os.ttyname(slave)) for master, slave in pairs]
+    for fds in pairs:
+        for fd in fds:
+            os.close(fd)
+
+
+@pytest.fixture
+def pool():
+    events = []
+    lock = threading.Lock()
+
+    def on_event(service, ev):
+        with lock:
+            events.append((service, ev))
+
+    pool = WorkerPool(2, on_event=on_event, stats_interval=0.05)
+    pool.events = events
+    yield pool
+    pool.close()
+
+
+def test_services_spread_over_workers(pool, ptys):
+    proxies = [pool.create_service(PortConfig(device=device, tcp_port=_free_tcp_port()))
+               for _master, device in ptys]
+    assert {p.worker.index for p in proxies} == {0, 1}
+
+    for proxy in proxies:
+        proxy.start()
+        assert proxy.running and proxy.status == STATUS_RUNNING
+
+    for proxy, (master_fd, _device) in zip(proxies, ptys):
+        with socket.create_connection(('127.0.0.1', proxy.config.tcp_port), timeout=5) as client:
+            client.settimeout(5)
+            assert _wait(lambda: proxy.serial_connected and proxy.client_count == 1)
+            os.write(master_fd, b'hello\n')
+            assert client.recv(64) == b'hello\n'
+            client.sendall(b'ping\n')
+            assert _wait(lambda: os.read(master_fd, 64) == b'ping\n')
+            assert _wait(lambda: proxy.tx_total == 5 and proxy.rx_total == 6)
+
+    # LogEvents come back tagged with their proxy and land in its history
+    assert _wait(lambda: any(ev.kind == 'rx' and ev.text == 'hello' and s is proxies[1]
+                             for s, ev in list(pool.events)))
+    assert any(ev.kind == 'tx' for ev in proxies[0].snapshot_log())
+
+    for proxy in proxies:
+        proxy.stop()
+        assert proxy.status == STATUS_STOPPED
+
+
+def test_start_error_is_raised_in_parent(pool):
+    busy = socket.socket()
+    busy.bind(('127.0.0.1', 0))
+    busy.listen(1)
+    proxy = pool.create_service(PortConfig(device='/dev/null', tcp_port=busy.getsockname()[1]))
+    try:
+        with pytest.raises(OSError):
+            proxy.start()
+        assert not proxy.running
+    finally:
+        busy.close()
+
+
+def test_dead_worker_is_respawned(pool, ptys):
+    _master_fd, device = ptys[0]
+    proxy = pool.create_service(PortConfig(device=device, tcp_port=_free_tcp_port()))
+    proxy.start()
+    old = proxy.worker.process
+    old.kill()
+
+    assert _wait(lambda: proxy.worker.process is not old and proxy.running, timeout=15)
+    with socket.create_connection(('127.0.0.1', proxy.config.tcp_port), timeout=5):
+        assert _wait(lambda: proxy.client_count == 1)
+
+
+def test_worker_services_forward_events_without_a_history(ptys):
+    from serialtcp.history import NullHistory
+    from serialtcp.workers import _Worker
+
+    _master, device = ptys[0]
+    worker = _Worker(conn=None, stats_interval=1)
+    config = PortConfig(device=device, tcp_port=_free_tcp_port())
+    worker._dispatch(1, 'start', (config.to_dict(),))
+    service = worker.services[1]
+    try:
+        assert isinstance(service.history, NullHistory)
+        service.events.flush(force=True)
+        batches = []
+        while not worker.out.empty():
+            batches.append(worker.out.get_nowait())
+        assert any(kind == 'events' and batch for kind, _sid, batch in batches)
+        assert service.snapshot_log() == []
+    finally:
+        service.stop()